@@ -12,6 +12,7 @@
 
 #include "liquid.h"
 #include "labels.hh"
+#include "ready.hh"
 #include "afmodem.hh"
 #include "writer.hh"
 
@@ -227,6 +228,7 @@ int main (int argc, char **argv)
     if(!json.empty()){
         reporter = new labels(json.c_str(),"TXDL T","TXDL SG1","TXDL S1");
     }
+    notify_ready(chrono_time[2]+time_delay);
     real_source wrap_source = NULL;
     void* gen_peek = NULL;
     uint64_t wav_offset;
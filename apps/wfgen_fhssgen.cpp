@@ -12,6 +12,7 @@
 
 #include "liquid.h"
 #include "labels.hh"
+#include "ready.hh"
 #include "fskmodems.hh"
 #include "afmodem.hh"
 #include "noisemodem.hh"
@@ -574,6 +575,7 @@ int main (int argc, char **argv)
     }
     chrono_time[6] = chrono_time[2]-loop_time+0.5;                // 'prev' TX time
     double initial_start = chrono_time[6] + loop_time;
+    notify_ready(initial_start);
     uint64_t xfer_counter = 0;
     uint64_t xfer = 0,xfer_idx = 0;
     size_t xfer_len = 0;
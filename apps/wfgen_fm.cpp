@@ -12,6 +12,7 @@
 
 #include "liquid.h"
 #include "labels.hh"
+#include "ready.hh"
 #include "analog.hh"
 #include "writer.hh"
 
@@ -331,9 +332,11 @@ int main (int argc, char **argv)
     amgen am = amgen_create(1, 1.0, NULL, &rp); // all the paths that need to be generated
     fmgen fm = fmgen_create(mod_index,am); // fm modulate the am signal
 
-    usrp->set_time_now(uhd::time_spec_t(chrono_time[2]),uhd::usrp::multi_usrp::ALL_MBOARDS);
-    md.time_spec = uhd::time_spec_t(chrono_time[2]+time_delay);
     chrono_time[2] = get_time();
+    usrp->set_time_now(uhd::time_spec_t(chrono_time[2]),uhd::usrp::multi_usrp::ALL_MBOARDS);
+    // host time of the first sample, exactly what the burst is timed for
+    double tx_start = chrono_time[2]+time_delay;
+    md.time_spec = uhd::time_spec_t(tx_start);
 
     // // uint64_t samples; // assuming MONO for now
     // float *ptr;
@@ -385,6 +388,9 @@ int main (int argc, char **argv)
 
         // send the result to the USRP
         tx_stream->send(bufs, buf.size(), md);
+        // the timed first buffer is with the device now
+        if(md.start_of_burst)
+            notify_ready(tx_start);
         md.start_of_burst=false;
         md.has_time_spec=false;
         // wav_reader_advance(wav, n);
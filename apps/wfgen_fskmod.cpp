@@ -12,6 +12,7 @@
 #include "liquid.h"
 #include "fskmodems.hh"
 #include "labels.hh"
+#include "ready.hh"
 #include "writer.hh"
 
 #include <uhd/usrp/multi_usrp.hpp>
@@ -337,6 +338,7 @@ int main (int argc, char **argv)
     }
     double initial_start = chrono_time[2]+0.5;
     md.time_spec = uhd::time_spec_t(chrono_time[2]+0.5);
+    notify_ready(initial_start);
     uint64_t xfer_counter = 0;
     uint64_t xfer = 0;
     size_t xfer_len = 0;
@@ -6,11 +6,18 @@
 #include <stdlib.h>
 #include <complex>
 #include <csignal>
+#include <sstream>
+#include <string>
+#include <vector>
+#include <unistd.h>
+#include <poll.h>
+#include <cerrno>
 // #include <time.h>
 #include <uhd/usrp/multi_usrp.hpp>
 
 #include "liquid.h"
 #include "labels.hh"
+#include "ready.hh"
 #include "noisemodem.hh"
 #include "writer.hh"
 
@@ -26,6 +33,12 @@ void signal_interrupt_handler(int) {
     continue_running = false;
 }
 
+// session mode: end the current burst, but keep the radio for the next one
+static bool burst_running(true);
+void signal_burst_handler(int) {
+    burst_running = false;
+}
+
 double get_time(){
     return std::chrono::system_clock::now().time_since_epoch().count()*double(1e-9);
 }
@@ -55,12 +68,13 @@ int main (int argc, char **argv)
     modulation_scheme ms = LIQUID_MODEM_QPSK;
     noise_scheme ms_n = LIQUID_NOISE_AWGN;
     uint8_t dry_run = 0;
+    bool session = false;
 
     double duration = -1;
 
     int dopt;
     char *strend = NULL;
-    while ((dopt = getopt(argc,argv,"hf:r:g:a:M:B:b:d:j:W:C:z:")) != EOF) {
+    while ((dopt = getopt(argc,argv,"hf:r:g:a:M:B:b:d:j:W:C:z:S")) != EOF) {
         switch (dopt) {
         case 'h':
             printf("Usage of %s [options]\n",argv[0]);
@@ -68,6 +82,7 @@ int main (int argc, char **argv)
             printf("  [ -a <uhd_tx_args:%s> ] [ -M <modulation:%s> ] [ -B <bw_f:%.3f MHz> ]\n", uhd_tx_args.c_str(), modulation.c_str(), bw_f*1.0e-06);
             printf("  [ -b <bw_nr:%.3f NHz> ] [ -d <duration:%.3f s> ] [ -j <json:%s> ]\n", bw_nr, duration, json.c_str());
             printf("  [ -W <file_dump:%s> ] [ -C <cut_radio:%u> ] [ -z <dry_run:%u> ]\n", file_dump.c_str(), cut_radio, dry_run);
+            printf("  [ -S (session: after this burst, read more from stdin, one line of flags each) ]\n");
             printf(" available modulation schemes:\n");
             liquid_print_modulation_schemes();
             return 0;
@@ -91,6 +106,7 @@ int main (int argc, char **argv)
         case 'W': file_dump     .assign(optarg); break;
         case 'C': cut_radio   = strtoul(optarg, &strend, 10); break;
         case 'z': dry_run     = strtoul(optarg, &strend, 10); break;
+        case 'S': session     = true; break;
         default: exit(1);
         }
     }
@@ -129,6 +145,10 @@ int main (int argc, char **argv)
     }
     chrono_time[1] = get_time();
 
+    // before UHD init, a burst can be ended (or the program stopped) while the device comes up
+    std::signal(SIGINT, &signal_interrupt_handler);
+    std::signal(SIGUSR1, &signal_burst_handler);
+
     uhd::device_addr_t args(uhd_tx_args);
     uhd::usrp::multi_usrp::sptr usrp;
     if(!cut_radio){
@@ -171,184 +191,292 @@ int main (int argc, char **argv)
     // std::vector<fc32*> bufs(channel_nums.size(), &usrp_buffer.front());
     std::vector<fc32*> bufs(channel_nums.size(), (fc32*)iq_container->ptr);
 
-    // signal generator
-    bool noise_mode = false;
-    if (ms == LIQUID_MODEM_UNKNOWN){
-        noise_mode = true;
-        ms = LIQUID_MODEM_QPSK;
-    }
-    symstreamrcf gen = symstreamrcf_create_linear(
-        LIQUID_FIRFILT_ARKAISER, bw_nr, 12, 0.25f, ms);
-    symstreamrncf ngen = symstreamrncf_create_noise(
-        LIQUID_FIRFILT_ARKAISER, bw_nr, 12, 0.25f, ms_n);
-    if (noise_mode){
-        ms = LIQUID_MODEM_UNKNOWN;
-    }
-
-    md.start_of_burst = true;  // never SOB when continuous
-    md.end_of_burst   = false;  // 
-    md.has_time_spec  = true;  // set to false to send immediately
-
-    // gain cycle
-    if(!cut_radio) uhd_tx_rate = usrp->get_tx_rate(); // get actual rate
-    // unsigned long int num_samples_cycle = (unsigned long int) (gcycle * uhd_tx_rate);
-    // unsigned long int num_buffers_cycle = num_samples_cycle / buf_len;
-    // std::cout << num_samples_cycle << "," << num_buffers_cycle << std::endl;
-    // unsigned int buffer_counter=0;
-
-    std::signal(SIGINT, &signal_interrupt_handler);
     std::cout << "running (hit CTRL-C to stop)" << std::endl;
-    // fc32 * buf = usrp_buffer.data();
-    fc32 * buf = (fc32*)iq_container->ptr;
-    fc32 sym;
-    chrono_time[2] = get_time();
-    if(!cut_radio)
-        usrp->set_time_now(uhd::time_spec_t(chrono_time[2]),uhd::usrp::multi_usrp::ALL_MBOARDS);
-    
-    labels* reporter;
-    if(!json.empty()){
-        reporter = new labels(json.c_str(),"TXDL T","TXDL SG1","TXDL S1");
-        reporter->set_modulation(modulation);
-        reporter->eng_bw = bw_f;
+    // in a session the readiness fd stays open and every burst is reported on it
+    int ready_fd = session ? ready_fd_take() : -1;
+    std::string command_line(argv[0]);
+    for(int arg_idx = 1; arg_idx < argc; arg_idx++){
+        command_line += (std::string(" ") + std::string(argv[arg_idx]));
     }
-    double initial_start = chrono_time[2]+0.5;
-    md.time_spec = uhd::time_spec_t(chrono_time[2]+0.5);
-    uint64_t xfer_counter = 0;
-    uint64_t xfer = 0;
-    size_t xfer_len = 0;
-    float gain = 0.5f;
-    symstreamrcf_set_gain(gen, gain);
-    while (continue_running) {
-        // set the software gain
-        // float gain_dB = -grange*(0.5f - 0.5f*cosf(2*M_PI*(float)buffer_counter/(float)num_buffers_cycle));
-        //printf("%6u : gain=%8.3f\n", buffer_counter, gain_dB);
-        // buffer_counter = (buffer_counter+1) % num_buffers_cycle;
-        // float gain = 0.5f*powf(10.0f, gain_dB/20.0f);
-        if(ms != LIQUID_MODEM_UNKNOWN){
-            // symstreamrcf_set_gain(gen, gain);
-
-            // generate samples to buffer
-            symstreamrcf_write_samples(gen, buf, buf_len);
+
+    // stdin is polled rather than read blocking, so a SIGINT while idle still ends the session
+    std::string stdin_pending;
+    auto read_line = [&](std::string& line) -> bool {
+        for(;;){
+            size_t eol = stdin_pending.find('\n');
+            if(eol != std::string::npos){
+                line = stdin_pending.substr(0, eol);
+                stdin_pending.erase(0, eol+1);
+                return true;
+            }
+            if(!continue_running)
+                return false;
+            struct pollfd pfd = {STDIN_FILENO, POLLIN, 0};
+            int ready = poll(&pfd, 1, 100);
+            if(ready < 0 && errno != EINTR)
+                return false;
+            if(ready <= 0)
+                continue;
+            char chunk[4096];
+            ssize_t got = read(STDIN_FILENO, chunk, sizeof(chunk));
+            if(got < 0 && errno == EINTR)
+                continue;
+            if(got <= 0)
+                return false;
+            stdin_pending.append(chunk, got);
+        }
+    };
+
+    // next burst from stdin, same flags as the command line (device flags are ignored)
+    auto next_burst = [&]() -> bool {
+        std::string line;
+        if(!read_line(line) || line == "quit")
+            return false;
+        std::istringstream tokenizer(line);
+        std::vector<std::string> tokens{std::string(argv[0])};
+        std::string token;
+        while(tokenizer >> token)
+            tokens.push_back(token);
+        std::vector<char*> burst_argv;
+        for(auto& t : tokens)
+            burst_argv.push_back(&t[0]);
+        burst_argv.push_back(NULL);
+
+        double next_bw_nr = -1, next_bw_f = -1;
+        json.assign("");
+        duration = -1;
+        optind = 0; // full reset, this is a new argv
+        while ((dopt = getopt((int)tokens.size(),burst_argv.data(),"f:r:g:a:M:B:b:d:j:W:C:z:")) != EOF) {
+            switch (dopt) {
+            case 'f': uhd_tx_freq =  strtod(optarg, &strend); break;
+            case 'r': uhd_tx_rate =  strtod(optarg, &strend); break;
+            case 'g': uhd_tx_gain =  strtod(optarg, &strend); break;
+            case 'M':{
+                modulation_scheme next_ms = liquid_getopt_str2mod(optarg);
+                if (next_ms == LIQUID_MODEM_UNKNOWN){
+                    fprintf(stderr,"error: %s, unknown/unsupported modulation scheme '%s'\n", argv[0], optarg);
+                    return false;
+                }
+                modulation.assign(optarg);
+                ms = next_ms;
+                break;
+            }
+            case 'B': next_bw_f   =  strtod(optarg, &strend); break;
+            case 'b': next_bw_nr  =  strtod(optarg, &strend); break;
+            case 'd': duration    =  strtod(optarg, &strend); break;
+            case 'j': json          .assign(optarg); break;
+            case 'a': case 'W': case 'C': case 'z': break; // fixed for the whole session
+            default: return false;
+            }
+        }
+        if(next_bw_nr > 0.0){
+            bw_nr = next_bw_nr;
+            bw_f = bw_nr * uhd_tx_rate;
+        }
+        else if(next_bw_f > 0.0){
+            bw_f = next_bw_f;
+            bw_nr = bw_f / uhd_tx_rate;
         }
         else{
-            // symstreamrncf_set_gain(ngen, gain);
+            bw_f = bw_nr * uhd_tx_rate;
+        }
+        command_line = std::string(argv[0]) + " " + line;
+        if(!cut_radio){
+            // retune only, the device and streamer stay up
+            usrp->set_tx_rate(uhd_tx_rate);
+            usrp->set_tx_freq(uhd_tx_freq);
+            usrp->set_tx_bandwidth(bw_f);
+            usrp->set_tx_gain(uhd_tx_gain);
+        }
+        return true;
+    };
+
+    for(;;){
+        // signal generator
+        bool noise_mode = false;
+        if (ms == LIQUID_MODEM_UNKNOWN){
+            noise_mode = true;
+            ms = LIQUID_MODEM_QPSK;
+        }
+        symstreamrcf gen = symstreamrcf_create_linear(
+            LIQUID_FIRFILT_ARKAISER, bw_nr, 12, 0.25f, ms);
+        symstreamrncf ngen = symstreamrncf_create_noise(
+            LIQUID_FIRFILT_ARKAISER, bw_nr, 12, 0.25f, ms_n);
+        if (noise_mode){
+            ms = LIQUID_MODEM_UNKNOWN;
+        }
 
-            // generate samples to buffer
-            symstreamrncf_write_samples(ngen, buf, buf_len);
+        md.start_of_burst = true;  // never SOB when continuous
+        md.end_of_burst   = false;  // 
+        md.has_time_spec  = true;  // set to false to send immediately
+
+        // gain cycle
+        if(!cut_radio) uhd_tx_rate = usrp->get_tx_rate(); // get actual rate
+        // unsigned long int num_samples_cycle = (unsigned long int) (gcycle * uhd_tx_rate);
+        // unsigned long int num_buffers_cycle = num_samples_cycle / buf_len;
+        // std::cout << num_samples_cycle << "," << num_buffers_cycle << std::endl;
+        // unsigned int buffer_counter=0;
+
+        // fc32 * buf = usrp_buffer.data();
+        fc32 * buf = (fc32*)iq_container->ptr;
+        chrono_time[2] = get_time();
+        if(!cut_radio)
+            usrp->set_time_now(uhd::time_spec_t(chrono_time[2]),uhd::usrp::multi_usrp::ALL_MBOARDS);
+
+        labels* reporter;
+        if(!json.empty()){
+            reporter = new labels(json.c_str(),"TXDL T","TXDL SG1","TXDL S1");
+            reporter->set_modulation(modulation);
+            reporter->eng_bw = bw_f;
         }
+        double initial_start = chrono_time[2]+0.5;
+        md.time_spec = uhd::time_spec_t(chrono_time[2]+0.5);
+        if(session)
+            notify_burst_ready(ready_fd, initial_start);
+        else
+            notify_ready(initial_start);
+        uint64_t xfer_counter = 0;
+        uint64_t xfer = 0;
+        size_t xfer_len = 0;
+        float gain = 0.5f;
+        symstreamrcf_set_gain(gen, gain);
+        while (continue_running && burst_running) {
+            // set the software gain
+            // float gain_dB = -grange*(0.5f - 0.5f*cosf(2*M_PI*(float)buffer_counter/(float)num_buffers_cycle));
+            //printf("%6u : gain=%8.3f\n", buffer_counter, gain_dB);
+            // buffer_counter = (buffer_counter+1) % num_buffers_cycle;
+            // float gain = 0.5f*powf(10.0f, gain_dB/20.0f);
+            if(ms != LIQUID_MODEM_UNKNOWN){
+                // symstreamrcf_set_gain(gen, gain);
+
+                // generate samples to buffer
+                symstreamrcf_write_samples(gen, buf, buf_len);
+            }
+            else{
+                // symstreamrncf_set_gain(ngen, gain);
 
-        xfer = 0;
-        xfer_len = buf_len;
-        while((xfer == 0 && xfer_len > 0) && continue_running){
-            // send the result to the USRP
-            if(!cut_radio){
-                xfer = tx_stream->send(bufs, xfer_len, md);
-                if(!file_dump.empty()){
-                    //write iq_container->ptr xfer
-                    if(xfer != writer_store_head(f_handle,iq_container,xfer)){
-                        throw std::runtime_error("Hmmm.");
+                // generate samples to buffer
+                symstreamrncf_write_samples(ngen, buf, buf_len);
+            }
+
+            xfer = 0;
+            xfer_len = buf_len;
+            while((xfer == 0 && xfer_len > 0) && continue_running && burst_running){
+                // send the result to the USRP
+                if(!cut_radio){
+                    xfer = tx_stream->send(bufs, xfer_len, md);
+                    if(!file_dump.empty()){
+                        //write iq_container->ptr xfer
+                        if(xfer != writer_store_head(f_handle,iq_container,xfer)){
+                            throw std::runtime_error("Hmmm.");
+                        }
                     }
                 }
-            }
-            else if(!file_dump.empty()){
-                xfer = writer_store_head(f_handle,iq_container,xfer_len);
-            }
-            if(xfer < xfer_len){
-                xfer_counter += xfer;
-                xfer_len -= xfer;
-                memmove( buf, &buf[xfer], xfer_len*sizeof(fc32) );
-                xfer = 0;
-                if(md.start_of_burst){
-                    md.start_of_burst = false;
-                    md.end_of_burst = false;
-                    md.has_time_spec = false;
+                else if(!file_dump.empty()){
+                    xfer = writer_store_head(f_handle,iq_container,xfer_len);
+                }
+                if(xfer < xfer_len){
+                    xfer_counter += xfer;
+                    xfer_len -= xfer;
+                    memmove( buf, &buf[xfer], xfer_len*sizeof(fc32) );
+                    xfer = 0;
+                    if(md.start_of_burst){
+                        md.start_of_burst = false;
+                        md.end_of_burst = false;
+                        md.has_time_spec = false;
+                    }
                 }
             }
+            ////////xfer == last transfer size
+            xfer_counter += xfer;
+            if(md.start_of_burst){
+                md.start_of_burst = false;
+                md.end_of_burst = false;
+                md.has_time_spec = false;
+            }
+            if(duration > 0 && get_time() > initial_start+duration) break;
         }
-        ////////xfer == last transfer size
-        xfer_counter += xfer;
-        if(md.start_of_burst){
-            md.start_of_burst = false;
-            md.end_of_burst = false;
-            md.has_time_spec = false;
+        // send a mini EOB packet
+        md.start_of_burst = false;
+        md.end_of_burst   = true;
+        if(!cut_radio) tx_stream->send("",0,md);
+        chrono_time[3] = get_time();
+
+
+        // sleep for a small amount of time to allow USRP buffers to flush
+        // usleep(100000);
+        if(!cut_radio){
+            while(get_time() < chrono_time[2]+0.5+xfer_counter/uhd_tx_rate);
+            usrp->set_tx_freq(6e9);
+            usrp->set_tx_gain(0.0);
         }
-        if(duration > 0 && get_time() > initial_start+duration) break;
-    }
-    continue_running = false;
-    // send a mini EOB packet
-    md.start_of_burst = false;
-    md.end_of_burst   = true;
-    if(!cut_radio) tx_stream->send("",0,md);
-    chrono_time[3] = get_time();
-
 
-    // sleep for a small amount of time to allow USRP buffers to flush
-    // usleep(100000);
-    if(!cut_radio){
-        while(get_time() < chrono_time[2]+0.5+xfer_counter/uhd_tx_rate);
-        usrp->set_tx_freq(6e9);
-        usrp->set_tx_gain(0.0);
+        //finished
+        printf("usrp data transfer complete\n");
+        symstreamrcf_destroy(gen);
+        symstreamrncf_destroy(ngen);
+        chrono_time[4] = get_time();
+
+        printf("Timestamp at program start: cpu sec: %15.9lf\n",chrono_time[0]);
+        printf("Connecting to radio at: cpu sec: %15.9lf\n",chrono_time[1]);
+        printf("Starting to send at: cpu sec: %15.9lf\n",chrono_time[2]);
+        printf("Stopping send at: cpu sec: %15.9lf\n",chrono_time[3]);
+        printf("Radio should be stopped at: cpu sec: %15.9lf\n",chrono_time[4]);
+        // export to .json if requested
+        if (!json.empty()) {
+            char misc_buf[100];
+            memset(misc_buf, 0, 100);
+            snprintf(misc_buf, 100,"        \"start_app\": %.9f,\n",chrono_time[0]);
+            reporter->cache_to_misc(std::string(misc_buf));
+            memset(misc_buf, 0, 100);
+            snprintf(misc_buf, 100,"        \"start_dev\": %.9f,\n",chrono_time[1]);
+            reporter->cache_to_misc(std::string(misc_buf));
+            memset(misc_buf, 0, 100);
+            snprintf(misc_buf, 100,"        \"start_tx\": %.9f,\n",chrono_time[2]);
+            reporter->cache_to_misc(std::string(misc_buf));
+            memset(misc_buf, 0, 100);
+            snprintf(misc_buf, 100,"        \"stop_tx\": %.9f,\n",chrono_time[3]);
+            reporter->cache_to_misc(std::string(misc_buf));
+            memset(misc_buf, 0, 100);
+            snprintf(misc_buf, 100,"        \"stop_app\": %.9f,\n",chrono_time[4]);
+            reporter->cache_to_misc(std::string(misc_buf));
+
+            std::string meta = "        \"command\": \"" + command_line;
+            reporter->cache_to_misc(meta+"\"\n");
+
+            meta = "";
+            reporter->start_reports();
+            reporter->append(
+                chrono_time[2]+0.5,
+                double(xfer_counter)/uhd_tx_rate,
+                uhd_tx_freq,
+                uhd_tx_rate*bw_nr,
+                meta);
+            reporter->activity_type="lowprob_anomaly";
+            reporter->protocol="unknown";
+            reporter->set_modulation(modulation);
+            reporter->modulation_src = modulation;
+            reporter->modality="single_carrier";
+            reporter->device_origin=uhd_tx_args;
+
+            reporter->finalize();
+            delete reporter;
+        }
+        if(!session)
+            break;
+        // re-armed before the supervisor hears about it, a SIGUSR1 for the next burst can't get lost
+        burst_running = true;
+        // the truth is on disk, the supervisor can move on
+        notify_burst_done(ready_fd, initial_start, chrono_time[3]);
+        if(!continue_running || !next_burst())
+            break;
     }
+    if(ready_fd >= 0)
+        close(ready_fd);
     if(!file_dump.empty()){
         writer_close(f_handle);
         container_destroy(&iq_container);
         writer_destroy(&f_handle);
     }
-
-    //finished
-    printf("usrp data transfer complete\n");
-    symstreamrcf_destroy(gen);
-    symstreamrncf_destroy(ngen);
-    chrono_time[4] = get_time();
-
-    printf("Timestamp at program start: cpu sec: %15.9lf\n",chrono_time[0]);
-    printf("Connecting to radio at: cpu sec: %15.9lf\n",chrono_time[1]);
-    printf("Starting to send at: cpu sec: %15.9lf\n",chrono_time[2]);
-    printf("Stopping send at: cpu sec: %15.9lf\n",chrono_time[3]);
-    printf("Radio should be stopped at: cpu sec: %15.9lf\n",chrono_time[4]);
-    // export to .json if requested
-    if (!json.empty()) {
-        char misc_buf[100];
-        memset(misc_buf, 0, 100);
-        snprintf(misc_buf, 100,"        \"start_app\": %.9f,\n",chrono_time[0]);
-        reporter->cache_to_misc(std::string(misc_buf));
-        memset(misc_buf, 0, 100);
-        snprintf(misc_buf, 100,"        \"start_dev\": %.9f,\n",chrono_time[1]);
-        reporter->cache_to_misc(std::string(misc_buf));
-        memset(misc_buf, 0, 100);
-        snprintf(misc_buf, 100,"        \"start_tx\": %.9f,\n",chrono_time[2]);
-        reporter->cache_to_misc(std::string(misc_buf));
-        memset(misc_buf, 0, 100);
-        snprintf(misc_buf, 100,"        \"stop_tx\": %.9f,\n",chrono_time[3]);
-        reporter->cache_to_misc(std::string(misc_buf));
-        memset(misc_buf, 0, 100);
-        snprintf(misc_buf, 100,"        \"stop_app\": %.9f,\n",chrono_time[4]);
-        reporter->cache_to_misc(std::string(misc_buf));
-        
-        std::string meta = "        \"command\": \"" + std::string(argv[0]);
-        for(int arg_idx = 1; arg_idx < argc; arg_idx++){
-            meta += (std::string(" ") + std::string(argv[arg_idx]));
-        }
-        reporter->cache_to_misc(meta+"\"\n");
-
-        meta = "";
-        reporter->start_reports();
-        reporter->append(
-            chrono_time[2]+0.5,
-            double(xfer_counter)/uhd_tx_rate,
-            uhd_tx_freq,
-            uhd_tx_rate*bw_nr,
-            meta);
-        reporter->activity_type="lowprob_anomaly";
-        reporter->protocol="unknown";
-        reporter->set_modulation(modulation);
-        reporter->modulation_src = modulation;
-        reporter->modality="single_carrier";
-        reporter->device_origin=uhd_tx_args;
-
-        reporter->finalize();
-        delete reporter;
-    }
     return 0;
 }
-
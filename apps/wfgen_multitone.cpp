@@ -10,6 +10,7 @@
 #include <uhd/usrp/multi_usrp.hpp>
 
 #include "labels.hh"
+#include "ready.hh"
 #include "liquid.h"
 #include "writer.hh"
 
@@ -177,6 +178,7 @@ int main (int argc, char **argv)
     // unsigned long long ticker = 0;
     float local_gain = 1.0f/float(num_tones);
     md.time_spec = uhd::time_spec_t(chrono_time[2]+0.5);
+    notify_ready(chrono_time[2]+0.5);
     uint64_t xfer_counter = 0;
     uint64_t xfer = 0;
     size_t xfer_len = 0;
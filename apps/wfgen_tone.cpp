@@ -9,6 +9,7 @@
 #include <uhd/usrp/multi_usrp.hpp>
 
 #include "labels.hh"
+#include "ready.hh"
 #include "liquid.h"
 #include "writer.hh"
 
@@ -140,6 +141,7 @@ int main (int argc, char **argv)
         reporter->eng_bw = 5e3;
     }
     md.time_spec = uhd::time_spec_t(chrono_time[2]+0.5);
+    notify_ready(chrono_time[2]+0.5);
     uint64_t xfer_counter = 0;
     uint64_t xfer = 0, xfer_idx = 0;
     size_t xfer_len = 0;
@@ -12,6 +12,7 @@
 
 #include "liquid.h"
 #include "labels.hh"
+#include "ready.hh"
 #include "wbofdmgen.hh"
 #include "writer.hh"
 
@@ -248,6 +249,7 @@ int main (int argc, char **argv)
     chrono_time[6] = chrono_time[2] + 0.5;
     double send_at = chrono_time[6];
     md.time_spec = uhd::time_spec_t(chrono_time[6]);
+    notify_ready(send_at);
     uint64_t xfer_counter = 0;
     uint64_t xfer = 0, xfer_idx = 0;
     size_t xfer_len = 0;
@@ -0,0 +1,30 @@
+// readiness notification back to a supervising process
+#ifndef __READY_HH__
+#define __READY_HH__
+
+#ifdef __cplusplus
+extern "C" {
+#endif
+
+/// environment variable naming an inherited pipe fd the supervisor listens on
+#define WFGEN_READY_FD_ENV "WFGEN_READY_FD"
+
+/// write "ready <tx_start>\n" to the readiness fd (if one was given) and close it
+///  returns 1 if a notification was sent, 0 if nobody asked for one, -1 on error
+int notify_ready(double tx_start);
+
+/// claim the readiness fd for repeated use (session mode)
+///  returns the fd, or -1 if nobody asked for one
+int ready_fd_take(void);
+
+/// "ready <tx_start>\n" on an already claimed fd, left open
+int notify_burst_ready(int fd, double tx_start);
+
+/// "done <tx_start> <tx_stop>\n" on an already claimed fd, left open
+int notify_burst_done(int fd, double tx_start, double tx_stop);
+
+#ifdef __cplusplus
+}
+#endif
+
+#endif // __READY_HH__
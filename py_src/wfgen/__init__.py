@@ -1,10 +1,22 @@
 
 
 from .utils import encoder,decoder,MultiSocket,have_pygr
-from . import server,client,utils,profiles
-from .launcher import launch
+from . import utils,profiles
 from .c_logger import logger_client,fake_log,logger as c_logger
 
+def __getattr__(name):
+    ### server, client and launch drag in the run modes, only load them when they're used
+    import importlib
+    if name == 'launch':
+        from .launcher import launch
+        return launch
+    try:
+        return importlib.import_module('.'+name,__name__)
+    except ModuleNotFoundError as e:
+        if e.name != '.'.join([__name__,name]):
+            raise
+    raise AttributeError("module {0!r} has no attribute {1!r}".format(__name__,name))
+
 __version__ = "0.1.0"
 
 BaseAudio = None
@@ -21,13 +21,21 @@ WG_CLIENT_API_VERSION = 0x01000000
 
 try:
     from .utils import get_interface,decoder,paramify,MultiSocket,Ettus_USRP_container
+    from .truth_transfer import receive,DEFAULT_CHUNK
+    from .truth import TruthIndex
+    from .truth_store import from_report
     from .c_logger import logger_client,fake_log,logger as c_logger
     from . import profiles
+    from .run_modes.radio_plan import radio_plan_tracker
 except:
     ## fall back for direct exection
     from wfgen.utils import get_interface,decoder,paramify,MultiSocket,Ettus_USRP_container
+    from wfgen.truth_transfer import receive,DEFAULT_CHUNK
+    from wfgen.truth import TruthIndex
+    from wfgen.truth_store import from_report
     from wfgen import logger_client,fake_log,c_logger
     from wfgen import profiles
+    from wfgen.run_modes.radio_plan import radio_plan_tracker
 
 DEBUGGING_CLIENT=True
 
@@ -165,22 +173,6 @@ def complete_path(path=None):
     return [path]
 
 
-class radio_plan_tracker(object):
-    def __init__(self,radio_idx,dev,runtime=float('inf')):
-        self.radio_idx = radio_idx
-        self.dev = dev
-        self.runtime = runtime
-        self.occupied = []
-    def reserve(self,start,stop):
-        self.occupied.append((start,stop))
-    def available(self,start,stop):
-        available = True
-        for usage in self.occupied:
-            if not ((start < usage[0] and stop < usage[0]) or (start > usage[1] and stop > usage[1])):
-                available = False
-                break
-        return available
-
 class ClientRequests(object):
     REQUEST_ID=0
     @staticmethod
@@ -376,11 +368,11 @@ class Client(object):
             response = decoder(response[0].get_message()[0])
         return "\n\t".join(response)
 
-    def get_radios(self):
+    def get_radios(self,refresh=False):
         if not self.is_connected():
             return self._not_connected
         self.network.clear()
-        expected = self.network.send(ClientRequests(self.network.endpoint,["get_radios",""]))
+        expected = self.network.send(ClientRequests(self.network.endpoint,["get_radios","refresh" if refresh else ""]))
         response = self.__get_response(expected,30,expected,'get_radios')
         if 'timeout' not in response:
             response = ["".join(decoder(x.get_message()[0])) for x in response]
@@ -450,26 +442,55 @@ class Client(object):
             response = [" ".join(decoder(x.get_message()[0])) for x in response]
         return "\n".join(response)
     
-    def collect_truth(self,outfile=None):
+    def collect_truth(self,outfile=None,codec='zlib',chunk_size=DEFAULT_CHUNK,columnar=False,retries=3):
+        """
+        Pull every server's truth report and merge them into one file
+
+        A transfer that stops part way is picked back up from the last chunk
+        written, up to retries times. Reports that still didn't make it are
+        left out of the merged file and raised once it's written.
+        """
         if not self.is_connected():
             return self._not_connected
-        nreplies = self.network.send(ClientRequests(self.network.endpoint,["get_truth",outfile]))
+        nreplies = self.network.send(ClientRequests(self.network.endpoint,["get_truth","stream",codec]))
         response = self.__get_response(nreplies,60,nreplies,'get_truth')
-        if 'timeout' not in response:
-            response = [" ".join(decoder(x.get_message()[0])) for x in response]
-        else:
+        if 'timeout' in response:
             timeout = response[:2]
             print(timeout)
-            response = [" ".join(decoder(x.get_message()[0])) for x in response[2:]]
+            response = response[2:]
         file_count = 0
+        failed = []
         with tempfile.TemporaryDirectory() as tmpdir:
             proto = 'truth_report_{0:03d}.json'
             for idx,sr in enumerate(response):
+                sid = sr.get_dest()[0]
+                sr = decoder(sr.get_message()[0])
                 self.log_c.log(c_logger.level_t.INFO,f"{idx}, {sr[:2]}")
-                if sr[1] != 'empty':
-                    file_count += 1
+                if sr[1] == 'empty':
+                    continue
+                if sr[0] == 'transfer':
+                    ### ['transfer', status, transfer id, size, codec], stream it to disk
+                    tid,size,codec = sr[2],int(sr[3]),sr[4]
+                    part = os.path.join(tmpdir,proto.format(idx))
+                    for attempt in range(retries+1):
+                        try:
+                            ### resumes from whatever part already holds
+                            receive(lambda o,n: self._truth_chunk(sid,tid,o,n),size,codec,part,chunk_size)
+                            break
+                        except RuntimeError as e:
+                            offset = os.path.getsize(part) if os.path.isfile(part) else 0
+                            self.log_c.log(c_logger.level_t.WARNING,"Transfer {0!s} stopped at {1!s}/{2!s} (attempt {3!s}): {4!s}".format(
+                                tid,offset,size,attempt+1,e))
+                    else:
+                        self.log_c.log(c_logger.level_t.ERROR,"Transfer {0!s} from {1!s} failed".format(tid,sid))
+                        failed.append((sid,tid))
+                        if os.path.isfile(part):
+                            os.remove(part)
+                        continue
+                else:
                     with open(os.path.join(tmpdir,proto.format(idx)),'w') as fp:
                         fp.write(sr[2])
+                file_count += 1
             if file_count:
                 report_file = outfile if outfile is not None else 'report_of_truth.json'
                 if os.path.isfile(report_file):
@@ -479,16 +500,49 @@ class Client(object):
                     while os.path.isfile(report_file):
                         counter += 1
                         report_file = out_proto.format(counter)
-                cmd = 'consolidate_reports.py -output {0} "{1}"'.format(report_file,os.path.join(tmpdir,'truth*.json'))
-                self.log_c.log(c_logger.level_t.INFO,"Running command:\n\t{0!s}".format(cmd))
-                cmd = shlex.split(cmd)
-                proc = subprocess.Popen(cmd,shell=False)
-                proc.wait()
+                truth = TruthIndex()
+                truth.merge_new(os.path.join(tmpdir,'truth*.json'))
+                count = truth.write(report_file)
+                self.log_c.log(c_logger.level_t.INFO,"Wrote {0!s} reports to {1!s}".format(count,report_file))
+                if columnar:
+                    ### indexed copy next to it for time/frequency queries
+                    from_report(truth.to_dict(),os.path.splitext(report_file)[0] + '.sqlite')
                 outfile = report_file
             else:
                 report_file = 'No valid non-empty reports came in'
+        if failed:
+            raise RuntimeError("{0!s}: missing the reports of {1!s} transfer(s) {2!s} after {3!s} retries".format(
+                report_file,len(failed),failed,retries))
         return report_file
 
+    def _truth_chunk(self,sid,tid,offset,length):
+        ### one server at a time, so the only reply coming is this one
+        self.network.send(ClientRequests(sid,["truth_chunk",tid,"{0:d}".format(offset),"{0:d}".format(length)]))
+        deadline = time.time() + 60
+        while self.running and time.time() < deadline:
+            response = self.network.get(1)
+            if response is None:
+                ### chunks come back quickly, the 1 second polling in __get_response would dominate
+                time.sleep(0.005)
+                continue
+            reply = decoder(response[0].get_message()[0])
+            if response[0].get_dest()[0] != sid:
+                self.log_c.log(c_logger.level_t.WARNING,"Dropping a reply from {0!s} while pulling from {1!s}".format(
+                    response[0].get_dest()[0],sid))
+                continue
+            if reply[:2] == ['Request','failed:']:
+                raise RuntimeError(" ".join(reply[2:]))
+            if len(reply) < 4 or reply[0] != 'chunk' or reply[1] != tid:
+                self.log_c.log(c_logger.level_t.WARNING,"Dropping a reply that isn't part of transfer {0!s}: {1!s}".format(
+                    tid,reply[:2]))
+                continue
+            if reply[2] == 'error':
+                raise RuntimeError(reply[3])
+            if int(reply[2]) != offset:
+                ### late reply to a request an earlier attempt gave up on
+                continue
+            return int(reply[2]),int(reply[3]),reply[4]
+        raise RuntimeError("timed out waiting on offset {0!s}".format(offset))
 
     def _radio_cleanup(self):
         possible_radios = ['{0:s}'.format(x['args']) for x in self.radios.radios]
@@ -505,6 +559,7 @@ class Client(object):
         if self.radios is None:
             return "Get radios first!"
         from wfgen.run_modes import scripted
+        from wfgen.run_modes.radio_plan import assign_radios,pin_sources
         if file_location is None:
             raise ValueError("No script path provided")
         try:
@@ -533,9 +588,7 @@ class Client(object):
         if len(all_radios) < num_radios_needed and num_radios_needed >= 0:
             self.log_c.log(c_logger.level_t.WARNING,"Fewer radios are available than needed, will drop signals")
 
-        plan_tracking = [radio_plan_tracker(idx,dev) for idx,dev in enumerate(all_radios)]
         radio_mapping = dict([(dev,[]) for dev in all_radios])
-        radio_failback = dict()
 
         ### seed maker
         if seed is not None:
@@ -546,86 +599,34 @@ class Client(object):
         if flags in [1,2,3]:
             #### playing back a truth file
             signals = sorted(signals,key=lambda x: x['time_start'])
-            src_id = [y['device_origin'] if len(y['device_origin']) else y['instance_name'] \
-                      for x in signals for y in sources if x['instance_name'] in y['signal_set']]
+            src_of = dict()
+            for y in sources:
+                for name in y['signal_set']:
+                    src_of.setdefault(name,y['device_origin'] if len(y['device_origin']) else y['instance_name'])
+            src_id = [src_of.get(x['instance_name'],x['instance_name']) for x in signals]
             time_windows = [[x['time_start'],x['time_stop']] for x in signals]
+            prof_names = [None]*len(signals)
             for idx,sig in enumerate(signals):
-                src = src_id[idx]
-                time_win = time_windows[idx]
-                if sig['instance_name'] not in og_profs:
-                    if flags not in [3]:
-                        self.log_c.log(c_logger.level_t.WARNING,"Dropping signal at index {} because can't find a replay profile for it".format(idx))
-                        signal_lineup[idx] = [None,None,None]
-                        continue
+                if sig['instance_name'] not in og_profs and flags not in [3]:
+                    self.log_c.log(c_logger.level_t.WARNING,"Dropping signal at index {} because can't find a replay profile for it".format(idx))
+                    continue
                 if flags in [1,2]:
-                    prof_name = og_profs[sig['instance_name']]
-                else:
-                    prof_name = sig['mod_src_name']
-                radio_idx = None
-                if src in radio_mapping:
-                    ### great I know what radio this should go to
-                    dev = src
-                    radio_idx = all_radios.index(dev)
-                    if not plan_tracking[radio_idx].available(*time_win):
-                        ### but the device is busy during this time
-                        radio_idx = None
-                        dev = None
-                else:
-                    ### this isn't my radio format
-                    if src in radio_failback:
-                        ### but we have seen it before
-                        radio_idx,dev = radio_failback[src]
-                        if not plan_tracking[radio_idx].available(*time_win):
-                            ### but the device is busy during this time
-                            radio_idx = None
-                            dev = None
-                    else:
-                        ### haven't seen this radio yet
-                        possible_radio_count = len(all_radios)
-                        checked = 0
-                        r_idx = rng.integers(possible_radio_count)
-                        while not plan_tracking[r_idx].available(*time_win):
-                            r_idx = (r_idx+1)%possible_radio_count
-                            checked += 1
-                            if checked == possible_radio_count:
-                                #### No radios are free at this time
-                                r_idx = None
-                                break
-                        if r_idx is not None:
-                            ### a radio is available, so let's store it
-                            radio_idx = r_idx
-                            dev = all_radios[r_idx]
-                            radio_failback[src] = (radio_idx,dev)
-                if radio_idx is None and src not in all_radios:
-                    ### This isn't a radio I actually know, so see if there's another radio that
-                    #### can cover this
-                    possible_radio_count = len(all_radios)
-                    if src in radio_failback:
-                        r_idx,_ = radio_failback[src]
-                    else:
-                        r_idx = rng.integers(possible_radio_count)
-                    checked = 0
-                    while not plan_tracking[r_idx].available(*time_win):
-                        r_idx = (r_idx+1)%possible_radio_count
-                        checked += 1
-                        if checked == possible_radio_count:
-                            #### No radios are free at this time
-                            r_idx = None
-                            break
-                    if r_idx is not None:
-                        ### a radio is available, so let's store it
-                        radio_idx = r_idx
-                        dev = all_radios[r_idx]
-                        radio_failback[src] = (radio_idx,dev)
-                if radio_idx is not None:
-                    ### Alright there is a radio that can take this task
-                    radio_mapping[dev].append({'time':time_win,'profile':prof_name,'signal_index':idx})
-                    plan_tracking[radio_idx].reserve(*time_win)
-                    sig['profile'] = prof_name
-                    signal_lineup[idx] = [sig,{radio_servers[radio_idx]:[dev]},time_win]
+                    prof_names[idx] = og_profs[sig['instance_name']]
                 else:
+                    prof_names[idx] = sig['mod_src_name']
+            ### sources that are one of our radios stay on it, the rest get packed onto the fewest radios
+            playable = [idx for idx,x in enumerate(prof_names) if x is not None]
+            pinned = pin_sources(sources,all_radios)
+            assigned = assign_radios([time_windows[x] for x in playable],[src_id[x] for x in playable],len(all_radios),pinned)
+            for idx,radio_idx in zip(playable,assigned):
+                if radio_idx is None:
                     self.log_c.log(c_logger.level_t.WARNING,"Dropping signal at index {}".format(idx))
-                    signal_lineup[idx] = [None,None,None]
+                    continue
+                sig,dev,time_win = signals[idx],all_radios[radio_idx],time_windows[idx]
+                radio_mapping[dev].append({'time':time_win,'profile':prof_names[idx],'signal_index':idx})
+                sig['profile'] = prof_names[idx]
+                signal_lineup[idx] = [sig,{radio_servers[radio_idx]:[dev]},time_win]
+            signal_lineup = [[None,None,None] if x is None else x for x in signal_lineup]
         else:
             ### creating a script from a config space
             for sig_idx,sig in enumerate(signals):
@@ -763,7 +764,7 @@ class cli(cmd.Cmd,object):
             "**     -- Closes the cli\n",
             "** - shutdown\n",
             "**     -- Closes both the cli and server\n",
-            "** - get_radios\n",
+            "** - get_radios [refresh]\n",
             "**     -- The process of how the cli figures out radio numbers\n",
             "** - get_active\n",
             "**     -- List of tuples -- each tuple is an active process on the server\n",
@@ -814,7 +815,7 @@ class cli(cmd.Cmd,object):
         return True
 
     def do_get_radios(self, line):
-        radio_info = self.client.get_radios() ## list of strings from each server
+        radio_info = self.client.get_radios('refresh' in line.split()) ## list of strings from each server
         if radio_info == self.client._not_connected:
             print(radio_info)
         self.radios = Ettus_USRP_container(radio_info,verbose=self.verbose)
@@ -892,7 +893,10 @@ class cli(cmd.Cmd,object):
                 print("Special help her hasn't been implemented yet")
         filename = [x for x in items if x.endswith('.json')]
         filename = filename[0] if len(filename) else None
-        reply = self.client.collect_truth(filename)
+        try:
+            reply = self.client.collect_truth(filename)
+        except RuntimeError as e:
+            reply = str(e)
         print('truth file:',reply)
 
     def do_exit(self, line):
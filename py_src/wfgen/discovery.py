@@ -0,0 +1,101 @@
+import shlex
+import time
+import threading
+import subprocess
+from typing import List
+from concurrent.futures import ThreadPoolExecutor
+
+NO_DEVICES = "No devices found"
+
+
+def probe(restrict:str=None):
+    """
+    One uhd_find_devices run
+
+    :param restrict: --args to narrow the search with
+    :return: its output, or None if nothing was found
+    """
+    command = "uhd_find_devices"
+    if restrict is not None:
+        command += ' --args="{0}"'.format(restrict)
+    try:
+        return subprocess.run(shlex.split(command),check=True,capture_output=True,text=True).stdout
+    except (subprocess.CalledProcessError,OSError):
+        return None
+
+def discover(uhd_args:List[str]=[]):
+    """ probe every restriction at once, same output as running them back to back """
+    if not len(uhd_args):
+        found = probe()
+        if found is None:
+            print("No devices found, try using UHD arguments.")
+            return NO_DEVICES
+        return found
+    with ThreadPoolExecutor(max_workers=len(uhd_args)) as pool:
+        found = list(pool.map(probe,uhd_args))
+    for restrict,this_one in zip(uhd_args,found):
+        if this_one is None:
+            print("No devices found with restriction:",restrict)
+    found = [x for x in found if x is not None]
+    if not found:
+        return NO_DEVICES
+    return '\n'.join(found)
+
+
+class RadioDiscovery(object):
+    """
+    Cached uhd_find_devices results
+
+    get() answers from the cache while it is younger than ttl, a background
+    thread keeps it fresh so nobody has to sit through a probe unless they
+    explicitly ask for one.
+
+    :param uhd_args: restrictions passed on to discover
+    :param ttl: seconds a probe result is good for
+    """
+    def __init__(self,uhd_args:List[str]=[],ttl:float=300.0):
+        self.uhd_args = list(uhd_args)
+        self.ttl      = ttl
+        self.info     = None
+        self.probed   = 0.0
+        self.lock     = threading.Lock()
+        self.probing  = threading.Lock()
+        self.stopped  = threading.Event()
+        self.thread   = None
+    def refresh(self):
+        """ probe now (or wait for the probe already running) """
+        with self.probing:
+            with self.lock:
+                if self.info is not None and time.time() - self.probed < 1.0:
+                    ### someone else just did it
+                    return self.info
+            info = discover(self.uhd_args)
+            with self.lock:
+                self.info,self.probed = info,time.time()
+            return info
+    def get(self,refresh:bool=False):
+        with self.lock:
+            info,age = self.info,time.time() - self.probed
+        if refresh or info is None or age > self.ttl:
+            return self.refresh()
+        return info
+    def age(self):
+        with self.lock:
+            return time.time() - self.probed if self.info is not None else None
+    def _background(self):
+        while not self.stopped.is_set():
+            try:
+                self.refresh()
+            except Exception:
+                import traceback
+                traceback.print_exc()
+            self.stopped.wait(self.ttl/2)
+    def start(self):
+        """ warm the cache and keep it warm """
+        if self.thread is None:
+            self.stopped.clear()
+            self.thread = threading.Thread(target=self._background,name="radio-discovery",daemon=True)
+            self.thread.start()
+    def stop(self):
+        self.stopped.set()
+        self.thread = None
@@ -0,0 +1,88 @@
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+ALL_RESOURCES = '*'
+
+
+def conflicts(keys:set,held):
+    """ True if any of keys is held, ALL_RESOURCES conflicts with everything """
+    if not keys or not held:
+        return False
+    if ALL_RESOURCES in keys or ALL_RESOURCES in held:
+        return True
+    return any([x in held for x in keys])
+
+
+class RequestDispatcher(object):
+    """
+    Runs server requests on a worker pool, serializing the ones that conflict
+
+    Every request comes with the set of resources it touches (radio indices,
+    or ALL_RESOURCES for anything that reads/writes the whole ServerState).
+    The dispatcher never queues anything itself, callers hold requests back
+    (in the server's RequestQueue) until can_start() says their resources
+    and a worker are free. Requests touching nothing run inline.
+    """
+    def __init__(self,handler,max_workers:int=8,on_done=None,log=None):
+        self.handler     = handler
+        self.on_done     = on_done
+        self.log         = log
+        self.max_workers = max_workers
+        self.running     = 0
+        self.busy        = Counter()
+        self.lock        = threading.Condition()
+        self.executor    = ThreadPoolExecutor(max_workers=max_workers,thread_name_prefix='wfgen-request')
+    def can_start(self,keys:set):
+        """ True if a request touching keys would start right away """
+        if not keys:
+            return True
+        with self.lock:
+            return self.running < self.max_workers and not conflicts(keys,self.busy)
+    def submit(self,request,keys=set()):
+        """
+        :param request: handed to the handler as is
+        :param keys: resources the request touches
+        :return: False (and nothing runs) if a worker or one of the keys isn't free
+        """
+        keys = set(keys)
+        if not keys:
+            self._run(request,keys)
+            return True
+        with self.lock:
+            if self.running >= self.max_workers or conflicts(keys,self.busy):
+                return False
+            self.running += 1
+            self.busy.update(keys)
+        self.executor.submit(self._run,request,keys)
+        return True
+    def _run(self,request,keys:set):
+        try:
+            self.handler(request)
+        except Exception:
+            import traceback
+            if self.log is not None:
+                self.log("Request {0!s} failed:\n{1!s}".format(request,traceback.format_exc()))
+            else:
+                traceback.print_exc()
+        finally:
+            if keys:
+                self._finish(keys)
+            if self.on_done is not None:
+                self.on_done()
+    def _finish(self,keys:set):
+        with self.lock:
+            self.running -= 1
+            self.busy.subtract(keys)
+            self.busy = +self.busy
+            self.lock.notify_all()
+    def idle(self):
+        with self.lock:
+            return not self.busy
+    def drain(self,timeout:float=None):
+        """ block until every submitted request has finished """
+        with self.lock:
+            return self.lock.wait_for(lambda: not self.busy,timeout)
+    def shutdown(self,wait:bool=True):
+        """ stop the pool, letting whatever is running finish """
+        self.executor.shutdown(wait=wait)
@@ -1,7 +1,6 @@
 
 import os
 import multiprocessing as mp
-import shlex
 import subprocess
 import random
 import yaml
@@ -10,6 +9,8 @@ import pprint
 from typing import List
 from wfgen import profiles
 from wfgen.utils import paramify
+from wfgen.discovery import discover
+from wfgen.spawn import spawn
 from wfgen.run_modes import parse_random_run_reqest,parse_script_request
 
 
@@ -37,9 +38,9 @@ def launch(cmd: List[str],server_state:"ServerState",use_log=False):
         if cmd[1].startswith("wfgen_"):
             log_c.log(r_logger.level_t.INFO,"\nstarting a radio with command\n\t{}".format(cmd[1:]))
             if any(['quiet' in x for x in cmd]):
-                proc = subprocess.Popen(cmd[1:],stdout=subprocess.PIPE,stderr=subprocess.PIPE,shell=False)
+                proc = spawn(cmd[1:],stdout=subprocess.PIPE,stderr=subprocess.PIPE)
             else:
-                proc = subprocess.Popen(cmd[1:],shell=False)
+                proc = spawn(cmd[1:])
             if proc.poll() is None:
                 return proc
             else:
@@ -55,14 +56,15 @@ def launch(cmd: List[str],server_state:"ServerState",use_log=False):
                 params = paramify(cmd[4:])
                 log_c.log(r_logger.level_t.INFO,"\nUsing Parameters: {0!s}".format(params))
                 p = prof(use_log=use_log)
-                launch_env = os.environ.copy()
-                launch_command = p.start(cmd[2],params)
-                command = shlex.split(launch_command)
+                command = p.start_argv(cmd[2],params)
+                if not isinstance(command,list):
+                    log_c.log(r_logger.level_t.ERROR,"Can't start {0!s}: {1!s}".format(cmd[3],command))
+                    return None
                 log_c.log(r_logger.level_t.DEBUG,"---launch command: {0!s}".format(command))
                 if any(['quiet' in x for x in cmd]):
-                    proc = subprocess.Popen(command,stdout=subprocess.PIPE,stderr=subprocess.PIPE,shell=False,env=launch_env)
+                    proc = spawn(command,stdout=subprocess.PIPE,stderr=subprocess.PIPE)
                 else:
-                    proc = subprocess.Popen(command,shell=False,env=launch_env)
+                    proc = spawn(command)
                 if proc.poll() is None:
                     return proc
                 else:
@@ -81,13 +83,15 @@ def launch(cmd: List[str],server_state:"ServerState",use_log=False):
                     params["num_channels"] = 1
                 print(params)
                 p = prof(use_log=use_log)
-                launch_env = os.environ.copy()
-                command = p.start(cmd[2],params).split()
+                command = p.start_argv(cmd[2],params)
+                if not isinstance(command,list):
+                    log_c.log(r_logger.level_t.ERROR,"Can't start {0!s}: {1!s}".format(cmd[3],command))
+                    return None
                 log_c.log(r_logger.level_t.DEBUG,"---launch command: {0!s}".format(command))
                 if any(['quiet' in x for x in cmd]):
-                    proc = subprocess.Popen(command,stdout=subprocess.PIPE,stderr=subprocess.PIPE,shell=False,env=launch_env)
+                    proc = spawn(command,stdout=subprocess.PIPE,stderr=subprocess.PIPE)
                 else:
-                    proc = subprocess.Popen(command,shell=False,env=launch_env)
+                    proc = spawn(command)
                 if proc.poll() is None:
                     return proc
                 else:
@@ -119,26 +123,4 @@ def launch(cmd: List[str],server_state:"ServerState",use_log=False):
         return None
 
 def get_radios(uhd_args=[]):
-    command = "uhd_find_devices"
-    if len(uhd_args):
-        ettus_radios = []
-        command += ' --args="{0}"'
-        for restrict in uhd_args:
-            exec_command = shlex.split(command.format(restrict))
-            try:
-                this_one = subprocess.run(exec_command,check=True,capture_output=True,text=True).stdout
-                ettus_radios.append(this_one)
-            except subprocess.CalledProcessError as e:
-                print("No devices found with restriction:",restrict)
-        if not ettus_radios:
-            ettus_radios = "No devices found"
-        else:
-            ettus_radios = '\n'.join(ettus_radios)
-    else:
-        try:
-            ettus_radios = subprocess.run(command,check=True,capture_output=True,text=True).stdout
-            ettus_radios = ettus_radios
-        except subprocess.CalledProcessError as e:
-            print("No devices found, try using UHD arguments.")
-            ettus_radios = "No devices found"
-    return ettus_radios
+    return discover(uhd_args)
@@ -0,0 +1,292 @@
+import os
+import abc
+import signal
+import subprocess
+import time
+import threading
+import multiprocessing as mp
+from collections import namedtuple,deque
+from typing import List
+
+try:
+    from .watcher import popen_sentinel
+except ImportError:
+    from wfgen.watcher import popen_sentinel
+
+
+finished_record = namedtuple('finished_record',['pid','command','radios','returncode','started','stopped'])
+
+
+class ProcHandle(abc.ABC):
+    """
+    Uniform wrapper over whatever a launch handed back to the server
+
+    Sub-classes cover subprocess.Popen, mp.Process, (usrp,flowgraph) tuples
+    and the __debug_test__ placeholder, so the server never has to branch
+    on the process shape again.
+    """
+    def __init__(self,pid:int,proc,command:str,radios:List[int]):
+        self.pid        = pid
+        self.proc       = proc
+        self.command    = command
+        self.radios     = list(radios)
+        self.started    = time.time()
+        self.returncode = None
+        self.state      = 'running'
+    def interrupt(self):
+        """ the polite stop request for this kind of process """
+        self.signal(signal.SIGINT)
+    @abc.abstractmethod
+    def signal(self,sig:int):
+        pass
+    @abc.abstractmethod
+    def poll(self):
+        """ :return: None while running, otherwise the return code """
+    @abc.abstractmethod
+    def wait(self,timeout:float=None):
+        """ :return: the return code, or None if the timeout passed first """
+    def sentinel(self):
+        """ :return: something mp.connection.wait can block on, if available """
+        return None
+    def close(self):
+        pass
+    def record(self):
+        return finished_record(self.pid,self.command,self.radios,self.returncode,self.started,time.time())
+    def __str__(self):
+        return "({0!s}, {1!s}, {2!r}, {3!s}, {4:s})".format(self.pid,self.proc,self.command,self.radios,self.state)
+    def __repr__(self):
+        return self.__str__()
+
+class PopenHandle(ProcHandle):
+    def __init__(self,pid:int,proc,command:str,radios:List[int]):
+        super().__init__(pid,proc,command,radios)
+        self.pidfd = popen_sentinel(proc)
+    def signal(self,sig:int):
+        if self.proc.poll() is None:
+            self.proc.send_signal(sig)
+    def poll(self):
+        self.returncode = self.proc.poll()
+        return self.returncode
+    def wait(self,timeout:float=None):
+        try:
+            self.returncode = self.proc.wait(timeout)
+        except subprocess.TimeoutExpired:
+            return None
+        return self.returncode
+    def sentinel(self):
+        return self.pidfd
+    def close(self):
+        self.wait()
+        if self.pidfd is not None:
+            os.close(self.pidfd)
+            self.pidfd = None
+
+class MPHandle(ProcHandle):
+    def interrupt(self):
+        self.proc.terminate()
+    def signal(self,sig:int):
+        if self.proc.is_alive():
+            os.kill(self.proc.pid,sig)
+    def poll(self):
+        self.returncode = self.proc.exitcode
+        return self.returncode
+    def wait(self,timeout:float=None):
+        self.proc.join(timeout)
+        return self.poll()
+    def sentinel(self):
+        return self.proc.sentinel
+    def close(self):
+        self.proc.join()
+        self.returncode = self.proc.exitcode
+        self.proc.close()
+
+class FlowgraphHandle(ProcHandle):
+    """ (usrp:Popen/mp.Process/None, flowgraph:profile) pairs """
+    def __init__(self,pid:int,proc,command:str,radios:List[int]):
+        super().__init__(pid,proc,command,radios)
+        self.usrp = None
+        if proc[0] is not None:
+            self.usrp = make_handle(pid,proc[0],command,radios)
+        self.flowgraph = proc[1]
+        self.stopped = False
+    def interrupt(self):
+        if self.usrp is not None:
+            self.usrp.interrupt()
+        self.stop_flowgraph()
+    def signal(self,sig:int):
+        if self.usrp is not None:
+            self.usrp.signal(sig)
+    def stop_flowgraph(self):
+        if self.flowgraph is not None and not self.stopped:
+            self.flowgraph.stop()
+            self.stopped = True
+    def poll(self):
+        if self.usrp is None:
+            ### nothing external to watch, the flowgraph runs until told otherwise
+            return None
+        self.returncode = self.usrp.poll()
+        if self.returncode is not None:
+            self.stop_flowgraph()
+        return self.returncode
+    def wait(self,timeout:float=None):
+        if self.usrp is not None:
+            self.returncode = self.usrp.wait(timeout)
+        return self.returncode
+    def sentinel(self):
+        if self.usrp is not None:
+            return self.usrp.sentinel()
+        return None
+    def close(self):
+        self.stop_flowgraph()
+        if self.usrp is not None:
+            self.usrp.close()
+            self.returncode = self.usrp.returncode
+        if self.flowgraph is not None:
+            self.flowgraph.wait()
+
+class DummyHandle(ProcHandle):
+    """ __debug_test__ launches only hand back a number """
+    def interrupt(self):
+        self.returncode = 0
+    def signal(self,sig:int):
+        self.returncode = 0
+    def poll(self):
+        return self.returncode
+    def wait(self,timeout:float=None):
+        self.returncode = 0
+        return self.returncode
+
+def make_handle(pid:int,proc,command:str,radios:List[int]):
+    if isinstance(proc,subprocess.Popen):
+        return PopenHandle(pid,proc,command,radios)
+    if isinstance(proc,mp.Process):
+        return MPHandle(pid,proc,command,radios)
+    if isinstance(proc,tuple):
+        return FlowgraphHandle(pid,proc,command,radios)
+    if isinstance(proc,int):
+        return DummyHandle(pid,proc,command,radios)
+    raise ValueError("Not sure what this proc is... type({0!s})".format(type(proc)))
+
+
+class ProcRegistry(object):
+    """
+    Active processes indexed by pid and by radio index, plus a bounded
+    store of compact records for the ones that have finished
+    """
+    def __init__(self,finished_limit:int=4096):
+        self.active   = dict()
+        self.by_radio = dict()
+        self.finished = deque(maxlen=finished_limit)
+        self.lock     = threading.RLock()
+    def add(self,pid:int,proc,command:str,radios:List[int]):
+        with self.lock:
+            if pid in self.active:
+                raise RuntimeError("Process id {0!s} is already registered".format(pid))
+            handle = make_handle(pid,proc,command,radios)
+            self.active[pid] = handle
+            for radio in handle.radios:
+                self.by_radio.setdefault(radio,dict())[pid] = handle
+            return handle
+    def get(self,pid:int):
+        with self.lock:
+            return self.active.get(pid,None)
+    def for_radio(self,radio_idx:int):
+        with self.lock:
+            return list(self.by_radio.get(radio_idx,{}).values())
+    def unwatched(self):
+        """ :return: running handles without a sentinel (only polling finds their exit) """
+        with self.lock:
+            return [x for x in self.active.values() if x.state == 'running' and x.sentinel() is None]
+    def sentinels(self):
+        """ :return: dict of sentinel -> handle for running processes that have one """
+        out = dict()
+        with self.lock:
+            for handle in self.active.values():
+                if handle.state != 'running':
+                    ### already owned by the reaper
+                    continue
+                s = handle.sentinel()
+                if s is not None:
+                    out[s] = handle
+        return out
+    def retire(self,pid:int):
+        """
+        Close out a finished process and keep only its record
+
+        :return: the handle that was removed, None if it was already retired
+        """
+        with self.lock:
+            handle = self.active.pop(pid,None)
+            if handle is None:
+                return None
+            for radio in handle.radios:
+                users = self.by_radio.get(radio,None)
+                if users is not None:
+                    users.pop(pid,None)
+                    if not users:
+                        del self.by_radio[radio]
+        handle.close()
+        handle.state = 'finished'
+        with self.lock:
+            self.finished.append(handle.record())
+        return handle
+    def __contains__(self,pid:int):
+        with self.lock:
+            return pid in self.active
+    def __len__(self):
+        with self.lock:
+            return len(self.active)
+    def __iter__(self):
+        with self.lock:
+            return iter(list(self.active.values()))
+
+
+class Reaper(object):
+    """
+    Stops processes without holding up the caller
+
+    reap() sends the polite stop and returns, a background thread then waits
+    for the exit, escalating SIGINT -> SIGTERM -> SIGKILL whenever a timeout
+    passes, and finally hands the handle to on_reaped.
+    """
+    def __init__(self,on_reaped,sigint_timeout:float=10.0,sigterm_timeout:float=5.0,log=None):
+        self.on_reaped       = on_reaped
+        self.sigint_timeout  = sigint_timeout
+        self.sigterm_timeout = sigterm_timeout
+        self.log             = log
+        self.pending         = dict()
+        self.cond            = threading.Condition()
+    def reap(self,handle:ProcHandle):
+        """ :return: False if this handle was already being reaped """
+        with self.cond:
+            if handle.pid in self.pending:
+                return False
+            handle.state = 'terminating'
+            self.pending[handle.pid] = handle
+        handle.interrupt()
+        t = threading.Thread(target=self._reap,args=(handle,),name="reaper-{0!s}".format(handle.pid),daemon=True)
+        t.start()
+        return True
+    def is_pending(self,pid:int):
+        with self.cond:
+            return pid in self.pending
+    def _reap(self,handle:ProcHandle):
+        try:
+            for sig,timeout in [(signal.SIGTERM,self.sigint_timeout),(signal.SIGKILL,self.sigterm_timeout),(None,None)]:
+                if handle.wait(timeout) is not None or sig is None:
+                    break
+                if self.log is not None:
+                    self.log("Process {0!s} ignored the last stop request, escalating to {1!s}".format(handle.pid,signal.Signals(sig).name))
+                handle.signal(sig)
+            self.on_reaped(handle)
+        except Exception:
+            import traceback
+            traceback.print_exc()
+        finally:
+            with self.cond:
+                del self.pending[handle.pid]
+                self.cond.notify_all()
+    def drain(self,timeout:float=None):
+        """ block until every pending process was reaped """
+        with self.cond:
+            return self.cond.wait_for(lambda: len(self.pending) == 0,timeout)
@@ -47,14 +47,12 @@ from .fskmod import available_mods as fskmod_available_mods
 
 from ._profile import get_all_profile_names,get_replay_profile_names,\
                     get_defined_profile_names, extract_profile_by_name,\
-                    sanity_check_profiles,\
+                    is_profile_name,get_profile_registry,\
                     get_base_options,get_base_flags,resolve_band_freq_options,\
+                    get_flag_table,split_radio_args,build_argv,copy_defaults,\
                     resolve_hopper_dwell_squelch_period_options,\
-                    get_traceback_profiles
+                    get_traceback_profiles,get_lookup_profiles
 
-
-sanity_check_profiles()
-
-del sanity_check_profiles
+### the name lists (and their sanity check) are built on first use now
 
 
@@ -2,6 +2,11 @@
 import json
 import glob
 import os
+import shlex
+import functools
+import importlib
+import threading
+import pickle
 import numpy as np
 from ..utils import have_pygr
 
@@ -113,6 +118,59 @@ def get_base_flags(style='static',sub_type=None):
     else:
         return _static_options
 
+### options that are a bare flag, on when their value is truthy
+SWITCH_OPTIONS = ('linear_hop',)
+
+@functools.lru_cache(maxsize=None)
+def get_flag_table(style='static',sub_type=None):
+    """
+    (option, flag) pairs for a mode, with 'json'/'-j' on the end
+
+    Options without a flag never reach the command line so they are left
+    out here, built once per mode instead of on every start().
+    """
+    return tuple((o,f) for o,f in zip(get_base_options(style,sub_type) + ['json'],
+                                      get_base_flags(style,sub_type) + ['-j']) if f is not None)
+
+@functools.lru_cache(maxsize=64)
+def split_radio_args(radio_args:str):
+    return tuple(shlex.split(radio_args))
+
+def build_argv(table,params:dict,stats:dict,skip_keys=(),missing_ok=False):
+    """
+    The option part of a generator command line
+
+    A value in params wins (and is recorded in stats), otherwise the one in
+    stats is used, None leaves the flag off entirely.
+
+    :param table: from get_flag_table
+    :param missing_ok: options in neither params nor stats are left off instead of a KeyError
+    :return: list of argv tokens
+    """
+    argv = []
+    for opt,flag in table:
+        if opt in skip_keys:
+            continue
+        if opt in params:
+            value = params[opt]
+            if value is not None and opt not in SWITCH_OPTIONS:
+                stats[opt] = value
+        else:
+            value = stats.get(opt,None) if missing_ok else stats[opt]
+        if opt in SWITCH_OPTIONS:
+            if value:
+                argv.append(flag)
+        elif value is not None:
+            argv += [flag,str(value)]
+    return argv
+
+def copy_defaults(defaults:dict,config:dict=None):
+    """ starting stats for a start(), one level deep is all start() modifies """
+    stats = {k:(list(v) if isinstance(v,list) else v) for k,v in defaults.items()}
+    if config is not None:
+        stats.update({k:(list(v) if isinstance(v,list) else v) for k,v in config.items()})
+    return stats
+
 def resolve_band_freq_options(runtime_params, stored_params):
     # print(runtime_params)
     # print(stored_params)
@@ -209,12 +267,24 @@ class _profile(object):
                 print("Making a {0:s}_{1:04d} profile".format('_'.join(name.split('_')[:-1]),int(name.split('_')[-1])),end='-->')
             except (NameError,ValueError):
                 print("Making a {0:s} profile".format(name))
-    def start(self,radio_args,params):
-        '''Return the command to start this profile
+    def start(self,radio_args,params=dict()):
+        '''Return the command to start this profile, as one string
+
+        Same as start_argv, kept for the cli and anything else that wants text
+        '''
+        argv = self.start_argv(radio_args,params)
+        if not isinstance(argv,list):
+            ### some profiles answer bad parameters with a message (or None)
+            return argv
+        cmd = ' '.join(argv)
+        print("RUNNING WITH THIS:\n",cmd,sep='')
+        return cmd
+    def start_argv(self,radio_args,params):
+        '''Return the command to start this profile as an argv list
 
         Assumes something higher up is taking care of radio specifics
         '''
-        print("'start' function has not been overridden properly in this({0}) profile".format(self._name))
+        print("'start_argv' function has not been overridden properly in this({0}) profile".format(self._name))
         raise RuntimeError("Abstract Method not defined")
     def get_name(self):
         '''What should this profile be referred to.
@@ -244,88 +314,180 @@ class _profile(object):
         return []
 
 
+### bump when what gets pickled changes
+LOOKUP_CACHE_VERSION = 1
+
 class _lookup_profile(object):
-    def __init__(self,lookup_key='profiles'):
-        self.lookup_dir = os.path.join(os.path.abspath(os.path.dirname(__file__)),'lookups')
-        self.possible_profile_files = glob.glob(os.path.join(self.lookup_dir,'*.json'))
+    """
+    The replay profiles from lookups/*.json
+
+    Parsing the json is most of the cost, so the result (with the traceback
+    index) is pickled next to the json files, or under ~/.cache/wfgen when
+    that isn't writable, and reused while the files' mtime/size match.
+    """
+    def __init__(self,lookup_key='profiles',lookup_dir=None,use_cache=True):
+        self.lookup_dir = lookup_dir if lookup_dir is not None else os.path.join(os.path.abspath(os.path.dirname(__file__)),'lookups')
+        self.lookup_key = lookup_key
+        self.possible_profile_files = sorted(glob.glob(os.path.join(self.lookup_dir,'*.json')))
         self.profile_keys = [os.path.splitext(os.path.basename(x))[0] for x in self.possible_profile_files]
-        self.raw_dicts = dict()
+        state = self._load_cache() if use_cache else None
+        if state is None:
+            state = self._parse()
+            if use_cache:
+                self._store_cache(state)
+        self.unique_profile_names,self.profiles,self.traceback_index = state
+    def _parse(self):
+        profiles = dict()
         for fpath,fkey in zip(self.possible_profile_files,self.profile_keys):
             with open(fpath,'r') as fp:
-                self.raw_dicts[fkey] = json.load(fp)
-            if lookup_key not in self.raw_dicts[fkey]:
-                del self.raw_dicts[fkey]
-        self.unique_profile_names = sorted([s["name"] for k,d in self.raw_dicts.items() for s in d[lookup_key]])
-        self.profiles = dict([(n,None) for n in self.unique_profile_names])
-        for k,d in self.raw_dicts.items():
-            for s in d[lookup_key]:
-                active_profile = s['name']
-                p = s.copy()
-                p['profile_source_file'] = k
-                self.profiles[active_profile] = p
-
-lookup_profiles = _lookup_profile()
+                raw = json.load(fp)
+            for s in raw.get(self.lookup_key,[]):
+                p = dict(s)
+                p['profile_source_file'] = fkey
+                profiles[s['name']] = p
+        unique_profile_names = sorted(profiles.keys())
+        return unique_profile_names,profiles,self._index_traceback(profiles)
+    @staticmethod
+    def _index_traceback(profiles):
+        """ file (None for all of them) -> signal -> profile name(s) """
+        index = {None:dict()}
+        for prof,info in profiles.items():
+            for entry in info.get('traceback',[]):
+                per_file = index.setdefault(entry['file'],dict())
+                for k in entry['signals']:
+                    index[None].setdefault(k,set()).add(prof)
+                    per_file.setdefault(k,set()).add(prof)
+        for per_file in index.values():
+            for k,v in per_file.items():
+                per_file[k] = sorted(v) if len(v) > 1 else next(iter(v))
+        return index
+    def _cache_key(self):
+        key = [LOOKUP_CACHE_VERSION,self.lookup_key]
+        for fpath in self.possible_profile_files:
+            st = os.stat(fpath)
+            key.append((os.path.basename(fpath),st.st_mtime_ns,st.st_size))
+        return key
+    def _cache_paths(self):
+        name = '.{0:s}.cache.pickle'.format(self.lookup_key)
+        user = os.path.join(os.path.expanduser('~'),'.cache','wfgen',
+                            os.path.abspath(self.lookup_dir).strip(os.sep).replace(os.sep,'_') + name)
+        return [os.path.join(self.lookup_dir,name),user]
+    def _load_cache(self):
+        try:
+            key = self._cache_key()
+        except OSError:
+            return None
+        for path in self._cache_paths():
+            try:
+                with open(path,'rb') as fp:
+                    cached = pickle.load(fp)
+                if cached['key'] == key:
+                    return cached['state']
+            except Exception:
+                ### missing, stale format or half written, just rebuild
+                continue
+        return None
+    def _store_cache(self,state):
+        try:
+            blob = pickle.dumps({'key':self._cache_key(),'state':state},protocol=pickle.HIGHEST_PROTOCOL)
+        except OSError:
+            return None
+        for path in self._cache_paths():
+            tmp = '{0:s}.{1:d}.tmp'.format(path,os.getpid())
+            try:
+                os.makedirs(os.path.dirname(path),exist_ok=True)
+                with open(tmp,'wb') as fp:
+                    fp.write(blob)
+                os.replace(tmp,path)
+                return path
+            except OSError:
+                try:
+                    os.remove(tmp)
+                except OSError:
+                    pass
+        return None
+
+_lookup_profiles = None
+_lookup_lock = threading.Lock()
+def get_lookup_profiles():
+    """ the replay profile lookup, loaded on first use """
+    global _lookup_profiles
+    if _lookup_profiles is None:
+        with _lookup_lock:
+            if _lookup_profiles is None:
+                _lookup_profiles = _lookup_profile()
+    return _lookup_profiles
+
+def __getattr__(name):
+    ### module level lookup_profiles used to be built at import
+    if name == 'lookup_profiles':
+        return get_lookup_profiles()
+    raise AttributeError("module {0!r} has no attribute {1!r}".format(__name__,name))
 
 def get_traceback_profiles(script=None):
-    if script is not None:
-        base_file = os.path.basename(script)
-    traceback_profiles = dict()
-    for prof,info in lookup_profiles.profiles.items():
-        if script is None:
-            origins = [z for y in [x['signals'] for x in info['traceback']] for z in y]
-        else:
-            origins = [z for y in [x['signals'] for x in info['traceback'] if x['file'] == base_file] for z in y]
-        for k in origins:
-            if k in traceback_profiles:
-                if isinstance(traceback_profiles[k],str):
-                    traceback_profiles[k] = [traceback_profiles[k],prof]
-                else:
-                    traceback_profiles[k].append(prof)
-            else:
-                traceback_profiles[k] = prof
-    for k in traceback_profiles.keys():
-        if isinstance(traceback_profiles[k],list):
-            new_v = np.unique(traceback_profiles[k]).tolist()
-            if len(new_v) == 1:
-                new_v = new_v[0]
-            traceback_profiles[k] = new_v
-    return traceback_profiles
-
-
-def _get_other_profiles():
-    from .fskmod import available_mods as fsk_profiles
-    from .linmod import available_mods as lin_profiles
-    from .afmod import available_mods as af_profiles
-    from .tones import available_mods as tone_profiles
-    from argparse import Namespace
-    return Namespace(**{
-        'lin_profiles':lin_profiles,
-        'fsk_profiles':fsk_profiles,
-        'af_profiles':af_profiles,
-        'tone_profiles':tone_profiles
-    })
+    index = get_lookup_profiles().traceback_index
+    per_file = index[None] if script is None else index.get(os.path.basename(script),dict())
+    return {k:(list(v) if isinstance(v,list) else v) for k,v in per_file.items()}
+
+
+### (module, kind) for the generator backed profiles, in get_all_profile_names order
+_PROFILE_MODULES = [('linmod','lin'),('fskmod','fsk'),('afmod','af'),('tones','tone')]
+### get_defined_profile_names has always listed fsk first
+_DEFINED_ORDER = ['fsk','lin','af','tone']
+
+class _profile_registry(object):
+    """
+    Every profile name, worked out once
+
+    by_name maps a name to (module, class name, kind), kind is one of the
+    _PROFILE_MODULES kinds or 'replay' (module is None for those, they come
+    from the lookup tables). A name that is both defined and a replay
+    resolves to the defined one.
+    """
+    def __init__(self):
+        self.by_name = dict()
+        by_kind = dict()
+        for module,kind in _PROFILE_MODULES:
+            by_kind[kind] = list(importlib.import_module('.'+module,__package__).available_mods)
+        self.replay_names = tuple(get_lookup_profiles().unique_profile_names)
+        self.all_names = self.replay_names + tuple(n for _,k in _PROFILE_MODULES for n in by_kind[k])
+        self.defined_names = tuple(n for k in _DEFINED_ORDER for n in by_kind[k])
+        for name in self.replay_names:
+            self.by_name[name] = (None,'replay_profile','replay')
+        for module,kind in _PROFILE_MODULES:
+            for name in by_kind[kind]:
+                self.by_name[name] = ('.'.join([__package__,module]),name,kind)
+        ### every name is unique across the kinds
+        assert len(self.all_names) == len(self.by_name)
+
+_registry = None
+_registry_lock = threading.Lock()
+def get_profile_registry():
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = _profile_registry()
+    return _registry
+
+def is_profile_name(profile_name,kind=None):
+    """ :param kind: only accept this kind ('lin','fsk','af','tone','replay') """
+    entry = get_profile_registry().by_name.get(profile_name,None)
+    return entry is not None and (kind is None or entry[2] == kind)
+
+@functools.lru_cache(maxsize=None)
+def _profile_class(profile_name):
+    module,cls,_ = get_profile_registry().by_name[profile_name]
+    return getattr(importlib.import_module(module),cls)
 
 def get_all_profile_names():
-    replay_profiles = get_replay_profile_names()
-    ns = _get_other_profiles()
-    all_profiles = (replay_profiles 
-        + [x for x in ns.lin_profiles]
-        + [x for x in ns.fsk_profiles]
-        + [x for x in ns.af_profiles]
-        + [x for x in ns.tone_profiles])
-    return all_profiles
+    return list(get_profile_registry().all_names)
 
 def get_replay_profile_names():
-    return [x for x in lookup_profiles.unique_profile_names]
+    return list(get_profile_registry().replay_names)
 
 def get_defined_profile_names():
-    ns = _get_other_profiles()
-    all_profiles = ([] 
-        + [x for x in ns.fsk_profiles]
-        + [x for x in ns.lin_profiles]
-        + [x for x in ns.af_profiles]
-        + [x for x in ns.tone_profiles])
-    return all_profiles
+    return list(get_profile_registry().defined_names)
 
 class replay_profile(_profile):
     def __init__(self,name,signal_space):
@@ -348,27 +510,10 @@ class replay_profile(_profile):
         if self.likely_mod == 'am_analog':
             self.likely_mod = 'am_wav_file'
 
-        ns = _get_other_profiles()
-
-        if self.likely_mod in ns.lin_profiles:
-            from . import linmod
-            self.mod_file = linmod
-            self.mod_p = getattr(self.mod_file,self.likely_mod)()
-
-        if self.likely_mod in ns.fsk_profiles:
-            from . import fskmod
-            self.mod_file = fskmod
-            self.mod_p = getattr(self.mod_file,self.likely_mod)()
-
-        if self.likely_mod in ns.af_profiles:
-            from . import afmod
-            self.mod_file = afmod
-            self.mod_p = getattr(self.mod_file,self.likely_mod)()
-
-        if self.likely_mod in ns.tone_profiles:
-            from . import tones
-            self.mod_file = tones
-            self.mod_p = getattr(self.mod_file,self.likely_mod)()
+        if is_profile_name(self.likely_mod) and not is_profile_name(self.likely_mod,'replay'):
+            cls = _profile_class(self.likely_mod)
+            self.mod_file = importlib.import_module(cls.__module__)
+            self.mod_p = cls()
 
         from wfgen import c_logger
         if self.mod_p is not None:
@@ -391,6 +536,11 @@ class replay_profile(_profile):
             super().start(*args)
         return self.mod_p.start(*args)
 
+    def start_argv(self,*args):
+        if self.mod_p is None:
+            super().start_argv(*args)
+        return self.mod_p.start_argv(*args)
+
     def get_stats(self,*args):
         if self.mod_p is None:
             return super().get_stats(*args)
@@ -403,31 +553,12 @@ class replay_profile(_profile):
 
 
 def extract_profile_by_name(profile_name):
-    if profile_name not in get_all_profile_names():
+    entry = get_profile_registry().by_name.get(profile_name,None)
+    if entry is None:
         raise ValueError("Profile({}) is not found presently".format(profile_name))
-    if profile_name in get_defined_profile_names():
-        ns = _get_other_profiles()
-        if profile_name in ns.lin_profiles:
-            from . import linmod
-            return getattr(linmod,profile_name)()
-        if profile_name in ns.fsk_profiles:
-            from . import fskmod
-            return getattr(fskmod,profile_name)()
-        if profile_name in ns.af_profiles:
-            from . import afmod
-            return getattr(afmod,profile_name)()
-        if profile_name in ns.tone_profiles:
-            from . import tones
-            return getattr(tones,profile_name)()
-    else:
-        return replay_profile(profile_name,lookup_profiles.profiles[profile_name])
-
-
-def sanity_check_profiles():
-    import numpy as np
-    pns = get_all_profile_names()
-    upns = np.unique(pns)
-    assert len(pns) == len(upns)
+    if entry[2] == 'replay':
+        return replay_profile(profile_name,get_lookup_profiles().profiles[profile_name])
+    return _profile_class(profile_name)()
 
 
 if __name__ == "__main__":
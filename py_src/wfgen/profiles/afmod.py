@@ -2,7 +2,6 @@
 import numpy as np
 from ._profile import _profile
 import multiprocessing as mp
-from copy import deepcopy
 
 available_mods = ["am_constant","am_square","am_triangle","am_sawtooth","am_sinusoid","am_wav_file","am_rand_uni","am_rand_gauss",
                   "fm_constant","fm_square","fm_triangle","fm_sawtooth","fm_sinusoid","fm_wav_file","fm_rand_uni","fm_rand_gauss"]
@@ -38,10 +37,9 @@ class _ammod(_profile):
         self._config = None
     def config(self,**kwargs):
         self._config = kwargs
-    def start(self,radio_args,params=dict()):
+    def start_argv(self,radio_args,params=dict()):
         from wfgen import profiles
-        opts = self.options
-        flgs = self.option_flags
+        table = profiles.get_flag_table('static','analog')
         hopping = False
         if "hopper" in params and params['hopper']:
             hopping = True
@@ -56,15 +54,12 @@ class _ammod(_profile):
             self.defaults['num_loops'] = 5
             self.defaults['duration'] = None
             self.defaults['linear_hop'] = None
-            opts = profiles.get_base_options('hopper','analog') + ['json']
-            flgs = profiles.get_base_flags('hopper','analog') + ['-j']
+            table = profiles.get_flag_table('hopper','analog')
         if self.mod is None:
             mod = self.defaults['modulation']
         else:
             mod = self.mod
-        self.stats = deepcopy(self.defaults)
-        if self._config is not None:
-            self.stats.update(deepcopy(self._config))
+        self.stats = profiles.copy_defaults(self.defaults,self._config)
         
         params, self.stats = profiles.resolve_band_freq_options(params,self.stats)
         skip_keys = ['band']
@@ -88,29 +83,11 @@ class _ammod(_profile):
             skip_keys.append('BW')
         if 'duration' not in params:
             skip_keys.append('duration')
-        cmd = ' '.join([self.base_command,radio_args])
-        for idx,opt in enumerate(opts):
-            if opt in skip_keys:
-                continue
-            if opt in ["linear_hop"]:
-                if opt in params:
-                    if params[opt]:
-                        cmd += ' {0:s}'.format(flgs[idx])
-                else:
-                    if self.stats[opt]:
-                        cmd += ' {0:s}'.format(flgs[idx])
-            else:
-                if opt in params:
-                    if params[opt] is not None:
-                        cmd += ' {0:s} {1}'.format(flgs[idx],params[opt])
-                        self.stats[opt] = params[opt]
-                else:
-                    if self.stats[opt] is not None:
-                        cmd += ' {0:s} {1}'.format(flgs[idx],self.stats[opt])
-        cmd += ' -M {}'.format(mod)
-        print("RUNNING WITH THIS:\n",cmd,sep='')
+        argv = [self.base_command,*profiles.split_radio_args(radio_args)]
+        argv += profiles.build_argv(table,params,self.stats,skip_keys)
+        argv += ['-M',str(mod)]
         self.stats['modulation'] = mod
-        return cmd
+        return argv
     @staticmethod
     def get_options(mode='static'):
         from wfgen import profiles
@@ -148,10 +125,9 @@ class _fmmod(_profile):
         self._config = None
     def config(self,**kwargs):
         self._config = kwargs
-    def start(self,radio_args,params=dict()):
+    def start_argv(self,radio_args,params=dict()):
         from wfgen import profiles
-        opts = self.options
-        flgs = self.option_flags
+        table = profiles.get_flag_table('static','analog')
         hopping = False
         if "hopper" in params and params['hopper']:
             hopping = True
@@ -166,15 +142,12 @@ class _fmmod(_profile):
             self.defaults['num_loops'] = 5
             self.defaults['duration'] = None
             self.defaults['linear_hop'] = None
-            opts = profiles.get_base_options('hopper','analog') + ['json']
-            flgs = profiles.get_base_flags('hopper','analog') + ['-j']
+            table = profiles.get_flag_table('hopper','analog')
         if self.mod is None:
             mod = self.defaults['modulation']
         else:
             mod = self.mod
-        self.stats = deepcopy(self.defaults)
-        if self._config is not None:
-            self.stats.update(deepcopy(self._config))
+        self.stats = profiles.copy_defaults(self.defaults,self._config)
         
         params, self.stats = profiles.resolve_band_freq_options(params,self.stats)
         skip_keys = ['band']
@@ -198,38 +171,11 @@ class _fmmod(_profile):
             skip_keys.append('BW')
         if 'duration' not in params:
             skip_keys.append('duration')
-        cmd = ' '.join([self.base_command,radio_args])
-        for idx,opt in enumerate(opts):
-            if opt in skip_keys:
-                continue
-            # print('{0:<3s}'.format(str(idx)),
-            #       '{0:<20s}'.format(str(opt)),
-            #       '{0:<6s}'.format(str(opt in params)),
-            #       '{0:<6s}'.format(str(opt in self.stats)),
-            #       '{0:<6s}'.format(str(opt in self.defaults)),
-            #       '{0:<16s}'.format(str(params[opt] if opt in params else None)),
-            #       '{0:<16s}'.format(str(self.stats[opt] if opt in self.stats else None)),
-            #       '{0:<16s}'.format(str(self.defaults[opt] if opt in self.defaults else None)))
-            if opt in ["linear_hop"]:
-                if opt in params:
-                    if params[opt]:
-                        cmd += ' {0:s}'.format(flgs[idx])
-                else:
-                    if self.stats[opt]:
-                        cmd += ' {0:s}'.format(flgs[idx])
-            else:
-                if opt in params:
-                    if params[opt] is not None:
-                        cmd += ' {0:s} {1}'.format(flgs[idx],params[opt])
-                        self.stats[opt] = params[opt]
-                else:
-                    if self.stats[opt] is not None:
-                        cmd += ' {0:s} {1}'.format(flgs[idx],self.stats[opt])
-        cmd += ' -M {}'.format(mod)
-        print("RUNNING WITH THIS:\n",cmd,sep='')
+        argv = [self.base_command,*profiles.split_radio_args(radio_args)]
+        argv += profiles.build_argv(table,params,self.stats,skip_keys)
+        argv += ['-M',str(mod)]
         self.stats['modulation'] = mod
-        print(cmd)
-        return cmd
+        return argv
     @staticmethod
     def get_options(mode='static'):
         from wfgen import profiles
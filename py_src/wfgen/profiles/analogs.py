@@ -13,11 +13,9 @@ import numpy as np
 
 from typing import Union,List
 
-from pydub import AudioSegment
-
 from fractions import Fraction
 
-from tqdm import tqdm
+### pydub and tqdm are only used by AudioCombiner.fuse, imported there
 
 
 def get_audio_files(source_dir=None):
@@ -381,6 +379,8 @@ class AudioCombiner(object):
         return self.src_fusion.frame_rate
 
     def fuse(self,fs=48000.0,interleave_silence_ms=1000,verbose=False):
+        from pydub import AudioSegment
+        from tqdm import tqdm
         if not self.found:
             self.must_find = True
             self._find_sources()
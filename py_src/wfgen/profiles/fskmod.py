@@ -1,6 +1,7 @@
 
 import numpy as np
-from ._profile import _profile
+from ._profile import _profile,get_flag_table
+import functools
 import multiprocessing as mp
 
 
@@ -12,6 +13,16 @@ available_mods = ["fsk2", "fsk4", "fsk8", "fsk16", "fsk32", "fsk64",
 
 # __all__ = available_mods
 
+@functools.lru_cache(maxsize=None)
+def _fsk_flag_table(style='static',symbol_rate=False):
+    ''' the fsk generators don't take phase_shape, symbol_rate goes in place of bw '''
+    full = get_flag_table(style,'fsk')
+    table = tuple(x for x in full if x[0] not in ["symbol_rate","phase_shape"])
+    if symbol_rate:
+        flags = [x[1] for x in full]
+        table = tuple(('symbol_rate',flags[flags.index('-s')]) if x[0] == 'bw' else x for x in table)
+    return table
+
 class _fskmod(_profile):
     def __init__(self,mod=None,**kwargs):
         from wfgen import profiles
@@ -45,10 +56,9 @@ class _fskmod(_profile):
         self._config = None
     def config(self,**kwargs):
         self._config = kwargs ### being lazy here
-    def start(self,radio_args,params=dict()):
+    def start_argv(self,radio_args,params=dict()):
         from wfgen import profiles
-        opts = self.options
-        flgs = self.option_flags
+        style = 'static'
         hopping = False
         if "hopper" in params and params['hopper']:
             ############# This is a frequency hopping version
@@ -63,15 +73,12 @@ class _fskmod(_profile):
             self.defaults['loop_delay'] = 0.5
             self.defaults['num_loops'] = 5
             self.defaults['linear_hop'] = None
-            opts = profiles.get_base_options('hopper','fsk') + ['json']
-            flgs = profiles.get_base_flags('hopper','fsk') + ['-j']
+            style = 'hopper'
         if self.mod is None:
             mod = self.defaults['modulation']
         else:
             mod = self.mod
-        self.stats = self.defaults.copy()
-        if self._config is not None:
-            self.stats.update(self._config)
+        self.stats = profiles.copy_defaults(self.defaults,self._config)
         if 'symbol_rate' in params and 'bw' in params:
             if hopping:
                 print("Can only specify one of 'symbol_rate' or 'bw', dropping 'symbol_rate'")
@@ -79,13 +86,9 @@ class _fskmod(_profile):
             else:
                 print("Can only specify one of 'symbol_rate' or 'bw', dropping 'bw'")
                 del params['bw']
-        options = [x for x in opts if x not in ["symbol_rate","phase_shape"]]
-        flags = [x for x in flgs if x not in ['-R','-P']]
         if 'symbol_rate' in params:
             del self.stats['bw']
-            bw_idx = options.index('bw')
-            options[bw_idx] = opts[opts.index('symbol_rate')] #'bw' <- 'symbol_rate'
-            flags[bw_idx] = flgs[flgs.index('-s')] # '-b' <- '-s'
+        table = _fsk_flag_table(style,'symbol_rate' in params)
 
         # print(1,params)
         params, self.stats = profiles.resolve_band_freq_options(params,self.stats)
@@ -116,36 +119,11 @@ class _fskmod(_profile):
         if 'phase_shape' not in params:
             skip_keys.append('phase_shape')
 
-        cmd = ' '.join([self.base_command,radio_args])
-        # for z in zip(options,flgs):
-        #     print(z)
-        for idx,opt in enumerate(options):
-            if opt in skip_keys:
-                continue
-            # print(flgs[idx],opt)
-            if opt in ["linear_hop"]:
-                if opt in params:
-                    if params[opt]:
-                        print("A")
-                        cmd += ' {0:s}'.format(flgs[idx])
-                else:
-                    if self.stats[opt]:
-                        print("B")
-                        cmd += ' {0:s}'.format(flgs[idx])
-            else:
-                if opt in params:
-                    if params[opt] is not None:
-                        print("C")
-                        cmd += ' {0:s} {1}'.format(flags[idx],params[opt])
-                        self.stats[opt] = params[opt]
-                else:
-                    if self.stats[opt] is not None:
-                        print("D")
-                        cmd += ' {0:s} {1}'.format(flags[idx],self.stats[opt])
-        cmd += ' -M {}'.format(mod)
-        print("RUNNING WITH THIS:\n",cmd,sep='')
+        argv = [self.base_command,*profiles.split_radio_args(radio_args)]
+        argv += profiles.build_argv(table,params,self.stats,skip_keys)
+        argv += ['-M',str(mod)]
         self.stats['modulation'] = mod
-        return cmd
+        return argv
     @staticmethod
     def get_options(mode='static'):
         from wfgen import profiles
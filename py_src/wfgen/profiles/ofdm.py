@@ -2,7 +2,6 @@
 import numpy as np
 from ._profile import _profile
 import multiprocessing as mp
-from copy import deepcopy
 
 
 available_mods = ['ofdm','wifi_ag','wifi_ac','lte']
@@ -60,10 +59,8 @@ class _ofdmmod(_profile):
         self._config = None
     def config(self,**kwargs):
         self._config = kwargs ### being lazy here
-    def start(self,radio_args,params=dict()):
+    def start_argv(self,radio_args,params=dict()):
         from wfgen import profiles
-        opts = self.options
-        flgs = self.option_flags
         hopping = True
         if self.mod is None:
             mod = self.defaults['modulation']
@@ -73,9 +70,7 @@ class _ofdmmod(_profile):
             car_mod = self.defaults['car_mod']
         else:
             car_mod = self.car_mod
-        self.stats = deepcopy(self.defaults)
-        if self._config is not None:
-            self.stats.update(deepcopy(self._config))
+        self.stats = profiles.copy_defaults(self.defaults,self._config)
 
         params, self.stats = profiles.resolve_band_freq_options(params,self.stats)
         skip_keys = ['loop_delay','num_loops']
@@ -99,49 +94,20 @@ class _ofdmmod(_profile):
             skip_keys.append('BW')
         if 'duration' not in params:
             skip_keys.append('duration')
-        cmd = ' '.join([self.base_command,radio_args])
-        for idx,opt in enumerate(opts):
-            try:
-                if opt in skip_keys:
-                    continue
-                # print('{0:<3s}'.format(str(idx)),
-                #       '{0:<20s}'.format(str(opt)),
-                #       '{0:<6s}'.format(str(opt in params)),
-                #       '{0:<6s}'.format(str(opt in self.stats)),
-                #       '{0:<6s}'.format(str(opt in self.defaults)),
-                #       '{0:<16s}'.format(str(params[opt] if opt in params else None)),
-                #       '{0:<16s}'.format(str(self.stats[opt] if opt in self.stats else None)),
-                #       '{0:<16s}'.format(str(self.defaults[opt] if opt in self.defaults else None)))
-                if opt in ['car_mod']:
-                    if opt in params:
-                        car_mod = params[opt]
-                    continue
-                if opt in ["linear_hop"]:
-                    if opt in params:
-                        if params[opt]:
-                            cmd += ' {0:s}'.format(flgs[idx])
-                    else:
-                        if self.stats[opt]:
-                            cmd += ' {0:s}'.format(flgs[idx])
-                else:
-                    if opt in params:
-                        if params[opt] is not None:
-                            cmd += ' {0:s} {1}'.format(flgs[idx],params[opt])
-                            self.stats[opt] = params[opt]
-                    else:
-                        if self.stats[opt] is not None:
-                            # print(opt,opt in self.stats,flgs,idx)
-                            cmd += ' {0:s} {1}'.format(flgs[idx],self.stats[opt])
-            except (KeyError,TypeError) as e:
-                print("option:",opt,"index:",idx)
-                print("params:",sorted(list(params.keys())))
-                print("self.stats:",sorted(list(self.stats.keys())))
-                raise e
-        cmd += ' -M {}'.format(car_mod)
-        print("RUNNING WITH THIS:\n",cmd,sep='')
+        if 'car_mod' in params:
+            ### has no flag of its own, it's what -M gets
+            car_mod = params['car_mod']
+        argv = [self.base_command,*profiles.split_radio_args(radio_args)]
+        try:
+            argv += profiles.build_argv(profiles.get_flag_table('ofdm'),params,self.stats,skip_keys)
+        except KeyError as e:
+            print("params:",sorted(list(params.keys())))
+            print("self.stats:",sorted(list(self.stats.keys())))
+            raise e
+        argv += ['-M',str(car_mod)]
         self.stats['modulation'] = mod
         self.stats['car_mod'] = car_mod
-        return cmd
+        return argv
     @staticmethod
     def get_options(mode='static'):
         from wfgen import profiles
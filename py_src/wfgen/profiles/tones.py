@@ -35,10 +35,9 @@ class tone(_profile):
         self._config = None
     def config(self,**kwargs):
         self._config = kwargs
-    def start(self,radio_args,params=dict()):
+    def start_argv(self,radio_args,params=dict()):
         from wfgen import profiles
-        opts = self.options
-        flgs = self.option_flags
+        table = profiles.get_flag_table('static','tone')
         hopping = False
         if "hopper" in params and params['hopper']:
             ############# This is a frequency hopping version
@@ -53,15 +52,12 @@ class tone(_profile):
             self.defaults['loop_delay'] = 0.5
             self.defaults['num_loops'] = 5
             self.defaults['linear_hop'] = None
-            opts = profiles.get_base_options('hopper') + ['json']
-            flgs = profiles.get_base_flags('hopper') + ['-j']
+            table = profiles.get_flag_table('hopper')
         if self.mod is None:
             mod = self.defaults['modulation']
         else:
             mod = self.mod
-        self.stats = self.defaults.copy()
-        if self._config is not None:
-            self.stats.update(self._config)
+        self.stats = profiles.copy_defaults(self.defaults,self._config)
 
         params, self.stats = profiles.resolve_band_freq_options(params,self.stats)
         skip_keys = []
@@ -85,32 +81,12 @@ class tone(_profile):
             skip_keys.append('BW')
         if 'duration' not in params:
             skip_keys.append('duration')
-        cmd = ' '.join([self.base_command,radio_args])
-        for idx,opt in enumerate(opts):
-            if opt in skip_keys:
-                continue
-            if opt in ["linear_hop"]:
-                if opt in params:
-                    if params[opt]:
-                        cmd += ' {0:s}'.format(flgs[idx])
-                else:
-                    if self.stats[opt]:
-                        cmd += ' {0:s}'.format(flgs[idx])
-            else:
-                if opt in ['delta','magnitude','num_tones']:
-                    continue
-                if opt in params:
-                    if params[opt] is not None:
-                        cmd += ' {0:s} {1}'.format(flgs[idx],params[opt])
-                        self.stats[opt] = params[opt]
-                else:
-                    if opt in self.stats and self.stats[opt] is not None:
-                            cmd += ' {0:s} {1}'.format(flgs[idx],self.stats[opt])
-        # if hopping:
-        cmd += ' -M {}'.format(mod)
-        print("RUNNING WITH THIS:\n",cmd,sep='')
+        argv = [self.base_command,*profiles.split_radio_args(radio_args)]
+        ### delta/magnitude/num_tones aren't flags of wfgen_tone
+        argv += profiles.build_argv(table,params,self.stats,skip_keys+['delta','magnitude','num_tones'],missing_ok=True)
+        argv += ['-M',str(mod)]
         self.stats['modulation'] = mod
-        return cmd
+        return argv
     def get_options(self):
         return self.options
 
@@ -148,15 +124,13 @@ class multitone(_profile):
         self._config = None
     def config(self,**kwargs):
         self._config = kwargs
-    def start(self,radio_args,params=dict()):
+    def start_argv(self,radio_args,params=dict()):
         from wfgen import profiles
         if self.mod is None:
             mod = self.defaults['modulation']
         else:
             mod = self.mod
-        self.stats = self.defaults.copy()
-        if self._config is not None:
-            self.stats.update(self._config)
+        self.stats = profiles.copy_defaults(self.defaults,self._config)
         limiter = int(params['num_tones']) if 'num_tones' in params else self.stats['num_tones']
         if 'delta' in params:
             if not isinstance(params['delta'],list) and limiter > 1:
@@ -182,33 +156,23 @@ class multitone(_profile):
 
         params, self.stats = profiles.resolve_band_freq_options(params,self.stats)
 
-        cmd = ' '.join([self.base_command,radio_args])
-        for idx,opt in enumerate(self.options):
-            repeater = False
+        argv = [self.base_command,*profiles.split_radio_args(radio_args)]
+        for opt,flag in profiles.get_flag_table('static','tones'):
             if opt in ['delta','magnitude']:
-                repeater = True
-            if opt in params:
-                if params[opt] is not None:
-                    if repeater == True:
-                        for opt_idx in range(len(params[opt])):
-                            cmd += ' {0:s} {1}'.format(self.option_flags[idx],params[opt][opt_idx])
+                ### one flag per tone, kept as a list under 'deltas'/'magnitudes'
+                if opt in params:
+                    if params[opt] is not None:
+                        for value in params[opt]:
+                            argv += [flag,str(value)]
                         self.stats[''.join([opt,'s'])] = params[opt]
-                    else:
-                        cmd += ' {0:s} {1}'.format(self.option_flags[idx],params[opt])
-                        self.stats[opt] = params[opt]
-            else:
-                if repeater == True:
-                    key = ''.join([opt,'s'])
-                    for opt_idx in range(len(self.stats[key])):
-                        cmd += ' {0:s} {1}'.format(self.option_flags[idx],self.stats[key][opt_idx])
                 else:
-                    if self.stats[opt] is not None:
-                        cmd += ' {0:s} {1}'.format(self.option_flags[idx],self.stats[opt])
+                    for value in self.stats[''.join([opt,'s'])]:
+                        argv += [flag,str(value)]
+            else:
+                argv += profiles.build_argv(((opt,flag),),params,self.stats)
         self.stats['modulation'] = mod
-        # if hopping:
-        cmd += ' -M {}'.format(mod)
-        print("RUNNING WITH THIS:\n",cmd,sep='')
-        return cmd
+        argv += ['-M',str(mod)]
+        return argv
     def get_options(self):
         return self.options
 
@@ -245,15 +209,13 @@ class emanation_exponential(_profile):
         self._config = None
     def config(self,**kwargs):
         self._config = kwargs
-    def start(self,radio_args,params=dict()):
+    def start_argv(self,radio_args,params=dict()):
         from wfgen import profiles
         if self.mod is None:
             mod = self.defaults['modulation']
         else:
             mod = self.mod
-        self.stats = self.defaults.copy()
-        if self._config is not None:
-            self.stats.update(self._config)
+        self.stats = profiles.copy_defaults(self.defaults,self._config)
         limiter = int(params['num_tones']) if 'num_tones' in params else self.stats['num_tones']
         if 'delta' not in params:
             base = [(x-(limiter-1)/2)*self.stats['delta']*(0.8/(limiter-1)) for x in range(limiter)]
@@ -278,32 +240,20 @@ class emanation_exponential(_profile):
 
         params, self.stats = profiles.resolve_band_freq_options(params,self.stats)
 
-        cmd = ' '.join([self.base_command,radio_args])
-        for idx,opt in enumerate(self.options):
-            tweak = False
+        argv = [self.base_command,*profiles.split_radio_args(radio_args)]
+        for opt,flag in profiles.get_flag_table('static','tones'):
             if opt in ['delta','magnitude']:
+                ### one flag per tone, from the 'deltas'/'magnitudes' worked out above
                 opt += 's'
-                tweak = True
-            if opt in params:
-                if params[opt] is not None:
-                    if tweak == True:
-                        for opt_idx in range(len(params[opt])):
-                            cmd += ' {0:s} {1}'.format(self.option_flags[idx],params[opt][opt_idx])
-                        self.stats[opt] = params[opt]
-                    else:
-                        cmd += ' {0:s} {1}'.format(self.option_flags[idx],params[opt])
-                        self.stats[opt] = params[opt]
+                values = params[opt] if opt in params else self.stats[opt]
+                if values is not None:
+                    for value in values:
+                        argv += [flag,str(value)]
+                    self.stats[opt] = values
             else:
-                if tweak == True:
-                    for opt_idx in range(len(self.stats[opt])):
-                        cmd += ' {0:s} {1}'.format(self.option_flags[idx],self.stats[opt][opt_idx])
-                else:
-                    if self.stats[opt] is not None:
-                        cmd += ' {0:s} {1}'.format(self.option_flags[idx],self.stats[opt])
+                argv += profiles.build_argv(((opt,flag),),params,self.stats)
         self.stats['modulation'] = mod
-        # if hopping:
-        cmd += ' -M {}'.format(mod)
-        print("RUNNING WITH THIS:\n",cmd,sep='')
-        return cmd
+        argv += ['-M',str(mod)]
+        return argv
     def get_options(self):
         return self.options
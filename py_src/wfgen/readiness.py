@@ -0,0 +1,108 @@
+import os
+import time
+import multiprocessing as mp
+import multiprocessing.connection
+
+READY_FD_ENV = 'WFGEN_READY_FD'
+
+
+class ReadyPipe(object):
+    """
+    Pipe a wfgen_* generator reports on once it is streaming
+
+    The write end is handed to the child (pass_fds + WFGEN_READY_FD), which
+    writes "ready <tx_start>" with the time its first sample goes out. A
+    generator in session mode keeps it open and adds "done <start> <stop>"
+    after every burst.
+    """
+    def __init__(self):
+        self.r,self.w = os.pipe()
+        ### someone else (a ChildWatcher polling a session burst) may have drained it already
+        os.set_blocking(self.r,False)
+        self.buffer = b''
+    def env(self,base:dict=None):
+        """
+        :param base: a plain dict built once by the caller, os.environ is read (slowly) if not given
+        :return: base with WFGEN_READY_FD overlaid, base itself is left alone
+        """
+        if base is None:
+            base = os.environ
+        return {**base,READY_FD_ENV:str(self.w)}
+    def pass_fds(self):
+        return (self.w,)
+    def spawned(self):
+        """ drop the parent's copy of the write end so EOF means the child is gone """
+        if self.w is not None:
+            os.close(self.w)
+            self.w = None
+    def _read(self):
+        """ :return: False on EOF """
+        try:
+            chunk = os.read(self.r,4096)
+        except BlockingIOError:
+            return True
+        self.buffer += chunk
+        return len(chunk) > 0
+    def _pop_event(self):
+        """ :return: (event, [values]) for the first complete line, if there is one """
+        if b'\n' not in self.buffer:
+            return None
+        line,self.buffer = self.buffer.split(b'\n',1)
+        line = line.split()
+        if not line:
+            return (None,[])
+        try:
+            return (line[0].decode(),[float(x) for x in line[1:]])
+        except ValueError:
+            return (None,[])
+    def poll_event(self):
+        """ non-blocking, :return: the next event if one already came in """
+        while b'\n' not in self.buffer and mp.connection.wait([self.r],0):
+            if not self._read():
+                break
+        return self._pop_event()
+    def wait_event(self,timeout:float,watcher=None,keep_waiting=None):
+        """
+        Block until the generator reports something
+
+        :param timeout: seconds of patience
+        :param watcher: ChildWatcher to also wake on (child exit, signals)
+        :param keep_waiting: callable checked after every wakeup
+        :return: (event, [values]), or None if nothing came
+        """
+        deadline = time.time() + timeout
+        while b'\n' not in self.buffer:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return None
+            if watcher is not None:
+                exited,ready = watcher.wait(remaining,[self.r])
+            else:
+                exited,ready = [],mp.connection.wait([self.r],remaining)
+            if ready and not self._read():
+                ### EOF, the child closed it without reporting
+                return None
+            if exited:
+                ### pick up anything written right before it went away
+                return self.poll_event()
+            if keep_waiting is not None and not keep_waiting():
+                return None
+        return self._pop_event()
+    def wait(self,timeout:float,watcher=None,keep_waiting=None):
+        """
+        Block until the generator reports in
+
+        :param timeout: seconds of patience
+        :param watcher: ChildWatcher to also wake on (child exit, signals)
+        :param keep_waiting: callable checked after every wakeup
+        :return: the transmit start time, or None if it never came
+        """
+        event = self.wait_event(timeout,watcher,keep_waiting)
+        if event is None or event[0] != 'ready' or len(event[1]) != 1:
+            return None
+        return event[1][0]
+    def close(self):
+        self.spawned()
+        if self.r is not None:
+            os.close(self.r)
+            self.r = None
@@ -0,0 +1,91 @@
+import heapq
+import itertools
+from typing import List
+
+try:
+    from ..spawn import LaunchStats
+except ImportError:
+    from wfgen.spawn import LaunchStats
+
+
+class LaunchLead(object):
+    """
+    How early to launch a profile so its first sample lands on time
+
+    An exponentially weighted average of the measured launch latency (launch
+    call to the generator reporting it is transmitting) per profile, padded by
+    margin. Profiles that haven't launched yet use the default they're asked with.
+
+    :param alpha: weight of the newest measurement
+    :param margin: multiplier on the average, above 1 trades early starts for fewer late ones
+    """
+    def __init__(self,alpha:float=0.25,margin:float=1.0):
+        self.alpha   = alpha
+        self.margin  = margin
+        self.average = dict()
+    def measured(self,name:str,seconds:float):
+        if seconds is None or seconds < 0:
+            return
+        if name not in self.average:
+            self.average[name] = seconds
+        else:
+            self.average[name] += self.alpha*(seconds - self.average[name])
+    def lead(self,name:str,default:float):
+        if name not in self.average:
+            return default
+        return self.margin*self.average[name]
+
+
+class StartErrors(object):
+    """ actual minus planned start of the timed profiles, in seconds (late is positive) """
+    def __init__(self):
+        self.errors = []
+    def record(self,planned:float,actual:float):
+        self.errors.append(actual - planned)
+    def summary(self):
+        return {'late':LaunchStats._describe(self.errors),
+                'abs':LaunchStats._describe([abs(x) for x in self.errors])}
+    def __str__(self):
+        if not self.errors:
+            return "start error (no timed starts)"
+        stats = self.summary()
+        return "start error n={0:d} mean={1:+.2f}ms p50={2:+.2f}ms |p95|={3:.2f}ms |max|={4:.2f}ms".format(
+            stats['late']['count'],1e3*stats['late']['mean'],1e3*stats['late']['p50'],
+            1e3*stats['abs']['p95'],1e3*stats['abs']['max'])
+
+
+class DeadlineQueue(object):
+    """
+    A radio's upcoming timed profiles, earliest start first
+
+    Starts are relative to the run start (time_boundary[0] of the script),
+    ties keep the script order.
+    """
+    def __init__(self,timed_profiles:List[list]=()):
+        self.heap  = []
+        self.order = itertools.count()
+        for config,boundary in timed_profiles:
+            self.push(config,boundary)
+    def __len__(self):
+        return len(self.heap)
+    def push(self,config:dict,boundary:list):
+        heapq.heappush(self.heap,(boundary[0],next(self.order),config,boundary))
+    def peek(self):
+        """ :return: (config, time_boundary) of the next start, or None """
+        if not self.heap:
+            return None
+        return self.heap[0][2],self.heap[0][3]
+    def pop(self):
+        _,_,config,boundary = heapq.heappop(self.heap)
+        return config,boundary
+    def drop_closed(self,now:float):
+        """
+        Discard the profiles whose window ended before now (relative time)
+
+        :return: how many were dropped
+        """
+        dropped = 0
+        while self.heap and self.heap[0][3][1] is not None and self.heap[0][3][1] <= now:
+            heapq.heappop(self.heap)
+            dropped += 1
+        return dropped
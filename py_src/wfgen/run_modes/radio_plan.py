@@ -0,0 +1,169 @@
+import math
+import heapq
+import bisect
+import numpy as np
+from typing import Dict,List
+
+NEVER = float('-inf')
+INF = float('inf')
+
+
+class radio_plan_tracker(object):
+    """
+    When a radio is reserved, as sorted non-overlapping [start, stop] intervals
+
+    Intervals are closed, a window touching a reservation is not available.
+    Lookups bisect the starts (reservations don't overlap, so the stops are
+    sorted too), reserve/release are a bisect plus a list insert/delete.
+    """
+    def __init__(self,radio_idx,dev,runtime=INF):
+        self.radio_idx = radio_idx
+        self.dev = dev
+        self.runtime = runtime
+        self.starts = []
+        self.stops = []
+    @property
+    def occupied(self):
+        return list(zip(self.starts,self.stops))
+    def __len__(self):
+        return len(self.starts)
+    def available(self,start,stop):
+        ### the last reservation starting by stop is the only one that can reach back to start
+        idx = bisect.bisect_right(self.starts,stop)
+        return idx == 0 or self.stops[idx-1] < start
+    def reserve(self,start,stop):
+        if stop < start:
+            raise ValueError("Can't reserve [{0!s}, {1!s}], it ends before it starts".format(start,stop))
+        if not self.available(start,stop):
+            raise ValueError("Radio {0!s} is already reserved during [{1!s}, {2!s}]".format(self.radio_idx,start,stop))
+        idx = bisect.bisect_right(self.starts,start)
+        self.starts.insert(idx,start)
+        self.stops.insert(idx,stop)
+    def release(self,start,stop):
+        """ :return: False if [start, stop] wasn't reserved """
+        idx = bisect.bisect_left(self.starts,start)
+        if idx == len(self.starts) or self.starts[idx] != start or self.stops[idx] != stop:
+            return False
+        del self.starts[idx]
+        del self.stops[idx]
+        return True
+    def next_free(self,start,duration=0.0):
+        """ :return: the earliest time at or after start a window of duration is available """
+        idx = bisect.bisect_right(self.starts,start)
+        if idx > 0 and self.stops[idx-1] >= start:
+            start = math.nextafter(self.stops[idx-1],INF)
+        while idx < len(self.starts) and self.starts[idx] <= start + duration:
+            start = math.nextafter(self.stops[idx],INF)
+            idx += 1
+        return start
+
+
+def assign_radios(time_windows:List[list],sources:List[str],radio_count:int,pinned:Dict[str,int]=dict()):
+    """
+    Interval partitioning of replayed signals onto radios
+
+    Signals are taken by start time and go to a radio that is free by then
+    (a radio is busy through the stop of its last signal, touching windows
+    conflict). Free radios are interchangeable for everything that starts
+    later, so a signal is only dropped when every radio is busy, and the
+    radios used are the fewest the script allows.
+
+    Within that, a source's signals stay on the radio it last used when it's
+    free, and sources that are one of the radios (pinned) only ever go there.
+    Unpinned signals take a radio already in use over a fresh one, and the
+    pinned radios last (again in use before never used).
+
+    :param time_windows: [start, stop] per signal
+    :param sources: the source of each signal
+    :param pinned: source -> radio index, for sources that are a radio
+    :return: the radio index per signal, None for the signals that couldn't be placed
+    """
+    order = sorted(range(len(time_windows)),key=lambda x: (time_windows[x][0],x))
+    free_at = [NEVER]*radio_count
+    pinned_radios = set(pinned.values())
+    ### (free at, radio) of the unpinned and pinned radios in use -- entries go
+    ### stale when the radio is taken off-heap, checked against free_at
+    heaps = ([],[])
+    ### never used, popped lowest index first (a pinned one can go stale when its own source takes it)
+    fresh = [idx for idx in reversed(range(radio_count)) if idx not in pinned_radios]
+    fresh_pinned = sorted(pinned_radios,reverse=True)
+    last_radio = dict()
+    assigned = [None]*len(time_windows)
+    def take(radio,start,stop):
+        free_at[radio] = max(free_at[radio],stop)
+        heapq.heappush(heaps[radio in pinned_radios],(free_at[radio],radio))
+        return radio
+    def first_free(heap,start):
+        while heap:
+            when,radio = heap[0]
+            if when != free_at[radio]:
+                heapq.heappop(heap)     ### stale
+                continue
+            if when >= start:
+                return None
+            heapq.heappop(heap)
+            return radio
+        return None
+    for sig_idx in order:
+        start,stop = time_windows[sig_idx]
+        src = sources[sig_idx]
+        if src in pinned:
+            radio = pinned[src]
+            if free_at[radio] < start:
+                assigned[sig_idx] = take(radio,start,stop)
+            continue
+        radio = last_radio.get(src)
+        if radio is None or free_at[radio] >= start:
+            radio = first_free(heaps[0],start)
+            if radio is None and fresh:
+                radio = fresh.pop()
+            if radio is None:
+                radio = first_free(heaps[1],start)
+            while radio is None and fresh_pinned:
+                radio = fresh_pinned.pop()
+                if free_at[radio] != NEVER:
+                    radio = None
+        if radio is None:
+            continue
+        assigned[sig_idx] = take(radio,start,stop)
+        last_radio[src] = radio
+    return assigned
+
+
+def pin_sources(sources:List[dict],radios:List[str]):
+    """
+    The pinned argument of assign_radios for a truth file's sources
+
+    Only radios some signal actually came from (a device_origin) are pinned,
+    every other radio is free to pack unpinned signals onto.
+
+    :param sources: the truth file's sources, with their device_origin
+    :param radios: radio args, in radio index order
+    :return: source -> radio index
+    """
+    origins = set([x['device_origin'] for x in sources if len(x['device_origin'])])
+    return dict([(dev,idx) for idx,dev in enumerate(radios) if dev in origins])
+
+
+def concurrency(time_windows:List[list]):
+    """
+    How many windows are on at once, a sweep over their starts (+1) and stops (-1)
+
+    Windows are closed like the tracker's, so at a tie the starts count before
+    the stops and windows that only touch add up.
+
+    :return: (peak, time of the peak, times, counts) -- counts[i] windows are
+        on from times[i] until times[i+1] (the peak can be higher than any of
+        them when it's only the instant two windows touch)
+    """
+    windows = np.asarray(time_windows,dtype=float).reshape(-1,2)
+    if len(windows) == 0:
+        return 0,None,np.zeros(0),np.zeros(0,dtype=int)
+    times = np.concatenate([windows[:,0],windows[:,1]])
+    steps = np.concatenate([np.ones(len(windows),dtype=int),-np.ones(len(windows),dtype=int)])
+    order = np.lexsort((-steps,times))
+    times,levels = times[order],np.cumsum(steps[order])
+    peak = int(np.argmax(levels))
+    ### the level after the last event at each time
+    last = np.flatnonzero(np.append(times[1:] != times[:-1],True))
+    return int(levels[peak]),float(times[peak]),times[last],levels[last]
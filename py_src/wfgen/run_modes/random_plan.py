@@ -0,0 +1,201 @@
+import numpy as np
+from typing import Dict,List
+
+try:
+    from ..profiles import get_all_profile_names,extract_profile_by_name
+except ImportError:
+    from wfgen.profiles import get_all_profile_names,extract_profile_by_name
+
+_source_limits = ['gain_limits','digital_gain_limits','digital_cycle_limits']
+_signal_limits = ['freq_limits','span_limits','duration_limits']
+_energy_limits = ['bw_limits','burst_dwell_limits','burst_idle_limits']
+
+### (parameter, the limits it's drawn from)
+PLAN_KEYS = [
+    ('gain','gain_limits'),
+    ('gain_range','digital_gain_limits'),
+    ('gain_cycle','digital_cycle_limits'),
+    ('frequency','freq_limits'),
+    ('span','span_limits'),
+    ('duration','duration_limits'),
+    ('dwell_range','burst_dwell_limits'),   ### NeedRange modify
+    ('idle_range','burst_idle_limits')      ### NeedRange modify
+]
+### worked out from the drawn bandwidth, being lazy and assuming b2XX devices
+DERIVED_KEYS = ['bandwidth','rate','bw']
+MAX_RATE = 25e6  ## max bw for b210 with fc32 datatype
+MIN_RATE = 220e3 ## min bw for b210 with fc32 datatype
+
+### src_default_override, being lazy assuming b2XX for now
+_source_fallbacks = {
+    "gain_limits" : [30,60],
+    "digital_gain_limits" : 0.0,
+    "digital_cycle_limits" : 2.0,
+}
+
+def profile_limits(profile_name:str,run_defaults:dict,specifics:dict):
+    """
+    The limits a profile's bursts are drawn from: the profile defaults with the
+    run defaults and the profile specific settings laid over them
+
+    :return: (limits, extra_key_map)
+    """
+    profile = extract_profile_by_name(profile_name)
+    ### replay profiles don't carry defaults, everything comes from the run
+    run_params = dict(getattr(profile,'defaults',dict()))
+
+    ow_energy = not specifics.get('disable_energy_overwrite',False)
+    ow_signal = not specifics.get('disable_signal_overwrite',False)
+
+    ##### Assuming source needs to always be overwritten for now
+    for src_key in _source_limits:
+        if src_key in specifics:
+            run_params[src_key] = specifics[src_key]
+        elif src_key in run_defaults:
+            run_params[src_key] = run_defaults[src_key]
+        elif src_key not in run_params:
+            run_params[src_key] = _source_fallbacks[src_key]
+    if ow_signal:
+        for sig_key in _signal_limits:
+            if sig_key in specifics:
+                run_params[sig_key] = specifics[sig_key]
+            elif sig_key in run_defaults:
+                run_params[sig_key] = run_defaults[sig_key]
+    if ow_energy:
+        for eng_key in _energy_limits:
+            if eng_key in specifics:
+                run_params[eng_key] = specifics[eng_key]
+            elif eng_key in run_defaults:
+                run_params[eng_key] = run_defaults[eng_key]
+    return run_params,[tuple(x) for x in specifics.get('extra_key_map',list())]
+
+def _is_list(x):
+    return isinstance(x,(list,tuple))
+
+def draw(key:str,limits,count:int,rng:np.random.Generator):
+    """
+    count draws of wise_choice(key,limits) at once
+
+    :return: (kind, values) -- kind 'int'/'float' with a float array of
+        values, 'choice' with (options, float array of indices), or 'const'
+        with the value every draw would give
+    """
+    if limits is None or not _is_list(limits) or len(limits) == 0:
+        return 'const',limits
+    if any([_is_list(x) for x in limits]):
+        ### pick one of the ranges per draw, then draw within it
+        picks = rng.integers(0,len(limits),size=count)
+        kinds = set()
+        values = np.zeros(count)
+        options = None
+        for idx,sub_limits in enumerate(limits):
+            mask = picks == idx
+            if not mask.any():
+                continue
+            kind,sub_values = draw(key,sub_limits,int(mask.sum()),rng)
+            if kind == 'const':
+                if not isinstance(sub_values,(int,float)):
+                    raise ValueError("Can't plan {0!s}: {1!s} mixes ranges and constants".format(key,limits))
+                kind,sub_values = ('int' if isinstance(sub_values,int) else 'float'),sub_values
+            elif kind == 'choice':
+                if options is not None and sub_values[0] != options:
+                    raise ValueError("Can't plan {0!s}: {1!s} has different choices per range".format(key,limits))
+                options,sub_values = sub_values
+            kinds.add(kind)
+            values[mask] = sub_values
+        if 'choice' in kinds:
+            if len(kinds) > 1:
+                raise ValueError("Can't plan {0!s}: {1!s} mixes ranges and choices".format(key,limits))
+            return 'choice',(options,values)
+        return ('int' if kinds == {'int'} else 'float'),values
+    if len(limits) != 2:
+        raise ValueError("Can't plan {0!s}: {1!s} isn't a [low,high] range".format(key,limits))
+    if isinstance(limits[0],int):
+        return 'int',rng.integers(limits[0],limits[1],size=count,endpoint=True).astype(float)
+    if isinstance(limits[0],float):
+        return 'float',rng.uniform(limits[0],limits[1],size=count)
+    if isinstance(limits[0],str):
+        return 'choice',(list(limits),rng.integers(0,2,size=count).astype(float))
+    return 'const',limits
+
+
+class RandomPlan(object):
+    """
+    Every burst of a random run, drawn up front
+
+    Row n is the burst for instance first+n. Drawn values live in the
+    structured array rows (one float field per parameter), what isn't drawn
+    (constants, int/choice bookkeeping) in kinds per profile.
+
+    :param profiles: the profile names, rows['profile'] indexes into them
+    """
+    def __init__(self,profiles:List[str],rows:np.ndarray,limits:Dict[str,dict],kinds:Dict[str,dict],first:int=0):
+        self.profiles = list(profiles)
+        self.rows     = rows
+        self.limits   = limits
+        self.kinds    = kinds
+        self.first    = first
+    @classmethod
+    def build(cls,count:int,profiles:List[str],run_defaults:dict,profile_specifics:dict=dict(),rng=None,seed=None,first:int=0):
+        """
+        :param count: number of bursts to plan (the run's instance limit)
+        :param rng: generator to draw from, otherwise a new one from seed
+        """
+        if rng is None:
+            rng = np.random.default_rng(seed)
+        if profiles is None:
+            profiles = get_all_profile_names()
+        limits,extras = dict(),dict()
+        for name in profiles:
+            limits[name],extras[name] = profile_limits(name,run_defaults,profile_specifics.get(name,dict()))
+        fields = list(dict.fromkeys([x[0] for x in PLAN_KEYS] + [x[0] for name in profiles for x in extras[name]] + DERIVED_KEYS))
+        rows = np.zeros(count,dtype=[('profile','i4')] + [(x,'f8') for x in fields])
+        rows[:] = tuple([0] + [np.nan]*len(fields))
+        ### same pick wise_choice('profiles',...) makes
+        rows['profile'] = rng.integers(0,len(profiles),size=count)
+
+        kinds = dict()
+        for pidx,name in enumerate(profiles):
+            mask = rows['profile'] == pidx
+            n = int(mask.sum())
+            kinds[name] = dict()
+            for param,lookup in PLAN_KEYS + extras[name]:
+                if lookup not in limits[name]:
+                    raise ValueError("Can't plan {0!s} for {1!s}, there's no {2!s}".format(param,name,lookup))
+                kind,values = draw(lookup,limits[name][lookup],n,rng)
+                if kind == 'choice':
+                    kinds[name][param] = (kind,values[0])
+                    rows[param][mask] = values[1]
+                elif kind == 'const':
+                    kinds[name][param] = (kind,values)
+                else:
+                    kinds[name][param] = (kind,None)
+                    rows[param][mask] = values
+            kind,bandwidth = draw('bandwidth',limits[name]['bw_limits'],n,rng)
+            if kind == 'choice' or (kind == 'const' and not isinstance(bandwidth,(int,float))):
+                raise ValueError("Can't plan a bandwidth for {0!s} from {1!s}".format(name,limits[name]['bw_limits']))
+            bandwidth = np.broadcast_to(np.asarray(bandwidth,dtype=float),(n,))
+            rate = np.maximum(np.minimum(2*bandwidth,MAX_RATE),MIN_RATE)
+            rows['bandwidth'][mask] = bandwidth
+            rows['rate'][mask] = rate
+            rows['bw'][mask] = np.where(bandwidth > MAX_RATE,0.9,bandwidth/rate)
+            for param in DERIVED_KEYS:
+                kinds[name][param] = ('float',None)
+        return cls(profiles,rows,limits,kinds,first)
+    def __len__(self):
+        return len(self.rows)
+    def burst(self,instance:int):
+        """ :return: (profile name, run parameters) planned for instance """
+        row = self.rows[instance - self.first]
+        name = self.profiles[row['profile']]
+        params = dict(self.limits[name])
+        for param,(kind,extra) in self.kinds[name].items():
+            if kind == 'const':
+                params[param] = extra
+            elif kind == 'choice':
+                params[param] = extra[int(row[param])]
+            elif kind == 'int':
+                params[param] = int(row[param])
+            else:
+                params[param] = float(row[param])
+        return name,params
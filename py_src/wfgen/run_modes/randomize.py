@@ -5,25 +5,29 @@
 '''run_random radios 0,1 bands 2.45e9,2.47e9 duration_limits 1.0,2.0 bw_limits 200e3,1e6 profiles bpsk'''
 
 import numpy as np
-import multiprocessing as mp
-from datetime import datetime, timezone
 from typing import Dict
 import signal
 import os
 import subprocess
 import yaml
-import shlex
 import time
 
 try:
     from ..profiles import get_all_profile_names,extract_profile_by_name
+    from ..simulation import get_time,new_process,new_watcher,new_launcher,set_signal_handler
+    from ..spawn import launch_stats
+    from ..timing import BurstTiming
+    from .shared_state import SharedRunState,InstanceBlock
+    from .random_plan import RandomPlan,_source_limits,_signal_limits,_energy_limits
 except ImportError:
     from wfgen.profiles import get_all_profile_names,extract_profile_by_name
+    from wfgen.simulation import get_time,new_process,new_watcher,new_launcher,set_signal_handler
+    from wfgen.spawn import launch_stats
+    from wfgen.timing import BurstTiming
+    from wfgen.run_modes.shared_state import SharedRunState,InstanceBlock
+    from wfgen.run_modes.random_plan import RandomPlan,_source_limits,_signal_limits,_energy_limits
 
 
-_source_limits = ['gain_limits','digital_gain_limits','digital_cycle_limits']
-_signal_limits = ['freq_limits','span_limits','duration_limits']
-_energy_limits = ['bw_limits','burst_dwell_limits','burst_idle_limits']
 _per_profile_toggles = ['disable_source_overwrite','disable_signal_overwrite',
                         'disable_energy_overwrite','extra_key_map']
 
@@ -262,9 +266,10 @@ def parse_random_run_reqest(request:Dict,server_state:"ServerState"):
     if 'digital_cycle_limits' not in check_from:
         defaults['digital_cycle_limits'] = 2.0
     if check_from is request:
-        defaults['gain_limits'] = request['gain_limits']
-        defaults['digital_gain_limits'] = request['digital_gain_limits']
-        defaults['digital_cycle_limits'] = request['digital_cycle_limits']
+        ### anything left out of the request keeps the default just set
+        defaults['gain_limits'] = request.get('gain_limits',defaults.get('gain_limits'))
+        defaults['digital_gain_limits'] = request.get('digital_gain_limits',defaults.get('digital_gain_limits'))
+        defaults['digital_cycle_limits'] = request.get('digital_cycle_limits',defaults.get('digital_cycle_limits'))
 
     #### signal limits
     if 'freq_limits' not in check_from:
@@ -297,9 +302,9 @@ def parse_random_run_reqest(request:Dict,server_state:"ServerState"):
             sanity = sanity.tolist()
         check_from['duration_limits'] = sanity
     if check_from is request:
-        defaults['freq_limits'] = request['freq_limits'] if request['freq_limits'] is not None else request['bands']
-        defaults['span_limits'] = request['span_limits']
-        defaults['duration_limits'] = request['duration_limits']
+        defaults['freq_limits'] = request['freq_limits'] if request.get('freq_limits') is not None else request['bands']
+        defaults['span_limits'] = request.get('span_limits',defaults.get('span_limits'))
+        defaults['duration_limits'] = request.get('duration_limits',defaults.get('duration_limits'))
 
     #### energy limits
     if 'bw_limits' not in check_from:
@@ -309,9 +314,9 @@ def parse_random_run_reqest(request:Dict,server_state:"ServerState"):
     if 'burst_idle_limits' not in check_from:
         defaults['burst_idle_limits'] = [[0.5,1.0],[1.0,2.0]]
     if check_from is request:
-        defaults['bw_limits'] = request['bw_limits']
-        defaults['burst_dwell_limits'] = request['burst_dwell_limits']
-        defaults['burst_idle_limits'] = request['burst_idle_limits']
+        defaults['bw_limits'] = request.get('bw_limits',defaults.get('bw_limits'))
+        defaults['burst_dwell_limits'] = request.get('burst_dwell_limits',defaults.get('burst_dwell_limits'))
+        defaults['burst_idle_limits'] = request.get('burst_idle_limits',defaults.get('burst_idle_limits'))
 
     request['profile_defaults'] = defaults
 
@@ -320,7 +325,7 @@ def parse_random_run_reqest(request:Dict,server_state:"ServerState"):
         # if pp not in results:
         #     continue
 
-    proc = mp.Process(target=random_run,args=(
+    proc = new_process(target=random_run,args=(
                 radio_args,
                 request,
                 server_state.burst_instance,
@@ -344,24 +349,23 @@ def random_run(radios, run_setup, starting_instance=0, truth_template=''):
     runtime = run_setup['runtime']
     bands = run_setup['bands']
 
-    manager = mp.Manager()
-    worker_lookups = manager.dict()
-    worker_lookups['instance'] = starting_instance
-    worker_lookups['instance_limit'] = starting_instance+max_bursts
-    worker_lookups['barrier'] = manager.Barrier(len(radios))
-    worker_lookups['semaphore'] = manager.Semaphore(1)
-    worker_lookups['start_time'] = None ## First worker to claim semaphore sets this
-    worker_lookups['end_time'] = None  ## First worker to claim semaphore sets this
+    ### instance counter and start/end times (set by the first worker on the air) live in shared memory
+    run_state = SharedRunState(starting_instance,starting_instance+max_bursts)
+    ### everything else is fixed for the run, each worker gets its own copy when it starts
+    worker_lookups = dict()
+    worker_lookups['instance_block'] = run_setup.get('instance_block',1)
     worker_lookups['json_template'] = truth_template
-    worker_lookups['default_params'] = run_setup['profile_defaults']
-    worker_lookups['profile_specifics'] = dict([
+    worker_lookups['startup_patience_limit'] = 20.0 #seconds
+
+    rng = np.random.default_rng(seed)
+    ### every burst of the run is drawn here, before any radio keys up, workers just play their instance's row
+    profile_specifics = dict([
         (x,run_setup[x]) for x in \
         (profiles if profiles is not None else get_all_profile_names()) \
         if x in run_setup
     ])
-    worker_lookups['startup_patience_limit'] = 20.0 #seconds
-
-    rng = np.random.default_rng(seed)
+    worker_lookups['plan'] = RandomPlan.build(max_bursts,profiles,run_setup['profile_defaults'],
+                                              profile_specifics,rng=rng,first=starting_instance)
     workers = [None]*len(radios)
 
     early_terminate = 0
@@ -379,23 +383,24 @@ def random_run(radios, run_setup, starting_instance=0, truth_template=''):
     def enable_sig_handler():
         sig_set = {signal.SIGINT,signal.SIGTERM}
         for sig in sig_set:
-            signal.signal(sig,sig_handler)
+            set_signal_handler(sig,sig_handler)
     def disable_sig_handler():
         nonlocal default_term_handler,default_int_handler
-        signal.signal(signal.SIGINT,default_int_handler)
-        signal.signal(signal.SIGTERM,default_term_handler)
+        set_signal_handler(signal.SIGINT,default_int_handler)
+        set_signal_handler(signal.SIGTERM,default_term_handler)
 
     enable_sig_handler()
+    watcher = new_watcher()
+    watcher.wake_on_signals()
 
     worker_n = 0
     def reasons_to_loop():
-        nonlocal early_terminate,starting_instance,max_bursts,worker_lookups
+        nonlocal early_terminate,run_state
+        end_time = run_state.end_time
         return (
             early_terminate == 0,
-            worker_lookups['instance'] < starting_instance+max_bursts,
-            worker_lookups['end_time'] is None or \
-                (worker_lookups['end_time'] is not None and \
-                    datetime.now(timezone.utc).timestamp() < worker_lookups['end_time'])
+            run_state.remaining() > 0,
+            end_time is None or get_time() < end_time
         )
     while all(reasons_to_loop()):
         if any([x is None for x in workers]):
@@ -408,19 +413,23 @@ def random_run(radios, run_setup, starting_instance=0, truth_template=''):
                         dtype=np.uint64).item() for _ in range(10)]
 
                 disable_sig_handler() ## don't carry the interrupt handler over
-                workers[idx] = mp.Process(target=random_radio_run_worker,
-                    args=(worker_n,radios[idx],profiles,runtime,bands,worker_lookups))
+                workers[idx] = new_process(target=random_radio_run_worker,
+                    args=(worker_n,radios[idx],profiles,runtime,bands,worker_lookups,run_state))
                 workers[idx].start()
+                watcher.add(workers[idx])
                 enable_sig_handler()
                 worker_n += 1
-        if any([not x.is_alive() for x in workers]):
-            #### some signal has finished (should it??), cleanup to start a new one
-            for idx in range(len(radios)):
-                if workers[idx].is_alive():
-                    continue
-                workers[idx].join()
-                workers[idx].close()
-                workers[idx] = None
+        ### sleep until a worker exits, a signal lands or the run time is up
+        end_time = run_state.end_time
+        timeout = None if end_time is None else end_time - get_time()
+        exited,_ = watcher.wait(timeout)
+        #### some signal has finished (should it??), cleanup to start a new one
+        for w in exited:
+            idx = workers.index(w)
+            watcher.discard(w)
+            workers[idx].join()
+            workers[idx].close()
+            workers[idx] = None
     print(worker_n,'hmmm',reasons_to_loop())
     for idx in range(len(radios)):
         if workers[idx] is not None and workers[idx].is_alive():
@@ -430,6 +439,7 @@ def random_run(radios, run_setup, starting_instance=0, truth_template=''):
             workers[idx].join()
             workers[idx].close()
             workers[idx] = None
+    watcher.close()
 
 
 def filter_choice(key, value_choices, limiter):
@@ -612,7 +622,7 @@ def narrow_choice(key, rng, value_choices):
     print(debug_out,value_choices)
     return value_choices ## guessing this is scalar at this point
 
-def random_radio_run_worker(worker_id,uhd_args,profiles,runtime,run_bands,shared_dict):
+def random_radio_run_worker(worker_id,uhd_args,profiles,runtime,run_bands,shared_dict,run_state:SharedRunState):
     # shared_dict['semaphore'].acquire()
     # if shared_dict['start_time'] is None:
     #     now = datetime.now(timezone.utc)
@@ -636,15 +646,9 @@ def random_radio_run_worker(worker_id,uhd_args,profiles,runtime,run_bands,shared
     else:
         dev_serial = tail
 
-    if profiles is None:
-        profiles = get_all_profile_names()
-    run_defaults = shared_dict['default_params'].copy()
-
-    source_limits = dict([(x,y) for x,y in run_defaults.items() if x in _source_limits])
-    source_limits['patience'] = shared_dict['startup_patience_limit']
+    plan = shared_dict['plan']
     json_template = shared_dict['json_template']
-    profile_specifics = shared_dict['profile_specifics']
-    patience = wise_choice('patience',source_limits['patience'],rng)
+    patience = wise_choice('patience',shared_dict['startup_patience_limit'],rng)
 
 
     early_terminate = 0
@@ -660,194 +664,98 @@ def random_radio_run_worker(worker_id,uhd_args,profiles,runtime,run_bands,shared
     def enable_sig_handler():
         sig_set = {signal.SIGINT,signal.SIGTERM}
         for sig in sig_set:
-            signal.signal(sig,sig_handler)
+            set_signal_handler(sig,sig_handler)
     def disable_sig_handler():
         nonlocal default_term_handler,default_int_handler
-        signal.signal(signal.SIGINT,default_int_handler)
-        signal.signal(signal.SIGTERM,default_term_handler)
+        set_signal_handler(signal.SIGINT,default_int_handler)
+        set_signal_handler(signal.SIGTERM,default_term_handler)
 
     enable_sig_handler()
+    watcher = new_watcher()
+    ### one-shot generators, or persistent sessions with WFGEN_SESSIONS=1 (wfgen_linmod only)
+    launcher = new_launcher()
+    watcher.wake_on_signals()
 
+    instances = InstanceBlock(run_state,shared_dict['instance_block'])
     start_time_extracted = False
     def reasons_to_loop():
-        nonlocal early_terminate,shared_dict
+        nonlocal early_terminate,run_state
+        end_time = run_state.end_time
         return (
             early_terminate == 0,
-            (datetime.now(timezone.utc).timestamp() < shared_dict['end_time'] \
-                if shared_dict['end_time'] is not None else True)
+            (get_time() < end_time if end_time is not None else True)
         )
     while all(reasons_to_loop()):
         ### Ok, radio selected, so just start sending signals
-        print(worker_id,'A',runtime,shared_dict['start_time'],shared_dict['end_time'])
-        shared_dict['semaphore'].acquire()
-        if shared_dict['instance'] >= shared_dict['instance_limit']:
-            shared_dict['semaphore'].release()
+        print(worker_id,'A',runtime,run_state.start_time,run_state.end_time)
+        instance = instances.next()
+        if instance is None:
             break
-        instance = shared_dict['instance']
-        shared_dict['instance'] = instance + 1
-        shared_dict['semaphore'].release()
-        #### chose a signal
-        profile_name = wise_choice('profiles',profiles,rng)
+        #### the signal and its parameters were all chosen up front
+        profile_name,run_params = plan.burst(instance)
         profile = extract_profile_by_name(profile_name)
-        this_run = run_defaults.copy()
-        specifics = profile_specifics[profile_name] if profile_name in profile_specifics else dict()
-        preference = profile.defaults.copy() ### Get the defaults of the profile
-        print(worker_id,'B')
-
-        run_params = preference
-
-        ow_energy = True if 'disable_energy_overwrite' not in specifics else not specifics['disable_energy_overwrite']
-        ow_signal = True if 'disable_signal_overwrite' not in specifics else not specifics['disable_signal_overwrite']
-        ow_source = True if 'disable_source_overwrite' not in specifics else not specifics['disable_source_overwrite']
-        extra_key_map = list() if 'extra_key_map' not in specifics else specifics['extra_key_map']
-
-        # if not ow_source:
-            # print("Not overwriting source") ### not really needed initially
-        ##### Assuming source needs to always be overwritten for now
-        src_default_override = {##being lazy assuming b2XX for now
-            "gain_limits" : [30,60],
-            "digital_gain_limits" : 0.0,
-            "digital_cycle_limits" : 2.0,
-        }
-        for src_key in _source_limits:
-            if src_key in specifics:
-                run_params[src_key] = specifics[src_key]
-            elif src_key in this_run:
-                run_params[src_key] = this_run[src_key]
-            elif src_key not in run_params:
-                run_params[src_key] = src_default_override[src_key]
-
-        if ow_signal:
-            for sig_key in _signal_limits:
-                if sig_key in specifics:
-                    run_params[sig_key] = specifics[sig_key]
-                elif sig_key in this_run:
-                    run_params[sig_key] = this_run[sig_key]
-
-        if ow_energy:
-            for eng_key in _energy_limits:
-                if eng_key in specifics:
-                    run_params[eng_key] = specifics[eng_key]
-                elif sig_key in this_run:
-                    run_params[eng_key] = this_run[eng_key]
-
-
         print(worker_id,'C')
         json_truth = json_template.format(serial=dev_serial,instance=instance)
-        
-        #### Time to make some choices
-        mapping_keys = [
-            ('gain','gain_limits'),
-            ('gain_range','digital_gain_limits'),
-            ('gain_cycle','digital_cycle_limits'),
-            ('frequency','freq_limits'),
-            ('span','span_limits'),
-            ('duration','duration_limits'),
-            ('dwell_range','burst_dwell_limits'),   ### NeedRange modify
-            ('idle_range','burst_idle_limits')      ### NeedRange modify
-        ] + extra_key_map
-        ########## (['rate','bw'],['bw_limits',uhd_args]),#### this will likely be tweaked
-        ### need a unique way to set BW and SampleRate
-
-
-        # for signal_key in signal_level_musts:
-        #     if signal_key not in run_params:
-        #         continue ## doubt this will happen, but just in case
-        #     value = run_params[signal_key]
-        #     if signal_key == 'freq_limits':
-        #         value = filter_choice(signal_key,value,run_bands)
-        #     if signal_key == 'duration_limits':
-        #         value = filter_choice(signal_key,value,(0,shared_dict['end_time']-datetime.now(timezone.utc).timestamp()))
-        #     if isinstance(value,(tuple,list)):
-        #         value = [x for x in value]
-        #         if signal_key in ['frequency','rate','bw']:
-        #             if signal_key == 'frequency':
-        #                 value = filter_choice(signal_key,value,run_params['freq_limits'])
-        #             if signal_key == 'rate':
-        #                 value = filter_choice(signal_key,value,run_params['bw_limits'])
-        #             if signal_key == 'bw':
-        #                 value = filter_choice(signal_key,value,run_params['bw_limits'])
-        #         value = narrow_choice(signal_key,rng,value)
-        #     #### this should be a valid value for the key now>>>>>>> hopefully
-        #     run_params[signal_key] = value
-        for mk_param,mk_lookup in mapping_keys:
-            if mk_param in ['rate','bw']:
-                ## oh boy
-                print("sorry----ignoring this request for now")
-                pass
-            try:
-                run_params[mk_param] = wise_choice(mk_lookup,run_params[mk_lookup],rng)
-            except Exception as e:
-                print("Can't seem to handle the ({},{}) mapping key right now".format(mk_param,mk_lookup))
-                try:
-                    print("    Can lookup the value as ({})".format(run_params[mk_lookup]))
-                except:
-                    pass
-                raise e
         run_params['json'] = json_truth
 
-
-        ##### handle BW and SampleRate here now
-        ### being lazy for now assuming b2XX devices
-        bandwidth = wise_choice('bandwidth',run_params['bw_limits'],rng)
-        rate = min(2*bandwidth,25e6) ## max bw for b210 with fc32 datatype
-        run_params['rate'] = max(rate,220e3) ## min bw for b210 with fc32 datatype
-        run_params['bw'] = 0.9 if bandwidth > 25e6 else bandwidth/run_params['rate']
-        #######################################
-
         print(worker_id,'D',json_truth)
 
         sig_dur = run_params['duration']
-        launch_env = os.environ.copy()
-        launch_command = profile.start("-a {0:s}".format(uhd_args),run_params)
-        print(worker_id,'==',launch_command)
+        command = profile.start_argv("-a {0:s}".format(uhd_args),run_params)
+        if not isinstance(command,list):
+            raise RuntimeError("Couldn't start {0!s}: {1!s}".format(profile.get_name(),command))
+        print(worker_id,'==',' '.join(command))
+        timing = BurstTiming(json_truth,profile_name,dev_serial,instance,run_params.get('mode'))
         disable_sig_handler()
-        command = shlex.split(launch_command)
-        proc = subprocess.Popen(command,shell=False,env=launch_env)
+        timing.mark('launch')
+        proc = launcher.start(command)
+        watcher.add(proc)
         enable_sig_handler()
-        crit_err_check = datetime.now(timezone.utc).timestamp()
-        if crit_err_check != True:
-            while(not os.path.isfile(json_truth)):
-                # waiting for the usrp to spin up im the exec/proc
-                if datetime.now(timezone.utc).timestamp() - crit_err_check > patience:
-                    crit_err_check = True
-                    break
+        # waiting for the usrp to spin up im the exec/proc
+        tx_start = launcher.wait_ready(proc,patience,watcher,lambda: early_terminate == 0)
+        timing.mark('ready')
+        crit_err_check = tx_start is None
         print(worker_id,'E',sig_dur,crit_err_check)
         if crit_err_check == True:
             ### Uh oh, patience has ended
             if proc.poll() is None:
+                timing.mark('sigint')
                 proc.send_signal(signal.SIGINT)
         else:
-            sig_start_at = datetime.now(timezone.utc).timestamp()
+            sig_start_at = tx_start
+            timing.mark('first_sample',tx_start)
             ######################
             if not start_time_extracted:
                 ### every worker will need to extract the start time and end time
-                shared_dict['semaphore'].acquire()
-                if shared_dict['start_time'] is None:
-                    shared_dict['start_time'] = start_time = sig_start_at
-                    shared_dict['end_time'] = end_time = sig_start_at + runtime
-                else:
-                    start_time = shared_dict['start_time']
-                    end_time = shared_dict['end_time']
-                shared_dict['semaphore'].release()
+                start_time,end_time = run_state.set_window_once(sig_start_at,sig_start_at + runtime)
                 start_time_extracted = True
             ######################
+            timing.mark('planned_stop',min(sig_start_at+sig_dur,end_time))
             early_exit_occured = False
             def additional_keep_looping():
                 return (reasons_to_loop() \
-                    + (datetime.now(timezone.utc).timestamp() < sig_start_at+sig_dur,))
+                    + (get_time() < sig_start_at+sig_dur,))
             while all(additional_keep_looping()):
                 #### let the signal run until signal duration is up
-                if proc.poll() is not None:
+                stop_at = min(sig_start_at+sig_dur,end_time)
+                exited,_ = watcher.wait(stop_at - get_time())
+                if exited:
                     #### this process has ended on it's own??
                     early_exit_occured = True
                     break
             print(worker_id,'F',additional_keep_looping(),early_exit_occured)
             if proc.poll() is None:
                 ### time to wrap up now signal
+                timing.mark('sigint')
                 proc.send_signal(signal.SIGINT)
         print(worker_id,'G')
         proc.wait() ### wait for it to write out the truth
+        timing.mark('exit')
+        timing.write()
+        watcher.discard(proc)
         print(worker_id,'H')
 
     print(worker_id,"end",reasons_to_loop())###why did this proc end?
+    print(worker_id,launch_stats)
+    launcher.close()
+    watcher.close()
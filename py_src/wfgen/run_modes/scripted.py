@@ -4,35 +4,40 @@ import os
 import json,yaml
 import numpy as np
 from copy import copy,deepcopy
-from scipy.stats import mode,chi2,t as t_student
-from scipy.special import erf
-from scipy.optimize import curve_fit
+### scipy is only needed for the script stats, it's imported where it's used
+### (it was most of the time spent importing wfgen)
 from typing import Dict
 import warnings
 
-import multiprocessing as mp
 import signal
-from datetime import datetime, timezone
-import shlex
 import subprocess
 import time
 import glob
 
-import matplotlib.pyplot as plt
-
 try:
     from ..profiles import get_all_profile_names,extract_profile_by_name,get_replay_profile_names
+    from ..simulation import get_time,new_process,new_watcher,new_launcher,set_signal_handler
+    from ..spawn import launch_stats
+    from ..timing import BurstTiming
+    from ..truth_store import TruthStore
+    from .shared_state import SharedRunState,InstanceBlock
+    from .deadlines import DeadlineQueue,LaunchLead,StartErrors
+    from .radio_plan import radio_plan_tracker,concurrency
 except ImportError:
     from wfgen.profiles import get_all_profile_names,extract_profile_by_name,get_replay_profile_names
+    from wfgen.simulation import get_time,new_process,new_watcher,new_launcher,set_signal_handler
+    from wfgen.spawn import launch_stats
+    from wfgen.timing import BurstTiming
+    from wfgen.truth_store import TruthStore
+    from wfgen.run_modes.shared_state import SharedRunState,InstanceBlock
+    from wfgen.run_modes.deadlines import DeadlineQueue,LaunchLead,StartErrors
+    from wfgen.run_modes.radio_plan import radio_plan_tracker,concurrency
 
 RNG_TYPE = np.random.Generator
 
 # DEBUG_TIMEOUT = 240
 DEBUG_TIMEOUT = float('inf')
 
-def get_time():
-    return datetime.now(timezone.utc).timestamp()
-
 scripted_parameter_keys = {
     ### system/process params
     'system':[
@@ -146,16 +151,31 @@ def load_script(filepath):
             raise RuntimeError("Invalid json file found in load_script(1)")
         if 'reports' in base_info:
             flags = 3
-    if flags in [1,2,3]:
-        try:
-            with open(filepath,'r') as fp:
-                reports = json.load(fp)
-        except:
-            raise RuntimeError("Invalid json file found in load_script(2)")
-        energies = [x for x in reports['reports'] if x['report_type'] == 'energy']
-        signals  = [x for x in reports['reports'] if x['report_type'] == 'signal']
-        sources  = [x for x in reports['reports'] if x['report_type'] == 'source']
-        energies,signals,sources = normalize_times(energies,signals,sources)
+    elif filepath.endswith('.sqlite'):
+        flags = 4 # truth store
+    if flags in [1,2,3,4]:
+        start_time = None
+        if flags == 4:
+            with TruthStore(filepath,readonly=True) as store:
+                signals  = list(store.query('signal'))
+                sources  = list(store.query('source'))
+                ### only the energies behind a dwell/period (signals with more than one) are read
+                wanted   = set()
+                for sig in signals:
+                    if len(sig.get('energy_set',[])) > 1:
+                        wanted.update(sig['energy_set'])
+                energies = list(store.query_names('energy',sorted(wanted)))
+                start_time = store.first_start(['energy','signal'])
+        else:
+            try:
+                with open(filepath,'r') as fp:
+                    reports = json.load(fp)
+            except:
+                raise RuntimeError("Invalid json file found in load_script(2)")
+            energies = [x for x in reports['reports'] if x['report_type'] == 'energy']
+            signals  = [x for x in reports['reports'] if x['report_type'] == 'signal']
+            sources  = [x for x in reports['reports'] if x['report_type'] == 'source']
+        energies,signals,sources = normalize_times(energies,signals,sources,start_time)
         for idx,sig in enumerate(signals):
             energy_set,energy_dict = orgainize_energy_set(energies,sig)
             if len(energy_set) > 1:
@@ -233,14 +253,15 @@ def create_script_from_config(system_setup):
 
     return energies,signals,sources
 
-def normalize_times(energies,signals,sources):
-    start_time = float('inf')
-    for x in energies:
-        if x['time_start'] < start_time:
-            start_time = x['time_start']
-    for x in signals:
-        if x['time_start'] < start_time:
-            start_time = x['time_start']
+def normalize_times(energies,signals,sources,start_time=None):
+    if start_time is None:
+        start_time = float('inf')
+        for x in energies:
+            if x['time_start'] < start_time:
+                start_time = x['time_start']
+        for x in signals:
+            if x['time_start'] < start_time:
+                start_time = x['time_start']
 
     for idx,x in enumerate(energies):
         for k in x.keys():
@@ -354,6 +375,9 @@ def exp_sigmoid(x,x0,k):
     return sigmoid(x,2,x0,k,-1)
 
 def gauss_eval(x):
+    from scipy.special import erf
+    from scipy.optimize import curve_fit
+    from scipy.stats import t as t_student
     if x is None:
         return None
     if isinstance(x,(int,float,np.number)):
@@ -403,6 +427,7 @@ def half_normal_eval(x):
     pass
 
 def uni_eval(x):
+    from scipy.optimize import curve_fit
     if x is None:
         return None
     if isinstance(x,(int,float,np.number)):
@@ -450,6 +475,8 @@ def uni_eval(x):
             popt)
 
 def exp_eval(x):
+    from scipy.optimize import curve_fit
+    from scipy.stats import chi2
     if x is None:
         return None
     if isinstance(x,(int,float,np.number)):
@@ -681,7 +708,7 @@ def parse_script_request(request:Dict,server_state:"ServerState",use_log=False):
         if irr['radio'] not in server_state.idle_radios:
             print("Cannot use radio:",irr['radio'],"|| did cleanup not work??")
 
-    proc = mp.Process(target=scripted_run,args=(
+    proc = new_process(target=scripted_run,args=(
         runtime,
         individual_radio_requests,
         flags,
@@ -703,14 +730,12 @@ def scripted_run(runtime, available_radio_profiles, flags, initial_idx, final_id
 
     This should just keep creating work until runtime is over
     '''
-    manager = mp.Manager()
-    worker_lookups = manager.dict()
+    ### instance counter and start/end times (set by the first worker on the air) live in shared memory
+    run_state = SharedRunState(initial_idx,final_idx)
+    ### everything else is fixed for the run, each worker gets its own copy when it starts
+    worker_lookups = dict()
     worker_lookups['runtime'] = runtime
-    worker_lookups['semaphore'] = manager.Semaphore(1)
-    worker_lookups['start_time'] = None ## First worker to claim semaphore sets this
-    worker_lookups['end_time'] = None  ## First worker to claim semaphore sets this
-    worker_lookups['instance'] = initial_idx
-    worker_lookups['instance_limit'] = final_idx
+    worker_lookups['instance_block'] = toggles.get('instance_block',1)
     worker_lookups['json_template'] = truth_template
     worker_lookups['flags'] = flags
     worker_lookups['toggles'] = toggles
@@ -774,25 +799,26 @@ def scripted_run(runtime, available_radio_profiles, flags, initial_idx, final_id
     def enable_sig_handler():
         sig_set = {signal.SIGINT,signal.SIGTERM}
         for sig in sig_set:
-            signal.signal(sig,sig_handler)
+            set_signal_handler(sig,sig_handler)
     def disable_sig_handler():
         nonlocal default_term_handler,default_int_handler
-        signal.signal(signal.SIGINT,default_int_handler)
-        signal.signal(signal.SIGTERM,default_term_handler)
+        set_signal_handler(signal.SIGINT,default_int_handler)
+        set_signal_handler(signal.SIGTERM,default_term_handler)
 
     enable_sig_handler()
+    watcher = new_watcher()
+    watcher.wake_on_signals()
 
     worker_n = 0
     def reasons_to_loop():
-        nonlocal early_terminate,worker_lookups
+        nonlocal early_terminate,run_state
+        start_time,end_time = run_state.start_time,run_state.end_time
         return (
             early_terminate == 0, # not told to exit
-            worker_lookups['instance'] < worker_lookups['instance_limit'], ## still have more instances allotted
-            worker_lookups['end_time'] is None or \
-                (worker_lookups['end_time'] is not None and \
-                    get_time() < worker_lookups['end_time']), ### if end_time hasn't
+            run_state.remaining() > 0, ## still have more instances allotted
+            end_time is None or get_time() < end_time, ### if end_time hasn't
                         #### been set, keep going, but if it has been set, make sure we're not beyond it.
-            get_time() < worker_lookups['start_time']+DEBUG_TIMEOUT if worker_lookups['start_time'] is not None else True #### DEBUG
+            get_time() < start_time+DEBUG_TIMEOUT if start_time is not None else True #### DEBUG
         )
     while all(reasons_to_loop()):
         if any([x is None for x in workers]):
@@ -801,25 +827,28 @@ def scripted_run(runtime, available_radio_profiles, flags, initial_idx, final_id
                 if workers[idx] is not None:
                     continue ## running
                 disable_sig_handler()
-                workers[idx] = mp.Process(target=scripted_worker,
+                workers[idx] = new_process(target=scripted_worker,
                     args=(worker_n,radio_args[idx],
                             available_radio_profiles[idx]['profiles'],
                             seed_sets[idx],
-                            worker_lookups))
+                            worker_lookups,run_state))
                 workers[idx].start()
+                watcher.add(workers[idx])
                 # print(worker_n,"launched with",len(available_radio_profiles[idx]['profiles']),"profiles")
                 enable_sig_handler()
                 worker_n += 1
-        if any([not x.is_alive() for x in workers if x is not None]):
-            for idx in range(radio_count):
-                if workers[idx] is None:
-                    continue
-                if workers[idx].is_alive():
-                    continue
-                # print("Worker is done---",idx)
-                workers[idx].join()
-                workers[idx].close()
-                workers[idx] = None
+        ### sleep until a worker exits, a signal lands or the run time is up
+        end_time = run_state.end_time
+        if run_state.start_time is not None and DEBUG_TIMEOUT < float('inf'):
+            end_time = min(end_time,run_state.start_time+DEBUG_TIMEOUT)
+        exited,_ = watcher.wait(None if end_time is None else end_time - get_time())
+        for w in exited:
+            idx = workers.index(w)
+            # print("Worker is done---",idx)
+            watcher.discard(w)
+            workers[idx].join()
+            workers[idx].close()
+            workers[idx] = None
     # print("scripted_run",worker_n,reasons_to_loop(),(worker_lookups['end_time'],get_time()))
     log_c.log(c_logger.level_t.INFO,"scripted_worker{0} ending reasons: (EarlyTerm:{1},"
               "InstanceLimit:{2},Runtime:{3},DebugLimiter:{4})".format(*((worker_n,)+tuple([not x for x in reasons_to_loop()]))))
@@ -832,9 +861,10 @@ def scripted_run(runtime, available_radio_profiles, flags, initial_idx, final_id
             workers[idx].join()
             workers[idx].close()
             workers[idx] = None
+    watcher.close()
 
 
-def scripted_worker(worker_id, uhd_args, profiles, seed, worker_lookup):
+def scripted_worker(worker_id, uhd_args, profiles, seed, worker_lookup, run_state:SharedRunState):
 
 
     ################## Setup RNG
@@ -892,10 +922,18 @@ def scripted_worker(worker_id, uhd_args, profiles, seed, worker_lookup):
     # print(timed_profiles)
     # print(random_profiles)
 
-    timed_iter = iter(timed_profiles)
+    ### timed profiles come off a heap by start, launched early by the latency they've shown
+    schedule = DeadlineQueue(timed_profiles)
+    leads = LaunchLead()
+    start_errors = StartErrors()
     time_buffer = 0.1
     time_buffer_hopper = 19.0
     time_slack = 20.0
+    def lead_time(config):
+        if config.get('mode','static') == 'hopper':
+            ### hoppers are started early on purpose, the run window is shifted for it
+            return time_buffer_hopper
+        return leads.lead(str(config['profile']),time_buffer)
 
     early_terminate = 0
     early_exit_occured = False
@@ -911,33 +949,35 @@ def scripted_worker(worker_id, uhd_args, profiles, seed, worker_lookup):
     def enable_sig_handler():
         sig_set = {signal.SIGINT,signal.SIGTERM}
         for sig in sig_set:
-            signal.signal(sig,sig_handler)
+            set_signal_handler(sig,sig_handler)
     def disable_sig_handler():
         nonlocal default_term_handler,default_int_handler
-        signal.signal(signal.SIGINT,default_int_handler)
-        signal.signal(signal.SIGTERM,default_term_handler)
+        set_signal_handler(signal.SIGINT,default_int_handler)
+        set_signal_handler(signal.SIGTERM,default_term_handler)
 
     enable_sig_handler()
+    watcher = new_watcher()
+    ### one-shot generators, or persistent sessions with WFGEN_SESSIONS=1 (wfgen_linmod only)
+    launcher = new_launcher()
+    watcher.wake_on_signals()
 
     start_time_extracted = False
     def reasons_to_loop():
-        nonlocal early_terminate,worker_lookup
+        nonlocal early_terminate,run_state
+        end_time = run_state.end_time
         return (
             early_terminate == 0, ## was told to exit
-            (get_time() < worker_lookup['end_time'] \
-                if worker_lookup['end_time'] is not None else True) ## Loop if end_time isn't set
+            (get_time() < end_time if end_time is not None else True) ## Loop if end_time isn't set
                 ### otherwise make sure we're not overtime
         )
 
+    instances = InstanceBlock(run_state,worker_lookup.get('instance_block',1))
     def incr_instance():
-        nonlocal instance,worker_lookup
-        worker_lookup['semaphore'].acquire()
-        if worker_lookup['instance'] >= worker_lookup['instance_limit']:
-            worker_lookup['semaphore'].release()
+        nonlocal instance,instances
+        next_instance = instances.next()
+        if next_instance is None:
             return False
-        instance = worker_lookup['instance']
-        worker_lookup['instance'] = instance + 1
-        worker_lookup['semaphore'].release()
+        instance = next_instance
         return True
 
     system_start_time = None
@@ -947,7 +987,7 @@ def scripted_worker(worker_id, uhd_args, profiles, seed, worker_lookup):
     patience = 60.0
     profile_config = None
     iteration_number = -1
-    offset_time = get_time() if worker_lookup['start_time'] is None else worker_lookup['start_time']
+    offset_time = get_time() if run_state.start_time is None else run_state.start_time
     while all(reasons_to_loop()):
         # print(instance,worker_id,"A",runtime,worker_lookup['start_time'],worker_lookup['end_time'])
         # worker_lookup['semaphore'].acquire()
@@ -958,17 +998,27 @@ def scripted_worker(worker_id, uhd_args, profiles, seed, worker_lookup):
         # worker_lookup['instance'] = instance + 1
         # worker_lookup['semaphore'].release()
 
-        if profile_config is None and timed_profiles:
-            ## make a timed profile if within the timing
-            # profile_config,time_boundary = get_next_timed_set()
-            try:
-                profile_config,time_boundary = next(timed_iter)
+        if profile_config is None and schedule:
+            ## make a timed profile once it's within its lead time
+            hard_start = system_start_time if system_start_time is not None else offset_time
+            current_time = get_time() - hard_start
+            dropped = schedule.drop_closed(current_time)
+            if dropped:
+                log_c.log(c_logger.level_t.WARNING,"Skipped {} timed profiles, their windows closed before they could start".format(dropped))
+            if schedule:
+                next_config,next_boundary = schedule.peek()
+                launch_at = next_boundary[0] - lead_time(next_config)
+                if current_time < launch_at:
+                    ### sleep until it's time (a signal still wakes us)
+                    watcher.wait(launch_at - current_time)
+                    continue
+                profile_config,time_boundary = schedule.pop()
+                ### a hopper going out time_buffer_hopper early is its plan, not a start error
+                planned_start = hard_start + time_boundary[0] - (time_buffer_hopper if profile_config.get('mode','static') == 'hopper' else 0.0)
                 orig_config = deepcopy(profile_config)
                 signal_start_time = None
                 signal_end_time = None
                 iteration_number += 1
-            except StopIteration:
-                pass
         if profile_config is None and random_profiles:
             ## make a random profile if there are any
             profile_config = rng.choice(profiles)
@@ -982,16 +1032,6 @@ def scripted_worker(worker_id, uhd_args, profiles, seed, worker_lookup):
             if 'mode' not in profile_config:
                 profile_config['mode'] = 'static'
             is_hopper = profile_config['mode'] == 'hopper'
-
-            if time_boundary is not None:
-                hard_start = system_start_time if system_start_time is not None else offset_time
-                current_time = get_time() - hard_start
-                if not (current_time >= time_boundary[0] - (time_buffer if not is_hopper else time_buffer_hopper)):
-                    continue
-                print("Advanced because of:",current_time,">=",time_boundary[0] - (time_buffer if not is_hopper else time_buffer_hopper))
-                if current_time > hard_start+time_boundary[1]:
-                    profile_config = None
-                    continue
             print("TIMED BOUNDARY",is_hopper,time_boundary)
             print(profile_config)
             # print(profile_config)
@@ -1035,80 +1075,89 @@ def scripted_worker(worker_id, uhd_args, profiles, seed, worker_lookup):
                 if profile_config['duration'] is not None and profile_config['duration'] - time_slack > runtime + system_start_time - sanity_time_check:
                     profile_config['duration'] = runtime + system_start_time - sanity_time_check
 
-            launch_env = os.environ.copy()
             # print(instance, worker_id,profile_config)
-            launch_command = prof.start("-a {0:s}".format(uhd_args),profile_config)
-            # print(instance, worker_id,launch_command)
+            command = prof.start_argv("-a {0:s}".format(uhd_args),profile_config)
+            # print(instance, worker_id,command)
             disable_sig_handler()
-            if 'json' not in launch_command:
-                print("Hmm json wasn't given, skipping.")
+            if not isinstance(command,list) or not command:
                 profile_config = None
                 continue
-            command = shlex.split(launch_command)
-            if not command:
+            if '-j' not in command:
+                print("Hmm json wasn't given, skipping.")
                 profile_config = None
                 continue
             log_c.log(c_logger.level_t.INFO,"starting new radio_task({}): {}".format(iteration_number,command))
-            proc = subprocess.Popen(command,shell=False,env=launch_env)
+            timing = BurstTiming(json_truth,str(profile_name),dev_serial,instance,profile_config.get('mode'))
+            if time_boundary is not None and signal_start_time is None:
+                timing.mark('planned_start',planned_start)
+            launched_at = get_time()
+            timing.mark('launch',launched_at)
+            proc = launcher.start(command)
+            watcher.add(proc)
             enable_sig_handler()
-            crit_err_check = get_time()
 
             #################################################################
-            if crit_err_check != True:
-                ### Python side is up, let's wait for C-USRP to get going now
-                while(not os.path.isfile(json_truth)):
-                    # waiting for the usrp to spin up im the exec/proc
-                    if get_time() - crit_err_check > patience:
-                        crit_err_check = True
-                        # Hmm C-USRP didn't get started in my patience
-                        break
+            ### Python side is up, let's wait for C-USRP to report it's transmitting
+            tx_start = launcher.wait_ready(proc,patience,watcher,lambda: early_terminate == 0)
+            timing.mark('ready')
+            ### None -> C-USRP didn't get started in my patience
+            crit_err_check = tx_start is None
             # print(instance,worker_id,'E',[],crit_err_check)
             if crit_err_check == True:
                 ### Something didn't start up correctly, tear it all down
                 ### Uh oh, patience has ended
                 if proc.poll() is None:
                     log_c.log(c_logger.level_t.DEBUG,"KILLING AT REASON 2")
+                    timing.mark('sigint')
                     proc.send_signal(signal.SIGINT)
                 else:
                     log_c.log(c_logger.level_t.DEBUG,"IS DEAD REASON 2")
             else:
                 ######## Everything is going well
-                ### json has been created, so hopefully the system will start transmitting soon so rough est of start time
-                sig_start_at = get_time() if signal_start_time is None else signal_start_time
+                ### the generator reported exactly when its first sample goes out
+                sig_start_at = tx_start if signal_start_time is None else signal_start_time
+                leads.measured(str(profile_name),tx_start - launched_at)
+                timing.mark('first_sample',tx_start)
+                if time_boundary is not None and signal_start_time is None:
+                    start_errors.record(planned_start,tx_start)
+                    log_c.log(c_logger.level_t.DEBUG,"Timed start {0!s}: planned {1:.3f}, actual {2:.3f} ({3:+.1f}ms)".format(
+                        profile_name,planned_start,tx_start,1e3*(tx_start-planned_start)))
                 ######################
                 if not start_time_extracted:
                     ### every worker will need to extract the start time and end time
-                    worker_lookup['semaphore'].acquire()
-                    if worker_lookup['start_time'] is None:
-                        worker_lookup['start_time'] = system_start_time = sig_start_at + (0 if not is_hopper else time_buffer_hopper) 
-                        worker_lookup['end_time'] = system_end_time = sig_start_at + runtime + (0 if not is_hopper else time_buffer_hopper) 
-                    else:
-                        system_start_time = worker_lookup['start_time']
-                        system_end_time = worker_lookup['end_time']
-                    worker_lookup['semaphore'].release()
+                    system_start_time,system_end_time = run_state.set_window_once(
+                        sig_start_at + (0 if not is_hopper else time_buffer_hopper),
+                        sig_start_at + runtime + (0 if not is_hopper else time_buffer_hopper))
                     start_time_extracted = True
 
                 if time_boundary is not None:
-                    signal_start_time = sig_start_at+1.0# + (0 if not is_hopper else time_buffer_hopper) #### A hopper signal will start [4,60]s after the program starts
+                    signal_start_time = sig_start_at
                     if signal_end_time is None: ### most likely repeating a signal with different parameters, hold it's original end time
                         signal_end_time = signal_start_time + (time_boundary[1]-time_boundary[0]) #### todo fixme not signal_start_time, but rather json creation time
                         if signal_end_time > system_start_time + time_boundary[1]:
                             signal_end_time = system_start_time + time_boundary[1]
                 else:
-                    signal_start_time = sig_start_at+1.0# + (0 if not is_hopper else time_buffer_hopper) #### A hopper signal will start [4,60]s after the program starts
+                    signal_start_time = sig_start_at
                     if signal_end_time is None: ### most likely repeating a signal with different parameters, hold it's original end time
                         signal_end_time = system_end_time
                 ######################
                 log_c.log(c_logger.level_t.DEBUG,"SystemStart({0}), SignalStart({1}), Current({2}), SignalEnd({3}) Target({4})".format(
                     0, signal_start_time-system_start_time, get_time()-system_start_time,#+ (0 if not is_hopper else time_buffer_hopper),
                     signal_end_time-system_start_time,time_boundary))
+                planned_stop = signal_end_time if system_end_time is None else min(signal_end_time,system_end_time)
+                if profile_config.get('duration') is not None:
+                    ### the burst itself may be shorter than the window it repeats in
+                    planned_stop = min(planned_stop,tx_start + profile_config['duration'])
+                timing.mark('planned_stop',planned_stop)
                 early_exit_occured = False
                 def additional_keep_looping():
                     return (reasons_to_loop() \
                         + (get_time() < signal_end_time,not early_exit_occured))
                 while all(additional_keep_looping()):
                     #### let the signal run until signal duration is up
-                    if proc.poll() is not None:
+                    stop_at = signal_end_time if system_end_time is None else min(signal_end_time,system_end_time)
+                    exited,_ = watcher.wait(stop_at - get_time())
+                    if exited:
                         #### this process has ended on it's own??
                         log_c.log(c_logger.level_t.DEBUG,"IS DEAD REASON 0")
                         early_exit_occured = True
@@ -1120,12 +1169,16 @@ def scripted_worker(worker_id, uhd_args, profiles, seed, worker_lookup):
                 if proc.poll() is None:
                     ### time to wrap up now signal
                     log_c.log(c_logger.level_t.DEBUG,"KILLING AT REASON 1")
+                    timing.mark('sigint')
                     proc.send_signal(signal.SIGINT)
                 else:
                     if not any(additional_keep_looping()):
                         log_c.log(c_logger.level_t.DEBUG,"IS DEAD REASON 3")
             # print(instance,worker_id,'G')
             proc.wait() ### wait for it to write out the truth
+            timing.mark('exit')
+            timing.write()
+            watcher.discard(proc)
             # print(instance,worker_id,'H')
             if time_boundary is None:
                 profile_config = None
@@ -1140,10 +1193,18 @@ def scripted_worker(worker_id, uhd_args, profiles, seed, worker_lookup):
                     log_c.log(c_logger.level_t.INFO,"Finished current signal(2) {} {} {}".format(get_time(),signal_end_time,(signal_end_time-(time_buffer if not is_hopper else time_buffer_hopper))))
             if profile_config is None:
                 log_c.log(c_logger.level_t.INFO, "Ending radio task: {}".format(iteration_number))
+        else:
+            ### nothing left to send, idle until the run is over (or the first burst sets when that is)
+            end_time = run_state.end_time
+            watcher.wait(1.0 if end_time is None else end_time - get_time())
 
     # print("scripted_worker",instance,worker_id,"end",reasons_to_loop())###why did this proc end?
     log_c.log(c_logger.level_t.INFO,"scripted_worker-instance{0} ending reasons: (EarlyTerm:{1},"
             "Runtime:{2})".format(*((instance,)+tuple([not x for x in reasons_to_loop()]))))
+    log_c.log(c_logger.level_t.INFO,"scripted_worker-instance{0} {1!s}".format(instance,launch_stats))
+    log_c.log(c_logger.level_t.INFO,"scripted_worker-instance{0} {1!s}".format(instance,start_errors))
+    launcher.close()
+    watcher.close()
     # print("Scripted_worker is done---",worker_id)
 
 def resolve_signal_choices(base_config,rng):
@@ -1676,35 +1737,32 @@ def quick_viz(signals,keys,unit,sources=None,off_mark='_',on_mark='|',joiner='/'
             lines[idx] = line + " " + str(round(runtime,2))
     return '\n'.join(lines)
 
-def needed_radios_for_script(filepath):
-    viz = visualize_script(filepath,'_','|',bins=-1)
-    if len(viz.split('\n')) == 1:
-        return 1
-    quant = np.vstack([np.frombuffer(x[40:].encode('latin-1'),np.uint8) for x in viz.split('\n')])
-    quant[quant==ord('_')] = 0
-    quant[quant==ord('|')] = 1
-    try:
-        nr = np.max(np.sum(quant,axis=0))
-    except:
-        print(quant.shape)
-        raise
-    return nr
-
-
-class radio_plan_tracker(object):
-    def __init__(self,radio_idx,dev):
-        self.radio_idx = radio_idx
-        self.dev = dev
-        self.occupied = []
-    def reserve(self,start,stop):
-        self.occupied.append((start,stop))
-    def available(self,start,stop):
-        available = True
-        for usage in self.occupied:
-            if not ((start < usage[0] and stop < usage[0]) or (start > usage[1] and stop > usage[1])):
-                available = False
-                break
-        return available
+def _script_windows(signals,runtime):
+    """ [start, stop] of every signal that gets played, clipped to [0, runtime] """
+    windows = []
+    for x in signals:
+        start = max(0.0,x.get('time_start') or 0.0)
+        if start >= runtime:
+            ### never gets on the air
+            continue
+        ### untimed signals are on for the whole run
+        stop = runtime if x.get('time_stop') is None else min(runtime,x['time_stop'])
+        windows.append([start,stop])
+    return windows
+
+def needed_radios_for_script(filepath,profile=False):
+    """
+    Radios needed to play a script, the most signals it has on at once within its runtime
+
+    :param profile: also return the time of the peak and the (times, counts) concurrency profile
+    :return: peak (at least 1), or (peak, peak time, times, counts) with profile
+    """
+    runtime,energies,signals,sources,flags,toggles = load_script(filepath)
+    peak,when,times,counts = concurrency(_script_windows(signals,runtime))
+    ### a script takes a radio even when there's nothing in it
+    peak = max(1,peak)
+    return (peak,when,times,counts) if profile else peak
+
 
 def debug_server_scripting(uhd_args=[],script='truth_scripts/output-1a-truth.json'):
     if not isinstance(uhd_args,list):
@@ -1760,7 +1818,7 @@ def debug_server_scripting(uhd_args=[],script='truth_scripts/output-1a-truth.jso
             prof_name = og_profs[sig_name]
             src = [x for x in sources if sig_name in x['signal_set']][0]
             src_name = src['device_origin'] if len(src['device_origin']) else src['instance_name']
-            if src_name in radio_fallbacks and radio_trackers[radio_fallbacks[src_name][0]].available:
+            if src_name in radio_fallbacks and radio_trackers[radio_fallbacks[src_name][0]].available(*time_window):
                 radio_idx,dev = radio_fallbacks[src_name]
             else:
                 ## random deal to a radio
@@ -0,0 +1,85 @@
+import math
+import multiprocessing as mp
+
+UNSET = float('nan')
+
+
+class SharedRunState(object):
+    """
+    The part of a run every worker reads and writes: the instance counter and
+    the start/end times the first burst on the air sets
+
+    Kept in shared memory next to a single lock, so the workers' loop checks
+    are plain memory reads instead of round trips to a Manager process. It has
+    to reach the workers as a Process argument (it can't go through a queue).
+
+    :param instance: first instance number handed out
+    :param instance_limit: one past the last instance number
+    """
+    def __init__(self,instance:int=0,instance_limit:int=0,ctx=None):
+        ctx = mp if ctx is None else ctx
+        self.lock            = ctx.Lock()
+        self._instance       = ctx.RawValue('q',instance)
+        self._instance_limit = ctx.RawValue('q',instance_limit)
+        ### start,end ... NaN until the first worker sets them
+        self._window         = ctx.RawArray('d',[UNSET,UNSET])
+    @property
+    def instance(self):
+        """ next instance number that would be handed out """
+        return self._instance.value
+    @property
+    def instance_limit(self):
+        return self._instance_limit.value
+    def remaining(self):
+        return max(0,self._instance_limit.value - self._instance.value)
+    def reserve(self,count:int=1):
+        """
+        Claim up to count consecutive instance numbers
+
+        :return: range of the claimed numbers, empty once the limit is reached
+        """
+        with self.lock:
+            first = self._instance.value
+            last = max(first,min(first + count,self._instance_limit.value))
+            self._instance.value = last
+        return range(first,last)
+    @property
+    def start_time(self):
+        value = self._window[0]
+        return None if math.isnan(value) else value
+    @property
+    def end_time(self):
+        value = self._window[1]
+        return None if math.isnan(value) else value
+    def set_window_once(self,start_time:float,end_time:float):
+        """
+        First caller sets the run window, everyone else gets the one already set
+
+        :return: (start_time,end_time) in effect
+        """
+        with self.lock:
+            if math.isnan(self._window[0]):
+                ### end first, a reader seeing start set can rely on end being set too
+                self._window[1] = end_time
+                self._window[0] = start_time
+            return self._window[0],self._window[1]
+
+
+class InstanceBlock(object):
+    """
+    A worker's view of the instance counter, claiming block numbers at a time
+
+    Numbers claimed but never used (the worker stopped early) are skipped, so
+    a block of 1 is the only way to keep the instance numbers dense.
+    """
+    def __init__(self,state:SharedRunState,block:int=1):
+        self.state   = state
+        self.block   = max(1,int(block))
+        self.pending = iter(())
+    def next(self):
+        """ :return: the next instance number, or None once the run is out of them """
+        instance = next(self.pending,None)
+        if instance is None:
+            self.pending = iter(self.state.reserve(self.block))
+            instance = next(self.pending,None)
+        return instance
@@ -10,9 +10,11 @@ import signal
 import datetime
 import yaml
 import multiprocessing as mp
+import multiprocessing.connection
 import glob
 import json
 import time
+import threading
 
 from queue import deque
 from pynet import ServerNetworking,BetterConnection,ConnectionRole as CR,BetterThread
@@ -25,11 +27,23 @@ try:
     from .launcher import launch
     from .utils import get_interface,encoder,decoder,Ettus_USRP_container
     from .c_logger import logger_client,fake_log,logger as c_logger
+    from .proc_registry import ProcRegistry,Reaper
+    from .watcher import have_pidfd,watch_sigchld
+    from .dispatch import RequestDispatcher,ALL_RESOURCES,conflicts
+    from .truth_transfer import TruthTransfers,DEFAULT_CHUNK
+    from .truth import TruthIndex
+    from .discovery import RadioDiscovery
 except ImportError:
     ### fall back for direct execution
     from wfgen.launcher import launch
     from wfgen.utils import get_interface,encoder,decoder,Ettus_USRP_container
     from wfgen import logger_client,fake_log,c_logger
+    from wfgen.proc_registry import ProcRegistry,Reaper
+    from wfgen.watcher import have_pidfd,watch_sigchld
+    from wfgen.dispatch import RequestDispatcher,ALL_RESOURCES,conflicts
+    from wfgen.truth_transfer import TruthTransfers,DEFAULT_CHUNK
+    from wfgen.truth import TruthIndex
+    from wfgen.discovery import RadioDiscovery
 
 
 
@@ -51,6 +65,89 @@ class ServerRequests(object):
     def __repr__(self):
         return self.__str__()
 
+class RequestQueue(object):
+    """
+    Pending requests, drained control first, then query, launch and bulk
+
+    Each class is a bounded FIFO so a pile of launches can't hold up a kill,
+    put() turns a request away rather than let a class grow past its depth.
+    Requests stay queued (and count against their depth) until pop_ready()
+    finds them startable, so a class backed up on busy radios fills up.
+    """
+    CLASSES = ['control','query','launch','bulk']
+    COMMAND_CLASS = {
+        'kill':'control','shutdown':'control','ping':'control',
+        'get_active':'query','get_finished':'query','get_radios':'query','help':'query',
+        'start_radio':'launch','run_random':'launch','run_script':'launch',
+        'get_truth':'bulk','truth_chunk':'bulk',
+    }
+    DEPTHS = {'control':256,'query':64,'launch':32,'bulk':4}
+    def __init__(self,depths:Dict[str,int]=None):
+        self.depths = dict(self.DEPTHS)
+        if depths is not None:
+            self.depths.update(depths)
+        self.queues = {x:deque() for x in self.CLASSES}
+        ### re-entrant, the SIGINT handler pushes from the main thread
+        self.lock = threading.RLock()
+    @classmethod
+    def classify(cls,request:ServerRequests):
+        message = request.get_message()
+        if not message:
+            return 'query'
+        return cls.COMMAND_CLASS.get(message[0],'query')
+    def put(self,request:ServerRequests,force:bool=False):
+        """
+        :param force: queue it even if the class is already full
+        :return: False if the request was rejected
+        """
+        rclass = self.classify(request)
+        with self.lock:
+            queue = self.queues[rclass]
+            if not force and len(queue) >= self.depths[rclass]:
+                return False
+            queue.append(request)
+        return True
+    def appendleft(self,request:ServerRequests):
+        """ jump the line completely """
+        with self.lock:
+            self.queues['control'].appendleft(request)
+    def popleft(self):
+        with self.lock:
+            for rclass in self.CLASSES:
+                if self.queues[rclass]:
+                    return self.queues[rclass].popleft()
+        raise IndexError("pop from an empty RequestQueue")
+    def pop_ready(self,keys_of,can_start):
+        """
+        Take out the first request, in drain order, that can start right now
+
+        A request that has to wait keeps its resources reserved, so nothing
+        queued after it (in its class or a lower one) touching the same
+        radios gets ahead of it. Higher classes are scanned first, a kill
+        overtakes launches queued on the same radio.
+
+        :param keys_of: request -> set of resources it touches
+        :param can_start: keys -> True if they (and a worker) are free
+        :return: (request,keys) or None if everything has to wait
+        """
+        with self.lock:
+            waiting = set()
+            for rclass in self.CLASSES:
+                queue = self.queues[rclass]
+                ### walk a copy, the deque may still grow underneath (put from the network thread)
+                for request in list(queue):
+                    keys = keys_of(request)
+                    if not conflicts(keys,waiting) and can_start(keys):
+                        queue.remove(request)
+                        return request,keys
+                    waiting |= keys
+        return None
+    def __len__(self):
+        with self.lock:
+            return sum([len(x) for x in self.queues.values()])
+    def __bool__(self):
+        return self.__len__() > 0
+
 class ServerNet(ServerNetworking):
     def __init__(self,filepath):
         if not os.path.exists(filepath):
@@ -60,7 +157,12 @@ class ServerNet(ServerNetworking):
         addr = config['server_addr']
         port = config['server_port']
         endpoint = f"{addr}:{port}"
-        self.request_queue = deque()
+        self.request_queue = RequestQueue(config.get('queue_depths',None))
+        ### self-pipe so the main loop can block until there is something to do
+        self._wake_r,self._wake_w = os.pipe()
+        os.set_blocking(self._wake_r,False)
+        os.set_blocking(self._wake_w,False)
+        self._reply_lock = threading.Lock()
         super().__init__(endpoint=endpoint)
         self.set_callback(self.handle_tasks)
 
@@ -70,7 +172,39 @@ class ServerNet(ServerNetworking):
         sid,msg = payload[0],payload[1]
         print("Wrapping Request:",sid,msg,flush=True)
         request = ServerRequests(sid,decoder(msg))
-        self.request_queue.append(request)
+        if not self.request_queue.put(request):
+            rclass = self.request_queue.classify(request)
+            print("Busy, rejecting:",request,flush=True)
+            self.send_reply(ServerRequests(sid,["Server","busy:",rclass,"queue","is","full"]))
+            return
+        self.wakeup()
+
+    def wakeup(self):
+        try:
+            os.write(self._wake_w,b'\x00')
+        except BlockingIOError:
+            ### pipe is full, the main loop has plenty of wakeups pending already
+            pass
+
+    def wake_fd(self):
+        return self._wake_w
+
+    def wait_for_event(self,sentinels:List=[],timeout:float=None):
+        """
+        Block until a request is queued, a sentinel is ready or a signal arrives
+
+        :param sentinels: extra waitables (mp.Process sentinels) to wake on
+        :param timeout: seconds to wait before giving up (None is forever)
+        :return: the sentinels that became ready
+        """
+        ready = mp.connection.wait([self._wake_r]+list(sentinels),timeout)
+        if self._wake_r in ready:
+            try:
+                while os.read(self._wake_r,4096):
+                    pass
+            except BlockingIOError:
+                pass
+        return [x for x in ready if x != self._wake_r]
 
     def send_reply(self, reply_req:ServerRequests):
         if self.listener is not None:
@@ -80,7 +214,9 @@ class ServerNet(ServerNetworking):
             msg = reply_req.get_payload()
             try:
                 # print("SENDING:",msg[0],msg[1:])
-                self.reply(msg[0],msg[1:])
+                with self._reply_lock:
+                    ### requests finish on worker threads, the pipe under reply() isn't thread safe
+                    self.reply(msg[0],msg[1:])
             except Exception as e:
                 import traceback
                 self.stop("\n".join(["-MAIN THREAD ERROR-",traceback.format_exc()]))
@@ -101,35 +237,51 @@ class ServerState(object):
         self.active_radios  = []
         self.debug          = debug
         self.log_c          = logger_client("ServerState") if use_log else fake_log("ServerState",cout=False)
+        ### the reaper frees radios from its own threads
+        self.lock           = threading.RLock()
+        self.truth          = None
+        self.discovery      = RadioDiscovery(uhd_args)
         self.make_root()
     def make_root(self):
         truth_folder = os.path.join(self.root,datetime.datetime.now().strftime('%Y%m%d%H%M%S') + "_truth")
         if not os.path.isdir(truth_folder) and not self.debug:
             os.makedirs(truth_folder)
-        self.save_dir = truth_folder
+        with self.lock:
+            self.save_dir = truth_folder
+            self.truth = TruthIndex()
+    def merge_truth(self):
+        """ fold any truth files written since the last call into the running report """
+        with self.lock:
+            truth,pattern = self.truth,os.path.join(self.save_dir,'truth*.json')
+        merged = truth.merge_new(pattern)
+        if merged:
+            self.log_c.log(c_logger.level_t.INFO,"Merged {0!s} new truth files".format(merged))
+        return merged
     def consolidate(self):
         report_file = os.path.join(self.save_dir,'report_of_truth.json')
         if os.path.isfile(report_file):
             os.remove(report_file)
-        cmd = 'consolidate_reports.py -output {0} "{1}"'.format(report_file,os.path.join(self.save_dir,'truth*.json'))
-        self.log_c.log(c_logger.level_t.INFO,"Running command:\n\t{0!s}".format(cmd))
-        cmd = shlex.split(cmd)
-        proc = subprocess.Popen(cmd,shell=False)
-        proc.wait()
+        if not os.path.isdir(self.save_dir):
+            return
+        self.merge_truth()
+        count = self.truth.write(report_file)
+        self.log_c.log(c_logger.level_t.INFO,"Wrote {0!s} reports to {1!s}".format(count,report_file))
     def activate_radios(self,radios:List=[]):
-        if any([x in self.active_radios for x in radios]):
-            raise RuntimeError("Requesting use of a radio already activated")
-        if any([x not in self.idle_radios for x in radios]):
-            raise RuntimeError("Requesting use of a radio({}) not under my purview({!s})".format(radios,self.idle_radios))
-        for x in radios:
-            del self.idle_radios[self.idle_radios.index(x)]
-            self.active_radios.append(x)
+        with self.lock:
+            if any([x in self.active_radios for x in radios]):
+                raise RuntimeError("Requesting use of a radio already activated")
+            if any([x not in self.idle_radios for x in radios]):
+                raise RuntimeError("Requesting use of a radio({}) not under my purview({!s})".format(radios,self.idle_radios))
+            for x in radios:
+                del self.idle_radios[self.idle_radios.index(x)]
+                self.active_radios.append(x)
     def deactivate_radios(self,radios:List=[]):
-        if any([x not in self.active_radios for x in radios]):
-            raise RuntimeError("Requesting to return a radio not under my purview")
-        for x in radios:
-            del self.active_radios[self.active_radios.index(x)]
-            self.idle_radios.append(x)
+        with self.lock:
+            if any([x not in self.active_radios for x in radios]):
+                raise RuntimeError("Requesting to return a radio not under my purview")
+            for x in radios:
+                del self.active_radios[self.active_radios.index(x)]
+                self.idle_radios.append(x)
     def set_radios(self,radio_info:str):
         self.radios = Ettus_USRP_container([radio_info],verbose=False)
         ##### being lazy here -- I'm assuming that if it's empty then I can fill them out
@@ -144,19 +296,19 @@ class ServerState(object):
         str_out += '\nActive: {}'.format(self.active_radios)
         return str_out
     def get_json_filename(self,dev_serial:str):
-        filename = os.path.join(self.save_dir,self.json_proto.format(serial=dev_serial,instance=self.burst_instance))
-        self.burst_instance += 1
+        with self.lock:
+            filename = os.path.join(self.save_dir,self.json_proto.format(serial=dev_serial,instance=self.burst_instance))
+            self.burst_instance += 1
         return filename
     def increment_instance(self,count:int):
-        self.burst_instance += count
+        with self.lock:
+            self.burst_instance += count
     def is_active(self,radio_idx:int):
-        if radio_idx in self.active_radios:
-            return True
-        return False
+        with self.lock:
+            return radio_idx in self.active_radios
     def is_idle(self,radio_idx:int):
-        if radio_idx in self.idle_radios:
-            return True
-        return False
+        with self.lock:
+            return radio_idx in self.idle_radios
     def get_truth_file(self):
         report = os.path.join(self.save_dir,'report_of_truth.json')
         if os.path.isfile(report):
@@ -166,7 +318,7 @@ class ServerState(object):
 
 command_list=["help","ping","get_radios","get_active","get_finished",
               "start_radio","run_random","kill","shutdown","get_truth",
-              "run_script"]
+              "run_script","truth_chunk"]
 def run(network_interface:ServerNet,
         uhd_args=[],debug=False,root_dir='/tmp/wfgen_reports',use_log=True):
     """
@@ -193,178 +345,140 @@ def run(network_interface:ServerNet,
         raise RuntimeError("Could not start the server")
     print("started")
     log_c.log(c_logger.level_t.INFO,"started")
-    active_procs = []
-    finished_procs = []
+    registry = ProcRegistry()
     if network_interface.endpoint is not None:
         print("CONTROL ENDPOINT:",network_interface.endpoint)
 
     json_template = 'truth_dev_{serial:s}_instance_{instance:05d}.json'
+    transfers = TruthTransfers()
     Current_STATE = ServerState(root_dir,network_interface,uhd_args,json_template,debug,use_log=use_log)
+    if not debug:
+        ### probe in the background so the first get_radios doesn't wait on it
+        Current_STATE.discovery.start()
+
+    def retire(pid):
+        ### move a finished process out of the registry and free up its radios
+        handle = registry.retire(pid)
+        if handle is None:
+            ### someone else got to it first
+            return None
+        if handle.command.split(' ',1)[0] in ['start_radio','run_random','run_script']:
+            ### its truth files are done, merge them now so get_truth has less to do
+            Current_STATE.merge_truth()
+        if handle.command.startswith('start_radio'):
+            if handle.radios[0] >= 0:
+                Current_STATE.deactivate_radios(handle.radios)
+        elif handle.command.startswith('run_random') or handle.command.startswith('run_script'):
+            Current_STATE.deactivate_radios(handle.radios)
+        return handle
+
+    def reaped(handle):
+        log_c.log(c_logger.level_t.INFO,"process killed? {0!s} -> {1!s}".format(handle.pid,handle.returncode))
+        retire(handle.pid)
+    reaper = Reaper(reaped,log=lambda x: log_c.log(c_logger.level_t.WARNING,x))
 
     def clean_up():
-        nonlocal active_procs,finished_procs,Current_STATE
-        if len(active_procs) > 0:
-            active_pids = [x[0] for x in active_procs]
-            for idx in range(len(active_procs)):
-                log_c.log(c_logger.level_t.INFO,"Killing process id: {0!s}".format(active_pids[idx]))
-                if not isinstance(active_procs[idx][1],tuple):
-                    if isinstance(active_procs[idx][1],mp.Process):
-                        active_procs[idx][1].terminate()
-                    else:
-                        active_procs[idx][1].send_signal(signal.SIGINT)
-                else:
-                    active_procs[idx][1][0].send_signal(signal.SIGINT)
-                    active_procs[idx][1][1].stop()
-            for idx in reversed(range(len(active_procs))):
-                if not isinstance(active_procs[idx][1],tuple):
-                    if isinstance(active_procs[idx][1],mp.Process):
-                        active_procs[idx][1].join()
-                        active_procs[idx][1].close()
-                    else:
-                        active_procs[idx][1].wait()
-                else:
-                    for p in active_procs[idx][1]:
-                        if p is None:
-                            continue
-                        p.wait()
-                finished_procs.append(active_procs[idx])
-                completed = active_procs[idx][2]
-
-                if completed.startswith('start_radio'):
-                    radio_to_deactivate = active_procs[idx][3]
-                    if radio_to_deactivate[0] >= 0:
-                        Current_STATE.deactivate_radios(radio_to_deactivate)
-                elif completed.startswith('run_random'):
-                    radios_to_deactivate = active_procs[idx][3]
-                    Current_STATE.deactivate_radios(radios_to_deactivate)
-                del active_procs[idx]
+        for handle in registry:
+            log_c.log(c_logger.level_t.INFO,"Killing process id: {0!s}".format(handle.pid))
+            reaper.reap(handle)
+        reaper.drain()
 
     def can_clean(radio_idx):
         # check if there's any active process using this radio that should be cleaned up
-        nonlocal log_c,active_procs,finished_procs,Current_STATE
         singular = False
         if not isinstance(radio_idx,list):
             radio_idx = [radio_idx]
             singular = True
         cleaned = [True]*len(radio_idx)
-        cleanup = []
-        ##### Check for all possible radio connections to processes
-        for ridx in radio_idx:
-            # For this radio find all processes that say it's in use
-            proc_idx = [pidx for pidx,x in enumerate(active_procs) if ridx in x[3]]
-            if len(proc_idx):
-                for pidx in proc_idx:
-                    proc_set = active_procs[pidx][1]
-                    if isinstance(proc_set,tuple):
-                        #### (usrp:mp.Process,flowgraph:profile)
-                        if proc_set[0] is not None:
-                            callem = lambda x: x.is_alive() if isinstance(x,mp.Process) else x.poll()
-                            if not callem(proc_set[0]):
-                                if pidx not in cleanup:
-                                    cleanup.append(pidx)
-                                if proc_set[1] is not None:
-                                    proc_set[1].stop()
-                            else:
-                                cleaned[ridx] = False
-                    elif isinstance(proc_set,mp.Process):
-                        if not proc_set.is_alive():
-                            if pidx not in cleanup:
-                                cleanup.append(pidx)
-                        else:
-                            cleaned[ridx] = False
-                    elif isinstance(proc_set,subprocess.Popen):
-                        if proc_set.poll() is not None:
-                            if pidx not in cleanup:
-                                cleanup.append(pidx)
-                        else:
-                            cleaned[ridx] = False
-                    else:
-                        log_c.log(c_logger.level_t.WARNING,"Not sure what this proc is... type({0!s})".format(type(active_procs[pidx][1])))
-        cleanup = sorted(cleanup)
-        ### Cleanup all active_procs that are done
-        for pidx in reversed(cleanup):
-            ### These procs need to be cleanly closed and moved to finished
-            proc_info = active_procs[pidx]
-            proc_set = proc_info[1]
-            if isinstance(proc_set,tuple):
-                ### (usrp:mp.Process,flowgraph:profile)
-                for sub_proc in proc_set:
-                    log_c.log(c_logger.level_t.INFO,'cleanup sub_proc? {0!s}'.format(sub_proc))
-                    if sub_proc is None:
-                        continue
-                    sub_proc.wait()
-            elif isinstance(proc_set,mp.Process):
-                proc_set.join()
-                proc_set.close()
-            else:
-                proc_set.wait()
-            finished_procs.append(proc_info)
-            completed = proc_info[2]
-            if completed.startswith('start_radio'):
-                radio_to_deactivate = proc_info[3] ## should be a list of len 1
-                if radio_to_deactivate[0] >= 0:
-                    Current_STATE.deactivate_radios(radio_to_deactivate)
-            elif completed.startswith('run_random') or completed.startswith('run_script'):
-                radios_to_deactivate = proc_info[3]
-                Current_STATE.deactivate_radios(radios_to_deactivate)
-            del active_procs[pidx]
-
+        for idx,ridx in enumerate(radio_idx):
+            for handle in registry.for_radio(ridx):
+                if handle.state == 'terminating' or handle.poll() is None:
+                    cleaned[idx] = False
+                    continue
+                log_c.log(c_logger.level_t.INFO,'cleanup finished process {0!s}'.format(handle.pid))
+                retire(handle.pid)
         if singular:
             cleaned = cleaned[0]
         return cleaned
 
-    msg_waiting = False
-    no_reply = False
-    logged_mprocs = []
-    # running = True
-    def sigint_handle(sig,frame):
-        nonlocal msg_waiting, network_interface
-        network_interface.request_queue.appendleft(ServerRequests(None,["shutdown","quiet"]))
-        msg_waiting = False
-        signal.signal(signal.SIGINT,signal.default_int_handler)
-    signal.signal(signal.SIGINT,sigint_handle)
+    def request_keys(message:List[str]):
+        ### the radios (or all of ServerState) a request needs to itself while it runs
+        if not message or message[0] not in command_list:
+            return set()
+        cmd = message[0]
+        if cmd in ['shutdown','get_radios','get_truth']:
+            return {ALL_RESOURCES}
+        if cmd == 'start_radio':
+            args_index = [idx for idx,x in enumerate(message) if x.startswith('-a')]
+            if len(args_index) == 0:
+                return {-1} if '__debug_test__' in message else set()
+            if Current_STATE.radios is None:
+                return {ALL_RESOURCES}
+            tail = message[args_index[0]][message[args_index[0]].find("serial")+7:]
+            dev_serial = tail[:tail.find(',')] if tail.find(',') > 0 else tail
+            radio_index = Current_STATE.radios.get_index_from_serial(dev_serial)
+            return {radio_index} if radio_index != -1 else {ALL_RESOURCES}
+        if cmd == 'truth_chunk':
+            ### chunks of the same transfer go out in order, anything else can run alongside
+            return {'truth:' + (message[1] if len(message) > 1 else '')}
+        if cmd == 'kill':
+            keys = set()
+            for kill_slot in message[1:]:
+                try:
+                    handle = registry.get(int(kill_slot))
+                except ValueError:
+                    continue
+                if handle is not None:
+                    keys.update(handle.radios)
+            return keys
+        if cmd in ['run_random','run_script']:
+            try:
+                request = yaml.safe_load(" ".join(message[1:]))
+            except:
+                return set()
+            if not isinstance(request,dict):
+                return set()
+            if cmd == 'run_random':
+                return set(request['radios']) if 'radios' in request else {ALL_RESOURCES}
+            if Current_STATE.radios is None:
+                return set()
+            keys = set([idx for idx,y in enumerate(Current_STATE.radios.radios) if y['args'] in request])
+            return keys if keys else {ALL_RESOURCES}
+        return set()
 
-    while True:
-        if not msg_waiting and network_interface.request_queue:
-            msg_req = network_interface.request_queue.popleft()
-            print("Handling:",msg_req)
-            msg_waiting = True
-        if msg_waiting:
-            sent_from = msg_req.get_dest()
+    failback_lock = threading.Lock()
+    stopping = threading.Event()
+    def handle(msg_req:ServerRequests):
+        global sp_failback
+        sent_from = msg_req.get_dest()
+        no_reply = sent_from is None
+        try:
             message = msg_req.get_message()
             log_c.log(c_logger.level_t.INFO,"Got message with length: {0!s}".format(len(" ".join(message))))
             if not message:
                 if not no_reply:
                     stat = network_interface.send_reply(ServerRequests(sent_from,['No command given']))
-                msg_req = None
-                message = None
-                msg_waiting = False
-                no_reply = False
-                continue
+                return
             cmd = message[0]
             if cmd not in command_list:
                 if not no_reply:
                     stat = network_interface.send_reply(ServerRequests(sent_from,['Invalid command:',cmd]))
-                msg_req = None
-                message = None
-                msg_waiting = False
-                no_reply = False
-                continue
+                return
 
             if cmd == 'shutdown':
                 clean_up()
                 Current_STATE.consolidate()
                 if 'quiet' not in message:
-                    rep = ServerRequests(sent_from,["Shutting","down"] + ["{0!s}".format(x) for x in finished_procs])
+                    rep = ServerRequests(sent_from,["Shutting","down"] + ["{0!s}".format(x) for x in registry.finished])
                     network_interface.send_reply(rep)
                 for x in network_interface.state_map.keys(): 
                     rep = ServerRequests(x,["bye","bye"])
                     network_interface.send_reply(rep)
                 time.sleep(2.0) ## hopefully all messages get out with this delay
-                shutdown()
-                break
+                stopping.set()
             elif cmd == 'get_radios':
-                info = launch(cmd,Current_STATE,use_log=use_log)
+                ### get_radios [refresh], cached unless asked otherwise
+                info = Current_STATE.discovery.get(refresh='refresh' in message[1:])
                 if not no_reply:
                     rep = ServerRequests(sent_from,['Found:\n',info])
                     stat = network_interface.send_reply(rep)
@@ -376,22 +490,15 @@ def run(network_interface:ServerNet,
                 if(len(args_index) == 0):
                     if '__debug_test__' in message:
                         ### assuming a debug/test event here
-                        class dummy_proc:
-                            def __init__(self,pid):
-                                self.pid = pid
-                            def kill(self):
-                                pass
-                            def send_signal(self,sig):
-                                pass
-                            def wait(self):
-                                pass
                         try:
                             proc = launch(message,Current_STATE,use_log=use_log)
+                            while proc in registry:
+                                proc += 1
                             if not no_reply:
                                 rep = ServerRequests(sent_from,["Starting process","{}".format(proc)])
                                 stat = network_interface.send_reply(rep)
                                 rep = None
-                            active_procs.append(([proc,dummy_proc(proc)," ".join(message),[-1]]))
+                            registry.add(proc,proc," ".join(message),[-1])
                         except:
                             if not no_reply:
                                 rep = ServerRequests(sent_from,["Unable","to","start","process"])
@@ -450,68 +557,35 @@ def run(network_interface:ServerNet,
                                 rep = ServerRequests(sent_from,["Starting process","{}".format(proc.pid),truth_file])
                                 stat = network_interface.send_reply(rep)
                                 rep = None
-                            active_procs.append((proc.pid,proc," ".join(message),[radio_index]))
+                            registry.add(proc.pid,proc," ".join(message),[radio_index])
                             Current_STATE.activate_radios([radio_index])
                         elif isinstance(proc,tuple):
                             #### Had to start multiple procs
+                            if proc[0] is None:
+                                with failback_lock:
+                                    proc_id = sp_failback
+                                    sp_failback -= 1
+                            else:
+                                proc_id = proc[0].pid
                             if not no_reply:
                                 rep = ServerRequests(sent_from,["Starting process","<{0!s} & {1!s}>".format(
-                                    proc[0].pid if proc[0] is not None else sp_failback,proc[1]),truth_file])
+                                    proc_id,proc[1]),truth_file])
                                 stat = network_interface.send_reply(rep)
                                 rep = None
-                            if proc[0] is None:
-                                active_procs.append((sp_failback,proc," ".join(message),[radio_index]))
-                                sp_failback -= 1
-                            else:
-                                active_procs.append((proc[0].pid,proc," ".join(message),[radio_index]))
+                            registry.add(proc_id,proc," ".join(message),[radio_index])
                             Current_STATE.activate_radios([radio_index])
                         else:
                             log_c.log(c_logger.level_t.CRITICAL,"Not sure why we got here....")
             elif cmd == 'kill':
                 cleanup_messages = []
                 for kill_slot in message[1:]:
-                    active_pids = [x[0] for x in active_procs]
-                    if int(kill_slot) in active_pids:
-                        log_c.log(c_logger.level_t.INFO,"Killing process id: {0!s}".format(int(kill_slot)))
-                        idx = active_pids.index(int(kill_slot))
-                        if not isinstance(active_procs[idx][1],tuple):
-                            if not isinstance(active_procs[idx][1],mp.Process):
-                                active_procs[idx][1].send_signal(signal.SIGINT)
-                            else:
-                                active_procs[idx][1].terminate()
-                        else:
-                            if active_procs[idx][1][0] is not None:
-                                active_procs[idx][1][0].send_signal(signal.SIGINT)
-                            if active_procs[idx][1][1] is not None:
-                                active_procs[idx][1][1].stop()
-                        start_message = active_procs[idx][2]
-                        # active_procs[idx][1].kill()
+                    handle = registry.get(int(kill_slot))
+                    if handle is not None:
+                        log_c.log(c_logger.level_t.INFO,"Killing process id: {0!s}".format(handle.pid))
+                        ### the reaper joins it and frees the radios, no need to hold everyone else up
+                        reaper.reap(handle)
                         if not no_reply:
-                            cleanup_messages.append("Killing process {}".format(kill_slot))
-                        if not isinstance(active_procs[idx][1],tuple):
-                            if isinstance(active_procs[idx][1],mp.Process):
-                                active_procs[idx][1].join()
-                                active_procs[idx][1].close()
-                            else:
-                                active_procs[idx][1].wait()
-                        else:
-                            for sub_proc in active_procs[idx][1]:
-                                log_c.log(c_logger.level_t.INFO,"sub_proc? {0!s}".format(sub_proc))
-                                if sub_proc is None:
-                                    continue
-                                sub_proc.wait()
-                        log_c.log(c_logger.level_t.INFO,"process killed? {0!s}".format(kill_slot))
-                        finished_procs.append(active_procs[idx])
-                        completed = active_procs[idx][2]
-
-                        if completed.startswith('start_radio'):
-                            radio_to_deactivate = active_procs[idx][3]
-                            if radio_to_deactivate[0] >= 0:
-                                Current_STATE.deactivate_radios(radio_to_deactivate)
-                        elif completed.startswith('run_random') or completed.startswith('run_script'):
-                            radios_to_deactivate = active_procs[idx][3]
-                            Current_STATE.deactivate_radios(radios_to_deactivate)
-                        del active_procs[idx]
+                            cleanup_messages.append("Killing process {} terminating".format(kill_slot))
                     else:
                         log_c.log(c_logger.level_t.INFO,"Not such process id to kill: {0!s}".format(int(kill_slot)))
                         if not no_reply:
@@ -525,7 +599,7 @@ def run(network_interface:ServerNet,
                 if not no_reply:
                     stat = network_interface.send_reply(ServerRequests(sent_from,['pong']))
             elif cmd == 'get_active':
-                if len(active_procs) == 0:
+                if len(registry) == 0:
                     if not no_reply:
                         rep = ServerRequests(sent_from,["No","Active","Processes"])
                         stat = network_interface.send_reply(rep)
@@ -533,11 +607,11 @@ def run(network_interface:ServerNet,
                 else:
                     if not no_reply:
                         rep = ServerRequests(sent_from,
-                            ['Active',]+["{0!s}".format(x) for x in active_procs])
+                            ['Active',]+["{0!s}".format(x) for x in registry])
                         stat = network_interface.send_reply(rep)
                         rep = None
             elif cmd == 'get_finished':
-                if len(finished_procs) == 0:
+                if len(registry.finished) == 0:
                     if not no_reply:
                         rep = ServerRequests(sent_from,["No","Finished","Processes"])
                         stat = network_interface.send_reply(rep)
@@ -545,7 +619,7 @@ def run(network_interface:ServerNet,
                 else:
                     if not no_reply:
                         rep = ServerRequests(sent_from,
-                            ['Finished',]+["{0!s}".format(x) for x in finished_procs])
+                            ['Finished',]+["{0!s}".format(x) for x in registry.finished])
                         stat = network_interface.send_reply(rep)
                         rep = None
             elif cmd == 'run_random':
@@ -563,7 +637,7 @@ def run(network_interface:ServerNet,
                     radios = request['radios'] if 'radios' in request else [x for x in Current_STATE.idle_radios]
                     proc = None
                     if any([Current_STATE.is_active(x) for x in radios]):
-                        cleaned = can_clean(radio_index)
+                        cleaned = can_clean(radios)
                         if not all(cleaned):
                             response = " ".join(["Radio","is","still","in","use"])
                             proc = -1
@@ -586,14 +660,34 @@ def run(network_interface:ServerNet,
                             stat = network_interface.send_reply(rep)
                             stat = False
                             rep = None
-                        active_procs.append((proc.pid,proc," ".join(message),radios))
+                        registry.add(proc.pid,proc," ".join(message),radios)
             elif cmd == 'get_truth':
                 clean_up()
                 Current_STATE.consolidate()
                 report = Current_STATE.get_truth_file()
                 if report is None:
                     stat = network_interface.send_reply(ServerRequests(sent_from,['report','empty','']))
-                    continue
+                    return
+                if len(message) > 1 and message[1] == 'stream':
+                    ### get_truth stream [codec] -> the client pulls it with truth_chunk
+                    codec = message[2] if len(message) > 2 else 'zlib'
+                    report_status = 'valid'
+                    if os.path.getsize(report) <= 65536:
+                        ### cheap enough to check, anything bigger surely has reports in it
+                        try:
+                            with open(report,'r') as fp:
+                                if len(json.load(fp)['reports']) == 0:
+                                    report_status = 'empty'
+                        except:
+                            report_status = 'invalid'
+                    if report_status == 'empty':
+                        stat = network_interface.send_reply(ServerRequests(sent_from,['report','empty','']))
+                    else:
+                        transfer = transfers.open(report,codec)
+                        stat = network_interface.send_reply(ServerRequests(sent_from,
+                            ['transfer',report_status,transfer.tid,"{0:d}".format(transfer.size),transfer.codec]))
+                    Current_STATE.make_root()
+                    return
                 report_status = 'valid'
                 try:
                     with open(report,'r') as fp:
@@ -611,6 +705,20 @@ def run(network_interface:ServerNet,
                     report_contents = ''
                 stat = network_interface.send_reply(ServerRequests(sent_from,['report',report_status,report_contents]))
                 Current_STATE.make_root()
+            elif cmd == 'truth_chunk':
+                ### truth_chunk <transfer id> <offset> [length]
+                transfer = transfers.get(message[1]) if len(message) > 2 else None
+                if transfer is None:
+                    stat = network_interface.send_reply(ServerRequests(sent_from,
+                        ['chunk',message[1] if len(message) > 1 else '','error','No such transfer']))
+                    return
+                offset = int(message[2])
+                length = int(message[3]) if len(message) > 3 else DEFAULT_CHUNK
+                nbytes,data = transfer.read_chunk(offset,length)
+                stat = network_interface.send_reply(ServerRequests(sent_from,
+                    ['chunk',transfer.tid,"{0:d}".format(offset),"{0:d}".format(nbytes),data]))
+                if offset + nbytes >= transfer.size:
+                    transfers.close(transfer.tid)
             elif cmd == 'run_script':
                 try:
                     request = yaml.safe_load(" ".join(message[1:]))
@@ -640,7 +748,7 @@ def run(network_interface:ServerNet,
                                     [y['args'] for y in Current_STATE.radios.radios]]
                         proc = None
                         if any([Current_STATE.is_active(x) for x in radios]):
-                            cleaned = can_clean(radio_index)
+                            cleaned = can_clean(radios)
                             if not all(cleaned):
                                 response = " ".join(["Radio","is","still","in","use"])
                                 proc = -1
@@ -658,29 +766,61 @@ def run(network_interface:ServerNet,
                             if not no_reply:
                                 stat = network_interface.send_reply(ServerRequests(sent_from,["Starting scripted run:","{}".format(proc.pid)]))
                                 stat = False
-                            active_procs.append((proc.pid,proc," ".join(message),radios))
+                            registry.add(proc.pid,proc," ".join(message),radios)
             else:
                 if not no_reply:
                     stat = network_interface.send_reply(ServerRequests(sent_from,["Valid commands:"]+command_list))
-        msg_req = None
-        message = None
-        msg_waiting = False
-        no_reply = False
-        if any([isinstance(x[1],mp.Process) for x in active_procs]):
-            if any([True for x in active_procs if x not in logged_mprocs]):
-                log_c.log(c_logger.level_t.INFO,"Got some mp.Procs")
-            logged_mprocs = [x for x in active_procs if isinstance(x[1],mp.Process)]
-            for x in active_procs:
-                if not isinstance(x[1], mp.Process):
-                    continue
-                if not x[1].is_alive():
-                    log_c.log(c_logger.level_t.INFO,"Found one that's done")
-                    msg_waiting = True
-                    no_reply = True
-                    message = ['kill',str(x[0])]
-        if logged_mprocs:
-            logged_mprocs = [x for x in logged_mprocs if x in active_procs]
+        except Exception as e:
+            import traceback
+            log_c.log(c_logger.level_t.ERROR,"Request {0!s} failed:\n{1!s}".format(msg_req,traceback.format_exc()))
+            if not no_reply:
+                network_interface.send_reply(ServerRequests(sent_from,["Request","failed:",str(e)]))
+
+    dispatcher = RequestDispatcher(handle,on_done=network_interface.wakeup,
+        log=lambda x: log_c.log(c_logger.level_t.ERROR,x))
+    interrupted = False
+    def sigint_handle(sig,frame):
+        ### only flag it, the main loop may be in the middle of the queue (the wake pipe gets it going)
+        nonlocal interrupted
+        interrupted = True
+        signal.signal(signal.SIGINT,signal.default_int_handler)
+    signal.signal(signal.SIGINT,sigint_handle)
+    ### any signal landing while blocked below writes to the wake pipe
+    signal.set_wakeup_fd(network_interface.wake_fd())
+    if not have_pidfd():
+        ### no pidfds for Popen children, so let SIGCHLD do the waking
+        watch_sigchld()
+
+    keys_of = lambda x: request_keys(x.get_message())
+    while not stopping.is_set():
+        ### sleep until a request, a signal, a child exiting or a request finishing,
+        ### every one of those writes to the wake pipe so nothing queued gets missed
+        watched = registry.sentinels()
+        done = [watched[x] for x in network_interface.wait_for_event(list(watched.keys()))]
+        done += [x for x in registry.unwatched() if x.poll() is not None]
+        for handle_done in done:
+            log_c.log(c_logger.level_t.INFO,"Found one that's done: {0!s}".format(handle_done.pid))
+            ### keep it out of the sentinels until the kill below gets to it
+            handle_done.state = 'exited'
+            network_interface.request_queue.put(ServerRequests(None,['kill',str(handle_done.pid)]),force=True)
+        if interrupted:
+            interrupted = False
+            network_interface.request_queue.appendleft(ServerRequests(None,["shutdown","quiet"]))
+        while not stopping.is_set():
+            ### whatever is blocked stays queued until a finishing request wakes us up again
+            ready = network_interface.request_queue.pop_ready(keys_of,dispatcher.can_start)
+            if ready is None:
+                break
+            msg_req,keys = ready
+            print("Handling:",msg_req)
+            dispatcher.submit(msg_req,keys)
 
+    Current_STATE.discovery.stop()
+    dispatcher.shutdown()
+    if network_interface.request_queue:
+        log_c.log(c_logger.level_t.WARNING,"Dropped {0!s} requests at shutdown".format(len(network_interface.request_queue)))
+    signal.set_wakeup_fd(-1)
+    shutdown()
 
 def parse_args():
     p = argparse.ArgumentParser()
@@ -0,0 +1,213 @@
+import os
+import time
+import signal
+import subprocess
+from typing import List
+
+try:
+    from .readiness import ReadyPipe
+    from .spawn import spawn,launch_stats
+except ImportError:
+    from wfgen.readiness import ReadyPipe
+    from wfgen.spawn import spawn,launch_stats
+
+### generators that understand -S, the rest (wfgen_fskmod, wfgen_fhssgen, ...) always run one-shot
+SESSION_CAPABLE = ['wfgen_linmod']
+SESSION_FLAG = '-S'
+### flags that pick the device, a session is only reused when these match
+DEVICE_FLAGS = ['-a','-W','-C','-z']
+
+def sessions_enabled():
+    """ opt-in for now, WFGEN_SESSIONS=1 """
+    return os.environ.get('WFGEN_SESSIONS','0') == '1'
+
+def device_args(command:List[str]):
+    return [(x,command[idx+1]) for idx,x in enumerate(command[:-1]) if x in DEVICE_FLAGS]
+
+
+class SessionBurst(object):
+    """
+    One burst of a GeneratorSession, standing in for the Popen of a one-shot generator
+
+    Exits (poll/wait/exitcode) when the generator reports the burst done, a
+    SIGINT ends just this burst, and the readiness fd is its sentinel so a
+    ChildWatcher wakes up on it like it would on a process.
+    """
+    def __init__(self,session:"GeneratorSession"):
+        self.session    = session
+        self.pid        = session.proc.pid
+        self.spawned_at = time.perf_counter()
+        self.tx_start   = None
+        self.tx_stop    = None
+        self.returncode = None
+    def _handle(self,event):
+        if event is None:
+            return
+        name,values = event
+        if name == 'ready' and values:
+            self.tx_start = values[0]
+        elif name == 'done':
+            self.tx_stop = values[-1] if values else None
+            self.returncode = 0
+    def wait_ready(self,timeout:float,watcher=None,keep_waiting=None):
+        """ :return: the transmit start time, or None if it never came """
+        deadline = time.time() + timeout
+        def still_waiting():
+            ### a watcher polling this burst may be the one that reads the event
+            return self.tx_start is None and (keep_waiting is None or keep_waiting())
+        while self.tx_start is None and self.poll() is None:
+            event = self.session.ready.wait_event(deadline - time.time(),watcher,still_waiting)
+            if event is None:
+                break
+            self._handle(event)
+        return self.tx_start
+    def poll(self):
+        while self.returncode is None:
+            event = self.session.ready.poll_event()
+            if event is None:
+                break
+            self._handle(event)
+        if self.returncode is None and self.session.proc.poll() is not None:
+            ### the whole generator went away
+            self.returncode = self.session.proc.returncode
+        return self.returncode
+    @property
+    def exitcode(self):
+        return self.poll()
+    @property
+    def sentinel(self):
+        return self.session.ready.r
+    def wait(self,timeout:float=None):
+        deadline = None if timeout is None else time.time() + timeout
+        while self.poll() is None:
+            remaining = None if deadline is None else deadline - time.time()
+            if remaining is not None and remaining <= 0:
+                raise subprocess.TimeoutExpired(self.session.command,timeout)
+            ### wake on the pipe, or every second to notice the process dying
+            event = self.session.ready.wait_event(1.0 if remaining is None else min(remaining,1.0))
+            self._handle(event)
+        return self.returncode
+    def send_signal(self,sig:int):
+        if self.poll() is not None:
+            return
+        if sig == signal.SIGINT:
+            ### end the burst, keep the radio
+            sig = signal.SIGUSR1
+        self.session.proc.send_signal(sig)
+
+class GeneratorSession(object):
+    """
+    A wfgen_* generator kept attached to its radio across bursts
+
+    Started with -S it runs the burst from its command line, then reads further
+    bursts from stdin, one line of the same flags each, so UHD is only set up
+    once. Bursts are reported on the readiness pipe.
+    """
+    def __init__(self,command:List[str],env:dict=None):
+        self.command = list(command)
+        self.device  = device_args(command)
+        self.ready   = ReadyPipe()
+        self.proc    = spawn(self.command + [SESSION_FLAG],env=self.ready.env(env),
+                             keep_fds=self.ready.pass_fds(),stdin=subprocess.PIPE)
+        self.ready.spawned()
+        self.burst   = SessionBurst(self)
+        self.burst.spawned_at = self.proc.spawned_at
+    @staticmethod
+    def supports(command:List[str]):
+        return len(command) > 0 and os.path.basename(command[0]) in SESSION_CAPABLE
+    def matches(self,command:List[str]):
+        """ :return: True if command can run as the next burst of this session """
+        return self.alive() and command[0] == self.command[0] and device_args(command) == self.device
+    def alive(self):
+        return self.proc.poll() is None
+    def next_burst(self,command:List[str]):
+        """
+        Hand the generator its next burst (the previous one must be done)
+
+        :return: the SessionBurst to wait on, like the Popen of a fresh launch
+        """
+        if self.burst is not None and self.burst.poll() is None:
+            raise RuntimeError("Previous burst of {0!s} is still running".format(self.proc.pid))
+        ### command[idx] is the token before x
+        line = " ".join([x for idx,x in enumerate(command[1:]) if x not in DEVICE_FLAGS and command[idx] not in DEVICE_FLAGS])
+        self.burst = SessionBurst(self)
+        try:
+            self.proc.stdin.write((line + "\n").encode())
+            self.proc.stdin.flush()
+        except BrokenPipeError:
+            raise RuntimeError("Session {0!s} is gone".format(self.proc.pid))
+        return self.burst
+    def close(self,timeout:float=10.0):
+        if self.alive():
+            try:
+                self.proc.stdin.write(b"quit\n")
+                self.proc.stdin.close()
+            except (BrokenPipeError,ValueError):
+                pass
+            try:
+                self.proc.wait(timeout)
+            except subprocess.TimeoutExpired:
+                self.proc.send_signal(signal.SIGINT)
+                self.proc.wait()
+        elif self.proc.stdin is not None and not self.proc.stdin.closed:
+            self.proc.stdin.close()
+        self.ready.close()
+
+
+class BurstLauncher(object):
+    """
+    What the run-mode workers launch through, one per worker
+
+    Reuses a GeneratorSession for consecutive bursts on the same device when
+    sessions are enabled and the generator supports them, otherwise every
+    burst is a fresh process with its own readiness pipe. Only the
+    generators in SESSION_CAPABLE have a session mode, a burst for any
+    other one closes the open session first so the radio is free for it.
+    """
+    def __init__(self,sessions:bool=None):
+        self.sessions = sessions_enabled() if sessions is None else sessions
+        self.session  = None
+        self.ready    = None
+        ### generators that had to fall back to one-shot, reported once each
+        self.one_shot = set()
+        ### the environment every burst starts from, only WFGEN_READY_FD changes per burst
+        self.env      = dict(os.environ)
+    def start(self,command:List[str]):
+        """ :return: the Popen (or SessionBurst) running this burst """
+        if self.sessions and GeneratorSession.supports(command):
+            if self.session is not None and self.session.matches(command):
+                try:
+                    return self.session.next_burst(command)
+                except RuntimeError:
+                    pass
+            self.close()
+            self.session = GeneratorSession(command,self.env)
+            return self.session.burst
+        if self.sessions:
+            self._fall_back(command)
+        self.ready = ReadyPipe()
+        proc = spawn(command,env=self.ready.env(self.env),keep_fds=self.ready.pass_fds())
+        self.ready.spawned()
+        return proc
+    def wait_ready(self,proc,timeout:float,watcher=None,keep_waiting=None):
+        """ :return: the transmit start time, or None if it never came """
+        if isinstance(proc,SessionBurst):
+            tx_start = proc.wait_ready(timeout,watcher,keep_waiting)
+        else:
+            tx_start = self.ready.wait(timeout,watcher,keep_waiting)
+            self.ready.close()
+            self.ready = None
+        if tx_start is not None:
+            launch_stats.readied(time.perf_counter()-proc.spawned_at)
+        return tx_start
+    def _fall_back(self,command:List[str]):
+        generator = os.path.basename(command[0]) if command else ''
+        if generator not in self.one_shot:
+            self.one_shot.add(generator)
+            print("{0!s} has no session mode, running its bursts one-shot".format(generator),flush=True)
+        ### the session may hold the very radio this burst needs
+        self.close()
+    def close(self):
+        if self.session is not None:
+            self.session.close()
+            self.session = None
@@ -0,0 +1,461 @@
+import os
+import json
+import time
+import signal
+import tempfile
+import itertools
+import threading
+import traceback
+import subprocess
+import multiprocessing as mp
+from datetime import datetime, timezone
+from typing import List
+
+try:
+    from .watcher import ChildWatcher
+    from .session import BurstLauncher
+except ImportError:
+    from wfgen.watcher import ChildWatcher
+    from wfgen.session import BurstLauncher
+
+INF = float('inf')
+### same as server.run
+TRUTH_TEMPLATE = 'truth_dev_{serial:s}_instance_{instance:05d}.json'
+
+_dry_run = None
+
+def active():
+    """ :return: the DryRun in effect, or None for a real run """
+    return _dry_run
+
+def get_time():
+    """ seconds since the epoch (UTC), virtual while a dry run is in effect """
+    run = _dry_run
+    if run is not None:
+        return run.clock.now()
+    return datetime.now(timezone.utc).timestamp()
+
+def new_process(target,args=()):
+    """ mp.Process, or a SimProcess during a dry run """
+    run = _dry_run
+    if run is not None:
+        return SimProcess(run,target,args)
+    return mp.Process(target=target,args=args)
+
+def new_watcher():
+    run = _dry_run
+    return ChildWatcher() if run is None else SimWatcher(run)
+
+def new_launcher():
+    run = _dry_run
+    return BurstLauncher() if run is None else SimLauncher(run)
+
+def set_signal_handler(sig:int,handler):
+    """ signal.signal, or its stand in on a SimProcess (they're threads, signals can't reach them) """
+    run = _dry_run
+    proc = None if run is None else run.current()
+    if proc is None:
+        signal.signal(sig,handler)
+    else:
+        proc.handlers[sig] = handler
+
+def sim_radio_info(count:int):
+    """ uhd_find_devices output listing count simulated B200s """
+    out = []
+    for idx in range(count):
+        out += [
+            "--------------------------------------------------",
+            "-- UHD Device {0:d}".format(idx),
+            "--------------------------------------------------",
+            "Device Address:",
+            "    serial: SIM{0:04d}".format(idx),
+            "    name: sim{0:d}".format(idx),
+            "    product: B200",
+            "    type: b200",
+            "",
+            "",
+        ]
+    return "\n".join(out)
+
+
+class SimTerminated(BaseException):
+    """ a SimProcess taking the default action for SIGTERM/SIGINT (dying) """
+
+
+class VirtualClock(object):
+    """
+    Time for a dry run, it only moves once every simulated process is waiting
+
+    Then it jumps straight to the earliest deadline any of them waits for, so
+    idle air time costs nothing. Waiters that also wait on a predicate are
+    woken by notify() and re-check it, the clock never jumps past a waiter
+    whose predicate is already true.
+    """
+    def __init__(self,start:float=None):
+        self.cond    = threading.Condition()
+        self._now    = time.time() if start is None else start
+        self.members = 0
+        self.waiters = []
+        self.stalled = False
+    def now(self):
+        return self._now
+    def join(self):
+        with self.cond:
+            self.members += 1
+    def leave(self):
+        with self.cond:
+            self.members -= 1
+            self._advance()
+            self.cond.notify_all()
+    def notify(self):
+        """ something a waiter's predicate looks at has changed """
+        with self.cond:
+            self.cond.notify_all()
+    def _done(self,waiter):
+        deadline,predicate = waiter
+        return self._now >= deadline or (predicate is not None and predicate())
+    def _advance(self):
+        if self.stalled or not self.waiters or len(self.waiters) < self.members:
+            return
+        if any([self._done(w) for w in self.waiters]):
+            return
+        deadline = min([w[0] for w in self.waiters])
+        if deadline == INF:
+            ### everyone waits on something nobody will do
+            self.stalled = True
+        else:
+            self._now = deadline
+        self.cond.notify_all()
+    def wait_until(self,deadline:float,predicate=None):
+        """
+        Block until the clock reaches deadline or predicate() is true
+
+        :return: True if predicate() was, False if the deadline passed
+        """
+        with self.cond:
+            waiter = [deadline,predicate]
+            self.waiters.append(waiter)
+            try:
+                while True:
+                    if self.stalled:
+                        raise RuntimeError("Dry run stalled at {0:.3f}, every process is waiting with no deadline".format(self._now))
+                    if predicate is not None and predicate():
+                        return True
+                    if self._now >= deadline:
+                        return False
+                    self._advance()
+                    if self._now < deadline and not self.stalled:
+                        ### in case a predicate changed without a notify
+                        self.cond.wait(0.05)
+            finally:
+                self.waiters.remove(waiter)
+
+
+def _exited(child):
+    if hasattr(child,'poll'):
+        return child.poll() is not None
+    return child.exitcode is not None
+
+
+class SimProcess(object):
+    """
+    A thread standing in for an mp.Process during a dry run
+
+    Signals are delivered by calling the handler the target installed
+    through set_signal_handler, the default action ends it (SimTerminated is
+    raised at its next wait on the clock).
+    """
+    def __init__(self,run:"DryRun",target,args=()):
+        self.run      = run
+        self.target   = target
+        self.args     = args
+        self.pid      = run.next_pid()
+        self.handlers = dict()
+        self.signals  = 0
+        self.killed   = False
+        self.exitcode = None
+        self.thread   = threading.Thread(target=self._main,name="sim-{0:d}".format(self.pid),daemon=True)
+    def _main(self):
+        self.run.processes[threading.get_ident()] = self
+        try:
+            self.target(*self.args)
+            self.exitcode = 0
+        except SimTerminated:
+            self.exitcode = -signal.SIGTERM
+        except BaseException:
+            traceback.print_exc()
+            self.exitcode = 1
+        finally:
+            self.run.processes.pop(threading.get_ident(),None)
+            self.run.clock.leave()
+    def start(self):
+        ### a member before it runs, the clock can't move on without it
+        self.run.clock.join()
+        self.thread.start()
+    def is_alive(self):
+        return self.exitcode is None and self.thread.is_alive()
+    def send_signal(self,sig:int):
+        handler = self.handlers.get(sig,signal.SIG_DFL)
+        if handler is signal.SIG_IGN:
+            return
+        if callable(handler) and handler is not signal.default_int_handler:
+            handler(sig,None)
+        else:
+            self.killed = True
+        self.signals += 1
+        self.run.clock.notify()
+    def terminate(self):
+        self.send_signal(signal.SIGTERM)
+    def kill(self):
+        self.killed = True
+        self.run.clock.notify()
+    def join(self,timeout:float=None):
+        if self.run.current() is None:
+            self.thread.join(timeout)
+        else:
+            deadline = INF if timeout is None else self.run.clock.now() + timeout
+            self.run.wait_until(deadline,lambda: self.exitcode is not None)
+    def close(self):
+        pass
+
+
+class SimGenerator(object):
+    """
+    What a wfgen_* generator does, minus the radio
+
+    On the air startup seconds after launch, off again after its -d duration
+    or shutdown seconds after a SIGINT, and on the way out it writes the
+    -j truth file in the layout the real generators use.
+    """
+    def __init__(self,run:"DryRun",command:List[str]):
+        self.run        = run
+        self.command    = list(command)
+        self.pid        = run.next_pid()
+        self.spawned_at = time.perf_counter()
+        self.flags      = dict()
+        for idx in range(1,len(command)-1):
+            if command[idx].startswith('-'):
+                self.flags.setdefault(command[idx],command[idx+1])
+        now = run.clock.now()
+        self.ready_at   = now + run.startup
+        duration        = float(self.flags.get('-d',-1))
+        self.exit_at    = self.ready_at + duration if duration > 0 else INF
+        self.tx_start   = None
+        self.tx_stop    = None
+        self.returncode = None
+        self.lock       = threading.Lock()
+    def on_air(self):
+        return self.ready_at <= min(self.exit_at,self.run.clock.now())
+    def poll(self):
+        if self.returncode is None and self.run.clock.now() >= self.exit_at:
+            with self.lock:
+                if self.returncode is None:
+                    if self.on_air():
+                        self.tx_start,self.tx_stop = self.ready_at,self.exit_at
+                        self._write_truth()
+                    self.returncode = 0
+        return self.returncode
+    def send_signal(self,sig:int):
+        if self.poll() is not None:
+            return
+        if sig == signal.SIGKILL:
+            ### gone before the truth is written
+            with self.lock:
+                self.returncode = -sig
+        else:
+            self.exit_at = min(self.exit_at,self.run.clock.now() + self.run.shutdown)
+        self.run.clock.notify()
+    def terminate(self):
+        self.send_signal(signal.SIGTERM)
+    def kill(self):
+        self.send_signal(signal.SIGKILL)
+    def wait(self,timeout:float=None):
+        deadline = self.exit_at if timeout is None else min(self.exit_at,self.run.clock.now() + timeout)
+        self.run.wait_until(deadline,lambda: self.poll() is not None)
+        if self.poll() is None:
+            raise subprocess.TimeoutExpired(self.command,timeout)
+        return self.returncode
+    def _write_truth(self):
+        filename = self.flags.get('-j',None)
+        if filename is None:
+            return
+        fc = float(self.flags.get('-f',0.0))
+        rate = float(self.flags.get('-r',1e6))
+        bw = rate*float(self.flags.get('-b',1.0))
+        duration = self.tx_stop - self.tx_start
+        span = {'freq_lo':(fc-0.5*bw)*1e-6,'freq_hi':(fc+0.5*bw)*1e-6,'bw':bw*1e-6}
+        energy = dict(report_type='energy',instance_name='TXDL T000000',time_start=self.tx_start,
+                      time_stop=self.tx_stop,duration=duration,modulation='unknown',meta='',**span)
+        sig = dict(report_type='signal',instance_name='TXDL SG1',activity_type='lowprob_anomaly',
+                   reference_freq=fc*1e-6,protocol='unknown',modulation='unknown',modality='single_carrier',
+                   energy_bw=bw*1e-6,time_start=self.tx_start,time_stop=self.tx_stop,duration=duration,
+                   energy_set=['TXDL T000000'],**span)
+        source = dict(report_type='source',instance_name='TXDL S1',signal_set=['TXDL SG1'],
+                      device_origin=self.flags.get('-a',''))
+        misc = dict(start_tx=self.tx_start,stop_tx=self.tx_stop,command=" ".join(self.command),simulated=True)
+        with open(filename,'w') as fid:
+            json.dump({'reports':[energy,sig,source],'misc':misc},fid,indent=4)
+
+
+class SimLauncher(object):
+    """ BurstLauncher for a dry run, every burst is a SimGenerator """
+    def __init__(self,run:"DryRun"):
+        self.run = run
+    def start(self,command:List[str]):
+        return SimGenerator(self.run,command)
+    def wait_ready(self,proc:SimGenerator,timeout:float,watcher=None,keep_waiting=None):
+        """ :return: the transmit start time, or None if it never came """
+        def stop_waiting():
+            return proc.poll() is not None or (keep_waiting is not None and not keep_waiting())
+        self.run.wait_until(min(proc.ready_at,self.run.clock.now() + timeout),stop_waiting)
+        if proc.on_air():
+            return proc.ready_at
+        return None
+    def close(self):
+        pass
+
+
+class SimWatcher(object):
+    """ ChildWatcher for a dry run, waits on the virtual clock """
+    def __init__(self,run:"DryRun"):
+        self.run      = run
+        self.owner    = run.current()
+        self.children = []
+        self.seen     = 0
+        self._signals = False
+        self._woken   = False
+    def add(self,child):
+        if child not in self.children:
+            self.children.append(child)
+    def discard(self,child):
+        if child in self.children:
+            self.children.remove(child)
+    def wake_on_signals(self):
+        self._signals = self.owner is not None
+        if self._signals:
+            self.seen = self.owner.signals
+    def wakeup(self):
+        self._woken = True
+        self.run.clock.notify()
+    def _signaled(self):
+        return self._signals and self.owner.signals != self.seen
+    def wait(self,timeout:float=None,extra=[]):
+        """ :return: (exited children, []) -- there are never extras to report """
+        exited = [x for x in self.children if _exited(x)]
+        if exited:
+            return exited,[]
+        deadline = INF if timeout is None else self.run.clock.now() + max(timeout,0)
+        deadline = min([deadline] + [x.exit_at for x in self.children if isinstance(x,SimGenerator)])
+        self.run.wait_until(deadline,lambda: self._woken or self._signaled() or any([_exited(x) for x in self.children]))
+        self._woken = False
+        if self._signals:
+            self.seen = self.owner.signals
+        return [x for x in self.children if _exited(x)],[]
+    def close(self):
+        self.children = []
+
+
+class DryRun(object):
+    """
+    random_run/scripted_run against simulated radios on a virtual clock
+
+    Requests go through the same parse_* functions and run loops the server
+    uses, with the worker processes as threads and every generator a
+    SimGenerator, so a run of any length takes as long as its bookkeeping.
+
+        with DryRun(radios=2) as dry:
+            summary = dry.run_random({'runtime':7200.0,'profiles':['psk2'],...})
+
+    :param radios: number of simulated radios on the stand-in server
+    :param startup: seconds from a launch until the generator is on the air
+    :param shutdown: seconds a generator takes to wrap up after a SIGINT
+    :param root_dir: where the truth folder is made (a new temp dir if None)
+    :param start_time: virtual time the run starts at (now if None)
+    """
+    def __init__(self,radios:int=2,startup:float=0.5,shutdown:float=0.05,root_dir:str=None,start_time:float=None):
+        self.radios    = radios
+        self.startup   = startup
+        self.shutdown  = shutdown
+        self.root_dir  = tempfile.mkdtemp(prefix='wfgen_dry_') if root_dir is None else root_dir
+        self.clock     = VirtualClock(start_time)
+        self.processes = dict()
+        self._pids     = itertools.count(1 << 22)
+    def next_pid(self):
+        return next(self._pids)
+    def current(self):
+        """ :return: the SimProcess the calling thread is, or None """
+        return self.processes.get(threading.get_ident(),None)
+    def wait_until(self,deadline:float,predicate=None):
+        """ VirtualClock.wait_until for the calling SimProcess, which dies here if it was killed """
+        proc = self.current()
+        if proc is None:
+            raise RuntimeError("Only simulated processes can wait on the virtual clock")
+        if proc.killed:
+            raise SimTerminated()
+        done = self.clock.wait_until(deadline,lambda: proc.killed or (predicate is not None and predicate()))
+        if proc.killed:
+            raise SimTerminated()
+        return done
+    def __enter__(self):
+        global _dry_run
+        if _dry_run is not None:
+            raise RuntimeError("A dry run is already in effect")
+        _dry_run = self
+        return self
+    def __exit__(self,*args):
+        global _dry_run
+        _dry_run = None
+    def server_state(self):
+        """ a ServerState whose radios are the simulated ones """
+        try:
+            from .server import ServerState
+        except ImportError:
+            from wfgen.server import ServerState
+        ### a folder per run, truth folders are only named to the second
+        root = tempfile.mkdtemp(prefix='run_',dir=self.root_dir)
+        state = ServerState(root,None,[],TRUTH_TEMPLATE,False,use_log=False)
+        state.set_radios(sim_radio_info(self.radios))
+        return state
+    @property
+    def radio_args(self):
+        """ device args of the simulated radios, the keys of a run_script request """
+        return ['type=b200,serial=SIM{0:04d}'.format(idx) for idx in range(self.radios)]
+    def _run(self,parse,request:dict):
+        state = self.server_state()
+        wall,start = time.perf_counter(),self.clock.now()
+        entered = _dry_run is not self
+        if entered:
+            self.__enter__()
+        try:
+            proc = parse(request,state)
+            if proc is None or isinstance(proc,str):
+                raise RuntimeError("Dry run request refused: {0!s}".format(proc))
+            proc.join()
+        finally:
+            if entered:
+                self.__exit__()
+        if proc.exitcode != 0:
+            raise RuntimeError("Dry run failed (exitcode {0!s})".format(proc.exitcode))
+        state.consolidate()
+        return {
+            'save_dir':state.save_dir,
+            'report':state.get_truth_file(),
+            'instances':len(state.truth.merged),
+            'reports':len(state.truth),
+            'virtual_seconds':self.clock.now() - start,
+            'wall_seconds':time.perf_counter() - wall,
+        }
+    def run_random(self,request:dict):
+        """ a run_random request, as the server would get it (radios default to all of them) """
+        try:
+            from .run_modes.randomize import parse_random_run_reqest
+        except ImportError:
+            from wfgen.run_modes.randomize import parse_random_run_reqest
+        return self._run(parse_random_run_reqest,request)
+    def run_script(self,request:dict):
+        """ a run_script request, as the server would get it (keyed by radio_args) """
+        try:
+            from .run_modes.scripted import parse_script_request
+        except ImportError:
+            from wfgen.run_modes.scripted import parse_script_request
+        return self._run(parse_script_request,request)
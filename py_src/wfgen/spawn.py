@@ -0,0 +1,95 @@
+import os
+import time
+import shutil
+import threading
+import subprocess
+from typing import List
+
+### WFGEN_POSIX_SPAWN=0 goes back to the regular fork/exec path (for comparisons)
+USE_POSIX_SPAWN = os.environ.get('WFGEN_POSIX_SPAWN','1') != '0'
+
+
+class LaunchStats(object):
+    """
+    How long launches take, from the spawn call to a pid and to the generator
+    reporting it is on the air
+    """
+    def __init__(self):
+        self.spawn = []
+        self.ready = []
+        self.lock  = threading.Lock()
+    def spawned(self,seconds:float):
+        with self.lock:
+            self.spawn.append(seconds)
+    def readied(self,seconds:float):
+        with self.lock:
+            self.ready.append(seconds)
+    @staticmethod
+    def _describe(values:List[float]):
+        if not values:
+            return None
+        values = sorted(values)
+        return {
+            'count':len(values),
+            'mean':sum(values)/len(values),
+            'p50':values[len(values)//2],
+            'p95':values[min(len(values)-1,int(0.95*len(values)))],
+            'max':values[-1],
+        }
+    def summary(self):
+        with self.lock:
+            return {'spawn':self._describe(self.spawn),'ready':self._describe(self.ready)}
+    def __str__(self):
+        out = []
+        for name,stats in self.summary().items():
+            if stats is None:
+                continue
+            out.append("{0:s}: n={1:d} mean={2:.2f}ms p50={3:.2f}ms p95={4:.2f}ms max={5:.2f}ms".format(
+                name,stats['count'],1e3*stats['mean'],1e3*stats['p50'],1e3*stats['p95'],1e3*stats['max']))
+        return "launch latency " + (", ".join(out) if out else "(no launches)")
+
+launch_stats = LaunchStats()
+
+
+_resolved = dict()
+def resolve(program:str):
+    """ :return: the absolute path of program, cached after the first PATH search """
+    if os.path.dirname(program):
+        return program
+    if program not in _resolved:
+        found = shutil.which(program)
+        if found is None:
+            raise FileNotFoundError("No such program: {0!r}".format(program))
+        _resolved[program] = os.path.abspath(found)
+    return _resolved[program]
+
+_spawn_lock = threading.Lock()
+def spawn(argv:List[str],env:dict=None,stdout=None,stderr=None,keep_fds=(),stats:LaunchStats=launch_stats,stdin=None):
+    """
+    Start a generator without the cost of forking this (large) process
+
+    With an absolute executable and no close_fds sweep, subprocess hands the
+    launch to posix_spawn (vfork+exec), so the cost no longer grows with the
+    size of the parent. Anything the child needs open must be in keep_fds.
+
+    :param keep_fds: descriptors the child inherits (readiness pipe)
+    :return: a regular subprocess.Popen
+    """
+    t0 = time.perf_counter()
+    if not USE_POSIX_SPAWN:
+        proc = subprocess.Popen(argv,env=env,stdin=stdin,stdout=stdout,stderr=stderr,pass_fds=tuple(keep_fds))
+    else:
+        executable = resolve(argv[0])
+        ### held so a concurrent launch can't inherit someone else's descriptors
+        with _spawn_lock:
+            for fd in keep_fds:
+                os.set_inheritable(fd,True)
+            try:
+                proc = subprocess.Popen(argv,executable=executable,env=env,stdin=stdin,stdout=stdout,stderr=stderr,close_fds=False)
+            finally:
+                for fd in keep_fds:
+                    os.set_inheritable(fd,False)
+    proc.spawned_at = t0
+    if stats is not None:
+        stats.spawned(time.perf_counter()-t0)
+    return proc
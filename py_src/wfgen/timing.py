@@ -0,0 +1,134 @@
+import os
+import json
+import glob
+import argparse
+from typing import Dict,List
+
+try:
+    from .simulation import get_time
+    from .spawn import LaunchStats
+except ImportError:
+    from wfgen.simulation import get_time
+    from wfgen.spawn import LaunchStats
+
+### next to the truth_*.json of the same burst, named so the truth globs don't pick it up
+TIMING_PREFIX = 'timing_'
+EVENTS = [
+    'planned_start',    # when the plan wanted the first sample out (timed profiles only, hoppers are planned early)
+    'planned_stop',     # when the plan wanted it to stop
+    'launch',           # the launch call
+    'ready',            # the worker heard the generator is transmitting
+    'first_sample',     # what the generator reported as its first sample
+    'sigint',           # asked to wrap up (absent when it ended on its own)
+    'exit',             # the generator exited (truth written)
+]
+### name: (later event, earlier event)
+METRICS = {
+    'start_error':('first_sample','planned_start'),
+    'stop_error':('exit','planned_stop'),
+    'launch_latency':('first_sample','launch'),
+    'notify_latency':('ready','first_sample'),
+    'shutdown':('exit','sigint'),
+}
+
+def timing_path(json_truth:str):
+    """ :return: where the timing of the burst writing json_truth goes """
+    folder,name = os.path.split(json_truth)
+    if name.startswith('truth_'):
+        name = name[len('truth_'):]
+    return os.path.join(folder,TIMING_PREFIX + name)
+
+
+class BurstTiming(object):
+    """
+    Planned vs actual times of one burst, written next to its truth file
+
+    Times are what get_time gives (seconds since the epoch, virtual in a dry
+    run), events that never happened are left out.
+    """
+    def __init__(self,json_truth:str,profile:str,radio:str,instance:int,mode:str=None):
+        self.path   = timing_path(json_truth)
+        self.record = {
+            'profile':profile,
+            'radio':radio,
+            'instance':instance,
+            'mode':mode,
+            'events':dict(),
+        }
+    def mark(self,event:str,when:float=None):
+        if event not in EVENTS:
+            raise ValueError("Unknown timing event: {0!s}".format(event))
+        self.record['events'][event] = get_time() if when is None else when
+    def write(self):
+        """ best effort, the truth file is what matters """
+        try:
+            with open(self.path,'w') as fp:
+                json.dump(self.record,fp,indent=2)
+        except OSError:
+            return False
+        return True
+
+def metrics(record:dict):
+    """ :return: {metric: seconds} for the metrics the recorded events allow """
+    events = record['events']
+    out = dict()
+    for name,(later,earlier) in METRICS.items():
+        if events.get(later) is not None and events.get(earlier) is not None:
+            out[name] = events[later] - events[earlier]
+    return out
+
+def load(paths:List[str]):
+    records = []
+    for path in paths:
+        if os.path.isdir(path):
+            path = os.path.join(path,'**',TIMING_PREFIX + '*.json')
+        for filename in sorted(glob.glob(path,recursive=True)):
+            try:
+                with open(filename,'r') as fp:
+                    records.append(json.load(fp))
+            except (OSError,ValueError):
+                continue
+    return records
+
+def summarize(records:List[dict],by:str='profile'):
+    """
+    :param by: 'profile' or 'radio'
+    :return: {group: {metric: count/mean/p50/p95/max}}
+    """
+    grouped = dict()
+    for record in records:
+        group = grouped.setdefault(str(record.get(by)),dict())
+        for name,value in metrics(record).items():
+            group.setdefault(name,list()).append(value)
+    return {group:{name:LaunchStats._describe(values) for name,values in sorted(values.items())}
+            for group,values in sorted(grouped.items())}
+
+def format_summary(summary:Dict[str,dict],by:str):
+    lines = []
+    for group,stats in summary.items():
+        lines.append("{0:s} {1:s}".format(by,group))
+        for name,desc in stats.items():
+            lines.append("  {0:<15s} n={1:<5d} mean={2:+9.2f}ms p50={3:+9.2f}ms p95={4:+9.2f}ms max={5:+9.2f}ms".format(
+                name,desc['count'],1e3*desc['mean'],1e3*desc['p50'],1e3*desc['p95'],1e3*desc['max']))
+    return "\n".join(lines)
+
+def main():
+    p = argparse.ArgumentParser(description="Jitter of the planned vs actual burst timing of a run")
+    p.add_argument('input',nargs='+',type=str,help='truth folders or timing_*.json files')
+    p.add_argument('--by',type=str,nargs='+',default=['profile','radio'],choices=['profile','radio'],
+                   help='how to group the percentiles')
+    p.add_argument('--json',type=str,default=None,help='also write the summary here')
+    args = p.parse_args()
+    records = load(args.input)
+    print("{0:d} bursts".format(len(records)))
+    out = dict()
+    for by in args.by:
+        out[by] = summarize(records,by)
+        print(format_summary(out[by],by))
+    if args.json is not None:
+        with open(args.json,'w') as fp:
+            json.dump(out,fp,indent=2)
+        print('results written to',args.json)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+import os
+import glob
+import json
+import threading
+
+
+class TruthIndex(object):
+    """
+    Running merge of truth_*.json reports
+
+    Same merge as consolidate_reports.py (instance names get a ':<n>' suffix
+    per file, source reports are merged by device_origin), but files are
+    folded in one at a time as they show up instead of all at once.
+    """
+    def __init__(self):
+        self.reports = []
+        self.sources = dict()
+        self.merged  = set()
+        self.lock    = threading.RLock()
+    def merge_file(self,filename:str):
+        """
+        :return: False if the file couldn't be read (yet), it will be tried again next time
+        """
+        with self.lock:
+            if filename in self.merged:
+                return True
+            try:
+                with open(filename,'r') as fp:
+                    contents = json.load(fp)
+            except (OSError,ValueError):
+                return False
+            ext = ':' + str(len(self.merged))
+            for r in contents.get('reports',[]):
+                r['instance_name'] += ext
+                if r['report_type'] == 'energy':
+                    self.reports.append(r)
+                if r['report_type'] == 'signal':
+                    r['energy_set'] = list(es+ext for es in r['energy_set'])
+                    self.reports.append(r)
+                if r['report_type'] == 'source':
+                    if r['device_origin'] not in self.sources:
+                        self.sources[r['device_origin']] = {'stats':r,'set':list()}
+                    self.sources[r['device_origin']]['set'] += list(ss+ext for ss in r['signal_set'])
+            self.merged.add(filename)
+            return True
+    def merge_new(self,pattern:str):
+        """
+        Merge whatever matches pattern and hasn't been merged already
+
+        :return: number of files merged
+        """
+        with self.lock:
+            count = 0
+            for filename in sorted(glob.glob(pattern)):
+                if filename not in self.merged and self.merge_file(filename):
+                    count += 1
+            return count
+    def to_dict(self):
+        with self.lock:
+            sources = []
+            for dsr in self.sources.values():
+                r = dict(dsr['stats'])
+                r['signal_set'] = list(dsr['set'])
+                sources.append(r)
+            return {'reports':self.reports + sources}
+    def write(self,output_file:str):
+        report = self.to_dict()
+        with open(output_file,'w') as fid:
+            json.dump(report,fid,indent=2)
+        return len(report['reports'])
+    def __len__(self):
+        with self.lock:
+            return len(self.reports) + len(self.sources)
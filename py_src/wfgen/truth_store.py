@@ -0,0 +1,183 @@
+import os
+import json
+import sqlite3
+import argparse
+from urllib.request import pathname2url
+import numpy as np
+from typing import Union,Iterable
+
+### columns pulled out of every report so they can be indexed and queried,
+### the full report is kept alongside as json so nothing is lost
+COLUMNS = [
+    ('report_type','TEXT'),
+    ('instance_name','TEXT'),
+    ('time_start','REAL'),
+    ('time_stop','REAL'),
+    ('freq_lo','REAL'),
+    ('freq_hi','REAL'),
+    ('device_origin','TEXT'),
+]
+INDEXED = ['instance_name','time_start','time_stop','freq_lo','freq_hi']
+ARRAY_DTYPE = np.dtype([
+    ('rowid','i8'),
+    ('time_start','f8'),
+    ('time_stop','f8'),
+    ('freq_lo','f8'),
+    ('freq_hi','f8'),
+])
+
+
+class TruthStore(object):
+    """
+    Truth reports in an indexed SQLite file
+
+    Time/frequency window queries only touch the matching rows instead of
+    parsing a whole report_of_truth.json.
+
+    :param path: the .sqlite file (created if missing, unless readonly)
+    :param readonly: open an existing store without ever writing to it
+    :raise FileNotFoundError: readonly and there is no such file
+    :raise ValueError: readonly and the file isn't a truth store
+    """
+    def __init__(self,path:str,readonly:bool=False):
+        self.path = path
+        self.db = None
+        if readonly:
+            if not os.path.isfile(path):
+                raise FileNotFoundError("No truth store at {0!s}".format(path))
+            ### mode=ro, a mistyped path can't turn into a fresh empty database
+            self.db = sqlite3.connect("file:{0:s}?mode=ro".format(pathname2url(os.path.abspath(path))),uri=True)
+            found = self.db.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='reports'").fetchone()
+            if found is None:
+                self.close()
+                raise ValueError("{0!s} isn't a truth store".format(path))
+            return
+        self.db = sqlite3.connect(path)
+        self.db.execute("CREATE TABLE IF NOT EXISTS reports (id INTEGER PRIMARY KEY, {0:s}, body TEXT)".format(
+            ", ".join(["{0:s} {1:s}".format(*x) for x in COLUMNS])))
+        for column in INDEXED:
+            self.db.execute("CREATE INDEX IF NOT EXISTS idx_{0:s} ON reports ({0:s})".format(column))
+        self.db.execute("CREATE INDEX IF NOT EXISTS idx_type_time ON reports (report_type,time_start)")
+        self.db.commit()
+    def add(self,reports:Iterable[dict]):
+        """ :return: number of reports stored """
+        rows = (tuple(r.get(x[0],None) for x in COLUMNS) + (json.dumps(r),) for r in reports)
+        with self.db:
+            cursor = self.db.executemany("INSERT INTO reports ({0:s}, body) VALUES ({1:s})".format(
+                ", ".join([x[0] for x in COLUMNS]),", ".join(["?"]*(len(COLUMNS)+1))),rows)
+        return cursor.rowcount
+    def _where(self,report_type=None,t0=None,t1=None,f_lo=None,f_hi=None,instance_name=None):
+        clauses,args = [],[]
+        if report_type is not None:
+            clauses.append("report_type = ?")
+            args.append(report_type)
+        if instance_name is not None:
+            clauses.append("instance_name = ?")
+            args.append(instance_name)
+        ### overlaps, not contained in
+        if t0 is not None:
+            clauses.append("time_stop >= ?")
+            args.append(t0)
+        if t1 is not None:
+            clauses.append("time_start <= ?")
+            args.append(t1)
+        if f_lo is not None:
+            clauses.append("freq_hi >= ?")
+            args.append(f_lo)
+        if f_hi is not None:
+            clauses.append("freq_lo <= ?")
+            args.append(f_hi)
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "",args
+    def query(self,report_type:str=None,t0:float=None,t1:float=None,f_lo:float=None,f_hi:float=None,instance_name:str=None):
+        """
+        Reports overlapping the given window (times in seconds, frequencies in MHz)
+
+        :return: generator of report dicts, in insertion order
+        """
+        where,args = self._where(report_type,t0,t1,f_lo,f_hi,instance_name)
+        for (body,) in self.db.execute("SELECT body FROM reports" + where + " ORDER BY id",args):
+            yield json.loads(body)
+    def query_names(self,report_type:str,names:Iterable[str]):
+        """ reports of the given instance names (through the instance_name index), in insertion order """
+        names = list(names)
+        rows = []
+        ### stay under sqlite's bound parameter limit
+        for idx in range(0,len(names),500):
+            batch = names[idx:idx+500]
+            rows += self.db.execute("SELECT id,body FROM reports WHERE report_type = ? AND instance_name IN ({0:s})".format(
+                ", ".join(["?"]*len(batch))),[report_type]+batch).fetchall()
+        for _,body in sorted(rows):
+            yield json.loads(body)
+    def first_start(self,report_types:Iterable[str]):
+        """ :return: the earliest time_start of those report types, None if there are none """
+        report_types = list(report_types)
+        return self.db.execute("SELECT MIN(time_start) FROM reports WHERE report_type IN ({0:s})".format(
+            ", ".join(["?"]*len(report_types))),report_types).fetchone()[0]
+    def query_array(self,report_type:str=None,t0:float=None,t1:float=None,f_lo:float=None,f_hi:float=None):
+        """ same as query, but only the indexed columns as a structured array (no json parsing at all) """
+        where,args = self._where(report_type,t0,t1,f_lo,f_hi)
+        rows = self.db.execute("SELECT id,time_start,time_stop,freq_lo,freq_hi FROM reports" + where + " ORDER BY id",args).fetchall()
+        out = np.array([tuple(np.nan if v is None else v for v in r) for r in rows],dtype=ARRAY_DTYPE)
+        return out
+    def count(self,report_type:str=None):
+        where,args = self._where(report_type)
+        return self.db.execute("SELECT COUNT(*) FROM reports" + where,args).fetchone()[0]
+    def __len__(self):
+        return self.count()
+    def close(self):
+        if self.db is not None:
+            self.db.close()
+            self.db = None
+    def __enter__(self):
+        return self
+    def __exit__(self,*args):
+        self.close()
+
+
+def from_report(report:Union[str,dict],path:str):
+    """
+    Convert a report ({'reports':[...]} or a json file holding one) into a store
+
+    An existing store at path is replaced.
+    """
+    if isinstance(report,str):
+        with open(report,'r') as fp:
+            report = json.load(fp)
+    tmp = path + '.tmp'
+    if os.path.isfile(tmp):
+        os.remove(tmp)
+    with TruthStore(tmp) as store:
+        store.add(report['reports'])
+    os.replace(tmp,path)
+    return path
+
+def to_report(path:str,output_file:str=None):
+    """
+    Convert a store back to the json report format
+
+    :param output_file: written one report at a time if given, otherwise a dict is returned
+    """
+    with TruthStore(path,readonly=True) as store:
+        if output_file is None:
+            return {'reports':list(store.query())}
+        with open(output_file,'w') as fid:
+            fid.write('{"reports": [')
+            for idx,r in enumerate(store.query()):
+                fid.write((',\n' if idx else '\n') + json.dumps(r,indent=2))
+            fid.write('\n]}\n')
+    return output_file
+
+
+def main():
+    p = argparse.ArgumentParser(description="Convert truth reports to/from an indexed SQLite store")
+    p.add_argument('input',type=str,help='a .json report or a .sqlite store')
+    p.add_argument('output',type=str,help='the converted file')
+    args = p.parse_args()
+    if args.input.endswith('.sqlite'):
+        to_report(args.input,args.output)
+    else:
+        from_report(args.input,args.output)
+    print('results written to',args.output)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+import os
+import time
+import uuid
+import zlib
+import lzma
+import base64
+import threading
+from typing import Callable
+
+### codec name -> (compress, decompress)
+CODECS = {
+    'none': (lambda x: x, lambda x: x),
+    'zlib': (lambda x: zlib.compress(x,6), zlib.decompress),
+    'lzma': (lambda x: lzma.compress(x,preset=1), lzma.decompress),
+}
+DEFAULT_CHUNK = 4*1024*1024
+MAX_CHUNK = 16*1024*1024
+
+
+class TruthTransfer(object):
+    """
+    One report file being pulled by a client a chunk at a time
+
+    Every chunk is compressed on its own, so any offset can be (re)requested
+    and a client can pick an interrupted transfer back up where it stopped.
+    """
+    def __init__(self,path:str,codec:str='zlib'):
+        if codec not in CODECS:
+            raise ValueError("Unknown codec {0!r}, expected one of {1!s}".format(codec,list(CODECS.keys())))
+        self.tid       = uuid.uuid4().hex
+        self.path      = path
+        self.size      = os.path.getsize(path)
+        self.codec     = codec
+        self.last_used = time.time()
+    def read_chunk(self,offset:int,length:int=DEFAULT_CHUNK):
+        """
+        :return: (number of raw bytes, base64 of the compressed bytes)
+        """
+        if offset < 0 or offset > self.size:
+            raise ValueError("Offset {0!s} is outside of the report (size {1!s})".format(offset,self.size))
+        length = max(0,min(length,MAX_CHUNK,self.size-offset))
+        self.last_used = time.time()
+        with open(self.path,'rb') as fp:
+            fp.seek(offset)
+            raw = fp.read(length)
+        return len(raw),base64.b64encode(CODECS[self.codec][0](raw)).decode('ascii')
+
+class TruthTransfers(object):
+    """ Open transfers by id, dropped once fully read or left idle too long """
+    def __init__(self,max_idle:float=3600.0):
+        self.max_idle  = max_idle
+        self.transfers = dict()
+        self.lock      = threading.Lock()
+    def open(self,path:str,codec:str='zlib'):
+        transfer = TruthTransfer(path,codec)
+        with self.lock:
+            self.expire()
+            self.transfers[transfer.tid] = transfer
+        return transfer
+    def get(self,tid:str):
+        with self.lock:
+            return self.transfers.get(tid,None)
+    def close(self,tid:str):
+        with self.lock:
+            return self.transfers.pop(tid,None)
+    def expire(self):
+        now = time.time()
+        for tid in [k for k,v in self.transfers.items() if now - v.last_used > self.max_idle]:
+            del self.transfers[tid]
+
+
+def receive(request_chunk:Callable,size:int,codec:str,path:str,chunk_size:int=DEFAULT_CHUNK):
+    """
+    Pull a transfer straight to disk
+
+    An existing partial file at path is taken as the cursor to resume from.
+
+    :param request_chunk: callable(offset,length) -> (offset, raw bytes, base64 data)
+    :param size: total size the server announced
+    :param codec: compression the server uses for every chunk
+    :param path: where to write
+    :return: path once all of size has been written
+    """
+    if codec not in CODECS:
+        raise ValueError("Unknown codec {0!r}, expected one of {1!s}".format(codec,list(CODECS.keys())))
+    offset = os.path.getsize(path) if os.path.isfile(path) else 0
+    if offset > size:
+        offset = 0
+    with open(path,'r+b' if offset else 'wb') as fp:
+        fp.truncate(offset)
+        while offset < size:
+            got_offset,nbytes,data = request_chunk(offset,chunk_size)
+            raw = CODECS[codec][1](base64.b64decode(data))
+            if got_offset != offset or nbytes != len(raw) or nbytes == 0:
+                raise RuntimeError("Bad chunk at offset {0!s}: got {1!s} bytes for offset {2!s}".format(offset,nbytes,got_offset))
+            fp.seek(got_offset)
+            fp.write(raw)
+            offset += nbytes
+    return path
@@ -1,5 +1,6 @@
 
 import socket
+import functools
 import subprocess
 from typing import List
 import zmq
@@ -9,7 +10,9 @@ import numpy as np
 import json
 import os
 
+@functools.lru_cache(maxsize=None)
 def have_pygr():
+    ### cached, a failed import is searched for again on every attempt
     try:
         import pmt
         from gnuradio import gr
@@ -0,0 +1,109 @@
+import os
+import signal
+import subprocess
+import multiprocessing as mp
+import multiprocessing.connection
+
+
+def have_pidfd():
+    return hasattr(os,'pidfd_open')
+
+def popen_sentinel(proc:subprocess.Popen):
+    """
+    Open a pidfd for a Popen child so it can be waited on like an mp.Process sentinel
+
+    :return: the pidfd, or None if this platform/kernel can't provide one
+    """
+    if not have_pidfd():
+        return None
+    try:
+        return os.pidfd_open(proc.pid)
+    except OSError:
+        ### already reaped or an old kernel
+        return None
+
+_sigchld_installed = False
+def watch_sigchld():
+    """
+    Make SIGCHLD go through a (no-op) python handler so a wakeup fd sees it
+    """
+    global _sigchld_installed
+    if not _sigchld_installed:
+        signal.signal(signal.SIGCHLD,lambda *x: None)
+        _sigchld_installed = True
+
+def has_exited(child):
+    if isinstance(child,subprocess.Popen):
+        return child.poll() is not None
+    return child.exitcode is not None
+
+
+class ChildWatcher(object):
+    """
+    Block until a watched child exits, a signal arrives or a timeout passes
+
+    mp.Process children are waited on through their sentinels, Popen children
+    through a pidfd (or SIGCHLD where pidfds aren't available). Exited children
+    keep being reported until they are discarded.
+    """
+    def __init__(self):
+        self._wake_r,self._wake_w = os.pipe()
+        os.set_blocking(self._wake_r,False)
+        os.set_blocking(self._wake_w,False)
+        self.children = dict()
+        self._owned = set()
+        self._signals = False
+    def add(self,child):
+        if child in self.children:
+            return
+        if isinstance(child,subprocess.Popen):
+            waitable = popen_sentinel(child)
+            if waitable is None:
+                watch_sigchld()
+            else:
+                self._owned.add(waitable)
+        else:
+            waitable = child.sentinel
+        self.children[child] = waitable
+    def discard(self,child):
+        waitable = self.children.pop(child,None)
+        if waitable in self._owned:
+            self._owned.discard(waitable)
+            os.close(waitable)
+    def wake_on_signals(self):
+        """ route every handled signal through the wake pipe (main thread only) """
+        signal.set_wakeup_fd(self._wake_w,warn_on_full_buffer=False)
+        self._signals = True
+    def wakeup(self):
+        try:
+            os.write(self._wake_w,b'\x00')
+        except BlockingIOError:
+            pass
+    def wait(self,timeout:float=None,extra=[]):
+        """
+        :param timeout: seconds to block for (None is forever)
+        :param extra: other waitables to wake on
+        :return: (exited children, ready extras)
+        """
+        exited = [x for x in self.children if has_exited(x)]
+        if exited:
+            return exited,[]
+        ### a child's sentinel can also be one of the extras (session bursts), wait on it once
+        waitables = list(dict.fromkeys([self._wake_r] + [x for x in self.children.values() if x is not None] + list(extra)))
+        ready = mp.connection.wait(waitables,None if timeout is None else max(timeout,0))
+        if self._wake_r in ready:
+            try:
+                while os.read(self._wake_r,4096):
+                    pass
+            except BlockingIOError:
+                pass
+        exited = [x for x in self.children if has_exited(x)]
+        return exited,[x for x in ready if x in extra]
+    def close(self):
+        if self._signals:
+            signal.set_wakeup_fd(-1)
+            self._signals = False
+        for child in list(self.children):
+            self.discard(child)
+        os.close(self._wake_r)
+        os.close(self._wake_w)
@@ -0,0 +1,64 @@
+#include "ready.hh"
+#include <errno.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <unistd.h>
+
+static int write_all(int fd, const char* msg, int len)
+{
+    int written = 0;
+    while(written < len){
+        ssize_t ret = write(fd,msg+written,len-written);
+        if(ret < 0){
+            if(errno == EINTR)
+                continue;
+            return -1;
+        }
+        written += ret;
+    }
+    return 1;
+}
+
+int ready_fd_take(void)
+{
+    const char* env = getenv(WFGEN_READY_FD_ENV);
+    if(env == NULL)
+        return -1;
+    char* end = NULL;
+    long fd = strtol(env,&end,10);
+    // only ever handed out once
+    unsetenv(WFGEN_READY_FD_ENV);
+    if(end == env || fd < 0)
+        return -1;
+    return (int)fd;
+}
+
+int notify_ready(double tx_start)
+{
+    if(getenv(WFGEN_READY_FD_ENV) == NULL)
+        return 0;
+    int fd = ready_fd_take();
+    if(fd < 0)
+        return -1;
+    int ret = notify_burst_ready(fd,tx_start);
+    close(fd);
+    return ret;
+}
+
+int notify_burst_ready(int fd, double tx_start)
+{
+    if(fd < 0)
+        return 0;
+    char msg[64];
+    int len = snprintf(msg,sizeof(msg),"ready %.9f\n",tx_start);
+    return write_all(fd,msg,len);
+}
+
+int notify_burst_done(int fd, double tx_start, double tx_stop)
+{
+    if(fd < 0)
+        return 0;
+    char msg[96];
+    int len = snprintf(msg,sizeof(msg),"done %.9f %.9f\n",tx_start,tx_stop);
+    return write_all(fd,msg,len);
+}
@@ -0,0 +1,20 @@
+import os
+import time
+import wfgen as wg
+
+RadioDiscovery = wg.discovery.RadioDiscovery
+
+def test_discovery_caches_parallel_probes(tmp_path,monkeypatch):
+    fake = os.path.join(tmp_path,'uhd_find_devices')
+    with open(fake,'w') as fp:
+        fp.write('#!/bin/sh\nsleep 0.5\necho "found $*"\n')
+    os.chmod(fake,0o755)
+    monkeypatch.setenv('PATH',str(tmp_path) + os.pathsep + os.environ['PATH'])
+    discovery = RadioDiscovery(['serial=a','serial=b','serial=c'],ttl=60)
+    t0 = time.time()
+    info = discovery.get()
+    assert time.time() - t0 < 1.4
+    assert info.index('serial=a') < info.index('serial=b') < info.index('serial=c')
+    t0 = time.time()
+    assert discovery.get() == info
+    assert time.time() - t0 < 0.1
@@ -0,0 +1,104 @@
+import time
+import threading
+import wfgen as wg
+
+RequestDispatcher = wg.dispatch.RequestDispatcher
+ALL_RESOURCES = wg.dispatch.ALL_RESOURCES
+
+def _serve(queue,dispatcher,keys,woke):
+    ### the server's main loop, minus the network
+    while queue:
+        woke.clear()
+        ready = queue.pop_ready(lambda x: keys[x.get_dest()],dispatcher.can_start)
+        if ready is None:
+            assert woke.wait(5.0)
+            continue
+        dispatcher.submit(*ready)
+
+def test_dispatch_serializes_shared_radios():
+    ServerRequests = wg.server.ServerRequests
+    order = []
+    lock = threading.Lock()
+    def handler(request):
+        with lock:
+            order.append(('start',request.get_dest()))
+        time.sleep(0.2)
+        with lock:
+            order.append(('stop',request.get_dest()))
+    woke = threading.Event()
+    dispatcher = RequestDispatcher(handler,on_done=woke.set)
+    queue = wg.server.RequestQueue()
+    keys = {'a':{0},'b':{1},'c':{0},'d':{ALL_RESOURCES},'e':{1},'ping':set()}
+    for name in ['a','b','c','d','e']:
+        assert queue.put(ServerRequests(name,['start_radio']))
+    assert queue.put(ServerRequests('ping',['ping']))
+    t0 = time.time()
+    _serve(queue,dispatcher,keys,woke)
+    assert dispatcher.drain(5.0)
+    dispatcher.shutdown()
+    ### a & b overlap, c waits on a, d waits on everything, e doesn't get past d
+    assert order.index(('start','b')) < order.index(('stop','a'))
+    assert order.index(('stop','a')) < order.index(('start','c'))
+    assert order.index(('stop','c')) < order.index(('start','d'))
+    assert order.index(('stop','d')) < order.index(('start','e'))
+    ### ping had nothing to wait on
+    assert order.index(('start','ping')) < order.index(('stop','a'))
+    assert time.time() - t0 < 1.3
+
+def test_kill_overtakes_queued_launch():
+    ServerRequests = wg.server.ServerRequests
+    release = threading.Event()
+    order = []
+    def handler(request):
+        order.append(request.get_message()[0])
+        if request.get_dest() == 'first':
+            release.wait(5.0)
+    dispatcher = RequestDispatcher(handler)
+    queue = wg.server.RequestQueue({'launch':1})
+    keys = {'first':{0},'launch':{0},'kill':{0}}
+    keys_of = lambda x: keys[x.get_dest()]
+    assert dispatcher.submit(ServerRequests('first',['start_radio']),{0})
+    assert queue.put(ServerRequests('launch',['start_radio']))
+    assert queue.put(ServerRequests('kill',['kill','1']))
+    ### both wait on radio 0 and stay queued, so the launch class is full
+    assert queue.pop_ready(keys_of,dispatcher.can_start) is None
+    assert len(queue) == 2
+    assert not queue.put(ServerRequests('launch',['run_random','{}']))
+    release.set()
+    assert dispatcher.drain(5.0)
+    request,_ = queue.pop_ready(keys_of,dispatcher.can_start)
+    assert request.get_dest() == 'kill'
+    assert dispatcher.submit(request,{0})
+    assert dispatcher.drain(5.0)
+    request,_ = queue.pop_ready(keys_of,dispatcher.can_start)
+    assert request.get_dest() == 'launch'
+    dispatcher.shutdown()
+    assert order == ['start_radio','kill']
+
+def test_pop_ready_tolerates_appends():
+    ServerRequests = wg.server.ServerRequests
+    queue = wg.server.RequestQueue()
+    assert queue.put(ServerRequests('a',['kill','1']))
+    assert queue.put(ServerRequests('b',['kill','2']))
+    def keys_of(request):
+        ### something landing on the control deque mid-walk
+        if request.get_dest() == 'a':
+            queue.appendleft(ServerRequests(None,['shutdown','quiet']))
+        return {request.get_dest()}
+    request,_ = queue.pop_ready(keys_of,lambda keys: 'b' in keys)
+    assert request.get_dest() == 'b'
+    assert [queue.popleft().get_message()[0] for _ in range(len(queue))] == ['shutdown','kill']
+
+def test_request_queue_priority():
+    ServerRequests = wg.server.ServerRequests
+    queue = wg.server.RequestQueue({'launch':2})
+    assert queue.put(ServerRequests('a',['run_script','{}']))
+    assert queue.put(ServerRequests('a',['start_radio','__debug_test__']))
+    assert not queue.put(ServerRequests('a',['run_random','{}']))
+    assert queue.put(ServerRequests('a',['get_truth']))
+    assert queue.put(ServerRequests('a',['get_active']))
+    assert queue.put(ServerRequests('b',['kill','12']))
+    queue.appendleft(ServerRequests(None,['shutdown','quiet']))
+    order = [queue.popleft().get_message()[0] for _ in range(len(queue))]
+    assert order == ['shutdown','kill','get_active','run_script','start_radio','get_truth']
+    assert not queue
@@ -0,0 +1,26 @@
+import sys
+import subprocess
+
+### only the stats/visualisation/audio paths need these
+DEFERRED = ['scipy','matplotlib','pydub','tqdm']
+### generous, it's ~0.1s on a dev box, it was ~0.8s with scipy and matplotlib
+BUDGET_SECONDS = 0.5
+
+def importtime(module:str):
+    """ :return: {module: cumulative seconds} from python -X importtime """
+    out = subprocess.run([sys.executable,"-X","importtime","-c","import "+module],
+                         capture_output=True,text=True,check=True).stderr
+    times = dict()
+    for line in out.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _,cumulative,name = line[len("import time:"):].split("|")
+        times[name.strip()] = int(cumulative)/1e6
+    return times
+
+def test_import_budget():
+    for module in ['wfgen','wfgen.client']:
+        times = importtime(module)
+        loaded = [x for x in times if x.split('.')[0] in DEFERRED]
+        assert loaded == [], "{0} imports {1}".format(module,loaded)
+        assert times[module] < BUDGET_SECONDS, "{0} took {1:.3f}s".format(module,times[module])
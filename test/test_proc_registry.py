@@ -0,0 +1,131 @@
+import time
+import subprocess
+import multiprocessing as mp
+import wfgen as wg
+
+ProcRegistry = wg.proc_registry.ProcRegistry
+
+def sleeper(duration):
+    time.sleep(duration)
+
+def test_registry_lookup():
+    registry = ProcRegistry()
+    proc = subprocess.Popen(["sleep","10"])
+    handle = registry.add(proc.pid,proc,"start_radio static",[2])
+    assert registry.get(proc.pid) is handle
+    assert registry.for_radio(2) == [handle]
+    assert handle.poll() is None
+    handle.interrupt()
+    assert handle.wait(5.0) is not None
+    registry.retire(proc.pid)
+    assert proc.pid not in registry
+    assert registry.for_radio(2) == []
+    assert registry.finished[-1].pid == proc.pid
+
+def test_registry_mp_sentinel():
+    registry = ProcRegistry()
+    proc = mp.Process(target=sleeper,args=(0.1,))
+    proc.start()
+    handle = registry.add(proc.pid,proc,"run_random",[0,1])
+    assert list(registry.sentinels().values()) == [handle]
+    assert handle.wait(5.0) == 0
+    registry.retire(proc.pid)
+    assert len(registry) == 0
+
+def test_finished_bounded():
+    registry = ProcRegistry(finished_limit=3)
+    for pid in range(10):
+        registry.add(pid,pid,"start_radio __debug_test__",[-1]).interrupt()
+        registry.retire(pid)
+    assert len(registry.finished) == 3
+    assert [x.pid for x in registry.finished] == [7,8,9]
+
+def test_reaper_escalates():
+    registry = ProcRegistry()
+    reaper = wg.proc_registry.Reaper(lambda h: registry.retire(h.pid),sigint_timeout=0.2,sigterm_timeout=0.2)
+    proc = subprocess.Popen(["bash","-c","trap '' INT TERM; sleep 10"])
+    time.sleep(0.2)
+    handle = registry.add(proc.pid,proc,"start_radio static",[0])
+    reaper.reap(handle)
+    assert handle.state == 'terminating'
+    assert reaper.drain(5.0)
+    assert registry.finished[-1].returncode == -9
+
+def test_popen_exit_wakes_watcher():
+    watcher = wg.watcher.ChildWatcher()
+    proc = subprocess.Popen(["sleep","0.2"])
+    watcher.add(proc)
+    start = time.time()
+    exited,_ = watcher.wait(5.0)
+    assert exited == [proc]
+    assert time.time() - start < 2.0
+    watcher.discard(proc)
+    watcher.close()
+
+def test_ready_pipe():
+    import sys
+    child = "import os; fd = int(os.environ['WFGEN_READY_FD']); os.write(fd,b'ready 12.5\\n'); os.close(fd)"
+    ready = wg.readiness.ReadyPipe()
+    stats = wg.spawn.LaunchStats()
+    proc = wg.spawn.spawn([sys.executable,"-c",child],env=ready.env(),keep_fds=ready.pass_fds(),stats=stats)
+    ready.spawned()
+    assert ready.wait(5.0) == 12.5
+    ready.close()
+    proc.wait()
+    assert stats.summary()['spawn']['count'] == 1
+
+def test_generator_session(tmp_path):
+    import sys
+    ### stands in for wfgen_linmod -S: one burst from argv, then one per stdin line
+    child = "\n".join([
+        "import os,sys",
+        "fd = int(os.environ['WFGEN_READY_FD'])",
+        "os.write(fd,b'ready 1.0\\ndone 1.0 2.0\\n')",
+        "for n,line in enumerate(sys.stdin,2):",
+        "    if line.strip() == 'quit': break",
+        "    os.write(fd,'ready {0}.0\\ndone {0}.0 {1}.0\\n'.format(n,n+1).encode())",
+    ])
+    script = tmp_path / "fake_linmod.py"
+    script.write_text(child)
+    command = [sys.executable,str(script),"-a","type=b200"]
+    session = wg.session.GeneratorSession(command)
+    burst = session.burst
+    assert burst.wait_ready(5.0) == 1.0
+    assert burst.wait(5.0) == 0
+    assert session.matches(command)
+    assert not session.matches(command[:-1] + ["type=x300"])
+    burst = session.next_burst(command)
+    watcher = wg.watcher.ChildWatcher()
+    watcher.add(burst)
+    assert burst.wait_ready(5.0,watcher) == 2.0
+    assert burst.wait(5.0) == 0 and burst.tx_stop == 3.0
+    watcher.close()
+    assert session.alive()
+    session.close()
+    assert not session.alive()
+
+def test_burst_launcher_falls_back(tmp_path,monkeypatch):
+    import sys
+    session_child = "\n".join([
+        "import os,sys",
+        "fd = int(os.environ['WFGEN_READY_FD'])",
+        "os.write(fd,b'ready 1.0\\ndone 1.0 2.0\\n')",
+        "sys.stdin.read()",
+    ])
+    one_shot_child = "import os; fd = int(os.environ['WFGEN_READY_FD']); os.write(fd,b'ready 5.0\\n'); os.close(fd)"
+    ### run directly, the launcher goes by the generator's name
+    for name,child in [("fake_linmod.py",session_child),("fake_fskmod.py",one_shot_child)]:
+        (tmp_path / name).write_text("#!" + sys.executable + "\n" + child)
+        (tmp_path / name).chmod(0o755)
+    monkeypatch.setattr(wg.session,'SESSION_CAPABLE',['fake_linmod.py'])
+    launcher = wg.session.BurstLauncher(sessions=True)
+    burst = launcher.start([str(tmp_path / "fake_linmod.py"),"-a","type=b200"])
+    assert isinstance(burst,wg.session.SessionBurst)
+    assert launcher.wait_ready(burst,5.0) == 1.0 and burst.wait(5.0) == 0
+    ### no session mode: the session lets go of the radio and the burst runs one-shot
+    proc = launcher.start([str(tmp_path / "fake_fskmod.py"),"-a","type=b200"])
+    assert launcher.session is None and launcher.one_shot == {'fake_fskmod.py'}
+    assert not isinstance(proc,wg.session.SessionBurst)
+    assert launcher.wait_ready(proc,5.0) == 5.0
+    proc.wait()
+    launcher.close()
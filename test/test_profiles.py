@@ -0,0 +1,46 @@
+import wfgen as wg
+
+
+def test_flag_table_cached():
+    table = wg.profiles.get_flag_table('hopper')
+    assert table is wg.profiles.get_flag_table('hopper')
+    assert ('json','-j') in table
+    assert all(flag is not None for _,flag in table)
+
+def test_start_argv():
+    prof = wg.profiles.linmod.qpsk(silent=True)
+    argv = prof.start_argv('-a type=b200',{'frequency':915e6,'gain':40,'json':'/tmp/truth.json'})
+    assert argv[:3] == ['wfgen_linmod','-a','type=b200']
+    assert argv[argv.index('-f')+1] == str(915e6)
+    assert argv[argv.index('-g')+1] == '40'
+    assert argv[-2:] == ['-M','qpsk']
+    assert prof.get_stats()['gain'] == 40
+    ### the string form is the same command
+    prof = wg.profiles.linmod.qpsk(silent=True)
+    assert prof.start('-a type=b200',{'frequency':915e6,'gain':40,'json':'/tmp/truth.json'}) == ' '.join(argv)
+
+def test_profile_registry():
+    registry = wg.profiles.get_profile_registry()
+    assert registry is wg.profiles.get_profile_registry()
+    assert wg.profiles.is_profile_name('qpsk')
+    assert wg.profiles.is_profile_name('gmsk','fsk')
+    assert not wg.profiles.is_profile_name('gmsk','lin')
+    assert not wg.profiles.is_profile_name('not_a_profile')
+    names = wg.profiles.get_all_profile_names()
+    assert len(names) == len(set(names)) == len(registry.by_name)
+    assert isinstance(wg.profiles.extract_profile_by_name('qpsk'),wg.profiles.linmod.qpsk)
+
+def test_lookup_cache(tmp_path):
+    import json
+    lookup = {'profiles':[
+        {'name':'qpsk_00','traceback':[{'file':'a.json','signals':['S1','S2']}]},
+        {'name':'qpsk_01','traceback':[{'file':'a.json','signals':['S2']},{'file':'b.json','signals':['S3']}]},
+    ]}
+    (tmp_path / 'test_profiles.json').write_text(json.dumps(lookup))
+    first = wg.profiles._profile._lookup_profile(lookup_dir=str(tmp_path))
+    assert first.unique_profile_names == ['qpsk_00','qpsk_01']
+    assert (tmp_path / '.profiles.cache.pickle').exists()
+    second = wg.profiles._profile._lookup_profile(lookup_dir=str(tmp_path))
+    assert second.profiles == first.profiles
+    assert second.traceback_index['a.json'] == {'S1':'qpsk_00','S2':['qpsk_00','qpsk_01']}
+    assert second.traceback_index[None]['S3'] == 'qpsk_01'
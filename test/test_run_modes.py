@@ -0,0 +1,158 @@
+import wfgen as wg
+
+def _claim_all(state,block,out):
+    instances = wg.run_modes.shared_state.InstanceBlock(state,block)
+    state.set_window_once(float(block),float(block)+1.0)
+    claimed = []
+    while True:
+        instance = instances.next()
+        if instance is None:
+            break
+        claimed.append(instance)
+    out.put(claimed)
+
+def test_shared_run_state():
+    import multiprocessing as mp
+    SharedRunState = wg.run_modes.shared_state.SharedRunState
+    state = SharedRunState(10,210)
+    assert state.start_time is None and state.end_time is None
+    out = mp.Queue()
+    procs = [mp.Process(target=_claim_all,args=(state,block,out)) for block in (1,3,7,1)]
+    for p in procs:
+        p.start()
+    claimed = sum([out.get(timeout=10) for _ in procs],[])
+    for p in procs:
+        p.join()
+    ### every instance handed out exactly once, none past the limit
+    assert sorted(claimed) == list(range(10,210))
+    assert state.remaining() == 0 and len(state.reserve(5)) == 0
+    ### whoever got there first set the window for everyone
+    start,end = state.start_time,state.end_time
+    assert end == start + 1.0
+    assert state.set_window_once(100.0,200.0) == (start,end)
+
+def test_random_plan():
+    RandomPlan = wg.run_modes.random_plan.RandomPlan
+    defaults = {'gain_limits':[30,60],'digital_gain_limits':0.0,'digital_cycle_limits':2.0,
+                'freq_limits':[[2.4e9,2.5e9]],'span_limits':[[5e3,20e6]],'duration_limits':[[0.1,10.0]],
+                'bw_limits':[[5e3,50e3],[1e6,2e6]],'burst_dwell_limits':[[0.05,1.0],[10.0,20.0]],
+                'burst_idle_limits':[[0.5,1.0],[1.0,2.0]]}
+    plan = RandomPlan.build(500,['psk2','fsk16'],defaults,seed=7,first=100)
+    again = RandomPlan.build(500,['psk2','fsk16'],defaults,seed=7,first=100)
+    assert len(plan) == 500
+    assert [plan.burst(x) for x in range(100,600)] == [again.burst(x) for x in range(100,600)]
+    seen = set()
+    for instance in range(100,600):
+        name,params = plan.burst(instance)
+        seen.add(name)
+        assert isinstance(params['gain'],int) and 30 <= params['gain'] <= 60
+        assert params['gain_range'] == 0.0
+        assert 2.4e9 <= params['frequency'] <= 2.5e9
+        assert 0.05 <= params['dwell_range'] <= 1.0 or 10.0 <= params['dwell_range'] <= 20.0
+        assert 220e3 <= params['rate'] <= 25e6
+        assert abs(params['bw']*params['rate'] - params['bandwidth']) < 1e-3
+        params['json'] = 'truth.json'
+        command = wg.profiles.extract_profile_by_name(name).start_argv("-a serial=1",params)
+        assert '-j' in command
+    assert seen == {'psk2','fsk16'}
+    try:
+        RandomPlan.build(5,['psk2'],dict(defaults,span_limits=[1.0,2.0,3.0]),seed=7)
+        assert False
+    except ValueError:
+        pass
+
+def test_deadline_queue():
+    deadlines = wg.run_modes.deadlines
+    queue = deadlines.DeadlineQueue([[{'profile':'c'},[300.0,320.0]],[{'profile':'a'},[100.0,120.0]],
+                                     [{'profile':'b'},[100.0,110.0]],[{'profile':'d'},[500.0,None]]])
+    assert queue.peek()[0]['profile'] == 'a'
+    ### a and b closed already, ties kept script order until then
+    assert queue.drop_closed(150.0) == 2
+    assert [queue.pop()[0]['profile'] for _ in range(len(queue))] == ['c','d']
+    leads = deadlines.LaunchLead(alpha=0.5)
+    assert leads.lead('psk2',0.1) == 0.1
+    leads.measured('psk2',1.0)
+    leads.measured('psk2',2.0)
+    assert leads.lead('psk2',0.1) == 1.5
+
+def test_assign_radios():
+    from wfgen.run_modes.radio_plan import assign_radios
+    ### three overlapping at most, touching windows conflict
+    windows = [[0.,10.],[1.,5.],[2.,3.],[5.5,8.],[10.,12.],[4.,6.],[13.,14.]]
+    sources = ['a','b','c','b','a','c','d']
+    assigned = assign_radios(windows,sources,3)
+    assert None not in assigned
+    assert len(set(assigned)) == 3
+    for radio in set(assigned):
+        mine = sorted([windows[x] for x in range(len(windows)) if assigned[x] == radio])
+        assert all([x[1] < y[0] for x,y in zip(mine[:-1],mine[1:])])
+    ### sources stick to their radio while it's free
+    assert assigned[2] == assigned[5]
+    ### one short, the ones starting while both are busy are dropped
+    assert assign_radios(windows,sources,2) == [0,1,None,1,1,None,0]
+    ### a pinned source never moves, others don't take its radio while a free one is left
+    assigned = assign_radios([[0.,1.],[0.,1.],[2.,3.]],['x','radio1','y'],2,{'radio1':1})
+    assert assigned == [0,1,0]
+    assert assign_radios([[0.,1.],[0.5,1.]],['radio1','radio1'],2,{'radio1':1}) == [1,None]
+    ### pinned radios nothing came from yet still pack onto the fewest
+    windows = [[0.,1.],[2.,3.],[4.,5.],[6.,7.]]
+    pinned = {'r0':0,'r1':1,'r2':2,'r3':3}
+    assert assign_radios(windows,['a','b','c','d'],4,pinned) == [0,0,0,0]
+    assert assign_radios(windows,['a','b','c','d'],4) == [0,0,0,0]
+
+def test_pin_sources():
+    from wfgen.run_modes.radio_plan import assign_radios,pin_sources
+    radios = ['serial=A','serial=B','serial=C']
+    sources = [{'instance_name':'S0','device_origin':'serial=B','signal_set':['s0','s2']},
+               {'instance_name':'S1','device_origin':'','signal_set':['s1','s3']}]
+    pinned = pin_sources(sources,radios)
+    assert pinned == {'serial=B':1}
+    ### the truth file's own radio stays put, the rest of the script packs onto one more
+    windows = [[0.,1.],[0.5,2.],[3.,4.],[5.,6.]]
+    assigned = assign_radios(windows,['serial=B','S1','serial=B','S1'],len(radios),pinned)
+    assert assigned == [1,0,1,0]
+
+def test_radio_plan_tracker():
+    from wfgen.run_modes.radio_plan import radio_plan_tracker
+    tracker = radio_plan_tracker(0,'serial=A')
+    for window in [[10.,20.],[0.,5.],[30.,40.]]:
+        tracker.reserve(*window)
+    assert tracker.occupied == [(0.,5.),(10.,20.),(30.,40.)]
+    ### closed intervals, touching a reservation isn't available
+    assert tracker.available(6.,9.)
+    assert not tracker.available(5.,9.)
+    assert not tracker.available(6.,10.)
+    assert not tracker.available(-1.,50.)
+    assert tracker.available(41.,50.)
+    try:
+        tracker.reserve(15.,35.)
+        assert False
+    except ValueError:
+        pass
+    assert 5. < tracker.next_free(3.) < 5.001
+    assert 20. < tracker.next_free(6.,5.) < 20.001
+    assert tracker.next_free(21.,5.) == 21.
+    assert tracker.release(10.,20.) and not tracker.release(10.,20.)
+    assert tracker.next_free(6.,5.) == 6.
+
+def test_concurrency():
+    from wfgen.run_modes.radio_plan import concurrency
+    peak,when,times,counts = concurrency([[0.,10.],[1.,5.],[2.,3.],[5.5,8.],[10.,12.],[4.,6.],[13.,14.]])
+    assert (peak,when) == (3,2.)
+    assert times.tolist() == [0.,1.,2.,3.,4.,5.,5.5,6.,8.,10.,12.,13.,14.]
+    assert counts.tolist() == [1,2,3,2,3,2,3,2,1,1,0,1,0]
+    ### touching windows still need two radios, like the tracker
+    assert concurrency([[0.,1.],[1.,2.]])[:2] == (2,1.)
+    assert concurrency([])[0] == 0
+
+def test_needed_radios_for_script(tmp_path):
+    import json
+    scripted = wg.run_modes.scripted
+    ### clipped to the runtime, anything starting at or after it never plays
+    windows = scripted._script_windows([{'time_start':-1.0,'time_stop':5.0},{'time_start':2.0,'time_stop':50.0},
+        {'time_start':3.0},{'time_start':10.0,'time_stop':12.0}],10.0)
+    assert windows == [[0.0,5.0],[2.0,10.0],[3.0,10.0]]
+    script = tmp_path / 'one.json'
+    script.write_text(json.dumps({'reports':[
+        {'instance_name':'s0','report_type':'signal','time_start':5.0,'time_stop':6.0,'energy_set':[]}]}))
+    assert scripted.needed_radios_for_script(str(script)) == 1
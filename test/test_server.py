@@ -105,4 +105,5 @@ def test_kill():
     reply = kill()
     assert reply[0] == "Killing"
     assert reply[1] == "process"
-    assert len(reply) == 3
+    assert reply[3] == "terminating"
+    assert len(reply) == 4
@@ -0,0 +1,77 @@
+import json
+import time
+import wfgen as wg
+
+DryRun = wg.simulation.DryRun
+
+def test_virtual_clock():
+    clock = wg.simulation.VirtualClock(start=100.0)
+    clock.join()
+    ### nobody else to wait on, straight to the deadline
+    assert clock.wait_until(160.0) is False
+    assert clock.now() == 160.0
+    clock.leave()
+    assert abs(wg.simulation.get_time() - time.time()) < 5.0
+
+def test_dry_random_run(tmp_path):
+    dry = DryRun(radios=3,root_dir=str(tmp_path))
+    t0 = time.time()
+    summary = dry.run_random({'runtime':3600.0,'profiles':['psk2','fsk16'],'seed':5,'instance_limit':120,
+        'profile_defaults':{'gain_limits':[30,60],'digital_gain_limits':0.0,'digital_cycle_limits':2.0,
+            'freq_limits':[[2.4e9,2.5e9]],'span_limits':[[5e3,20e6]],'duration_limits':[[5.0,60.0]],
+            'bw_limits':[[5e3,50e3],[1e6,2e6]],'burst_dwell_limits':[[0.05,1.0]],'burst_idle_limits':[[0.5,1.0]]}})
+    assert time.time() - t0 < 20.0
+    ### every instance played once, out of three radios in parallel
+    assert summary['instances'] == 120
+    assert 120*5.0/3 < summary['virtual_seconds'] < 3600.0
+    with open(summary['report'],'r') as fp:
+        reports = json.load(fp)['reports']
+    assert len([x for x in reports if x['report_type'] == 'signal']) == 120
+    assert len([x for x in reports if x['report_type'] == 'source']) == 3
+    ### and the timing of every burst next to its truth
+    timings = wg.timing.load([summary['save_dir']])
+    assert len(timings) == 120
+    by_radio = wg.timing.summarize(timings,'radio')
+    assert sorted(by_radio) == ['SIM0000','SIM0001','SIM0002']
+    assert all([abs(x['launch_latency']['p50'] - 0.5) < 1e-6 for x in by_radio.values()])
+
+def test_dry_random_run_minimal(tmp_path):
+    ### the README example, everything else left to the defaults
+    dry = DryRun(radios=2,root_dir=str(tmp_path))
+    summary = dry.run_random({'runtime':7200.0,'profiles':['psk2'],'instance_limit':500})
+    assert 0 < summary['instances'] <= 500
+    assert summary['virtual_seconds'] >= 7200.0
+    with open(summary['report'],'r') as fp:
+        reports = json.load(fp)['reports']
+    assert len([x for x in reports if x['report_type'] == 'signal']) == summary['instances']
+
+def test_dry_scripted_run(tmp_path):
+    dry = DryRun(radios=2,root_dir=str(tmp_path))
+    sig = dict(profile='psk2',mode='static',freq_lo=2.40e9,freq_hi=2.401e9,rate=1e6,gain=40,bw=0.5,duration=10.0)
+    request = {'runtime':7200.0,'flags':0,'toggles':{}}
+    for idx,args in enumerate(dry.radio_args):
+        request[args] = [[idx]*10,{'signal':dict(sig),'timing':[1000.0,1100.0]}]
+    t0 = time.time()
+    summary = dry.run_script(request)
+    assert time.time() - t0 < 20.0
+    assert summary['virtual_seconds'] >= 7200.0
+    with open(summary['report'],'r') as fp:
+        reports = json.load(fp)['reports']
+    signals = [x for x in reports if x['report_type'] == 'signal']
+    assert len(signals) == summary['instances'] > 0
+    ### all of it inside the virtual run
+    start = min([x['time_start'] for x in signals])
+    assert max([x['time_stop'] for x in signals]) <= start + summary['virtual_seconds']
+
+def test_dry_hopper_start_error(tmp_path):
+    ### hoppers launch time_buffer_hopper early on purpose, that isn't a start error
+    dry = DryRun(radios=1,root_dir=str(tmp_path))
+    sig = dict(profile='psk2',mode='hopper',freq_lo=2.40e9,freq_hi=2.48e9,rate=1e6,gain=40,bw=0.5,
+               duration=10.0,dwell=1.0,absence=0.5)
+    request = {'runtime':600.0,'flags':0,'toggles':{},dry.radio_args[0]:[[0],{'signal':sig,'timing':[100.0,150.0]}]}
+    summary = dry.run_script(request)
+    by_profile = wg.timing.summarize(wg.timing.load([summary['save_dir']]),'profile')
+    start_error = by_profile['psk2']['start_error']
+    assert start_error['count'] == 1
+    ### just the simulated launch latency
+    assert abs(start_error['max'] - 0.5) < 1e-3
@@ -0,0 +1,75 @@
+import os
+import json
+import wfgen as wg
+
+TruthIndex = wg.truth.TruthIndex
+
+def write_report(folder,name,origin):
+    reports = [
+        {'instance_name':'e0','report_type':'energy'},
+        {'instance_name':'s0','report_type':'signal','energy_set':['e0']},
+        {'instance_name':'src','report_type':'source','device_origin':origin,'signal_set':['s0']},
+    ]
+    with open(os.path.join(folder,name),'w') as fp:
+        json.dump({'reports':reports},fp)
+
+def test_incremental_merge(tmp_path):
+    pattern = os.path.join(tmp_path,'truth*.json')
+    truth = TruthIndex()
+    write_report(tmp_path,'truth_a.json','radio0')
+    assert truth.merge_new(pattern) == 1
+    write_report(tmp_path,'truth_b.json','radio0')
+    with open(os.path.join(tmp_path,'truth_c.json'),'w') as fp:
+        fp.write('{"reports": [')
+    ### only the new complete file is merged, the partial one waits
+    assert truth.merge_new(pattern) == 1
+    report = truth.to_dict()['reports']
+    assert [x['instance_name'] for x in report] == ['e0:0','s0:0','e0:1','s0:1','src:0']
+    assert report[3]['energy_set'] == ['e0:1']
+    assert report[-1]['signal_set'] == ['s0:0','s0:1']
+
+def test_truth_store_window_query(tmp_path):
+    reports = [{'instance_name':'e{0:d}'.format(i),'report_type':'energy',
+                'time_start':float(i),'time_stop':i+0.5,
+                'freq_lo':2400.0+i,'freq_hi':2401.0+i} for i in range(200)]
+    reports.append({'instance_name':'src','report_type':'source','device_origin':'radio0','signal_set':[]})
+    json_file = os.path.join(tmp_path,'report_of_truth.json')
+    with open(json_file,'w') as fp:
+        json.dump({'reports':reports},fp)
+    store_file = wg.truth_store.from_report(json_file,os.path.join(tmp_path,'report_of_truth.sqlite'))
+    with wg.truth_store.TruthStore(store_file) as store:
+        assert len(store) == 201
+        hits = list(store.query('energy',t0=10.2,t1=20.0,f_lo=2400.0,f_hi=2415.5))
+        assert [x['instance_name'] for x in hits] == ['e{0:d}'.format(i) for i in range(10,16)]
+        array = store.query_array('energy',t0=10.2,t1=20.0,f_lo=2400.0,f_hi=2415.5)
+        assert array['time_start'].tolist() == [float(i) for i in range(10,16)]
+    back = os.path.join(tmp_path,'back.json')
+    wg.truth_store.to_report(store_file,back)
+    with open(back,'r') as fp:
+        assert json.load(fp)['reports'] == reports
+
+def test_truth_store_readonly(tmp_path):
+    missing = os.path.join(tmp_path,'mistyped.sqlite')
+    for open_it in [lambda: wg.truth_store.TruthStore(missing,readonly=True),
+                    lambda: wg.run_modes.scripted.load_script(missing)]:
+        try:
+            open_it()
+            assert False
+        except FileNotFoundError:
+            pass
+    assert not os.path.exists(missing)
+    reports = [
+        {'instance_name':'e0','report_type':'energy','time_start':10.0,'time_stop':11.0},
+        {'instance_name':'e1','report_type':'energy','time_start':12.0,'time_stop':13.5},
+        {'instance_name':'e2','report_type':'energy','time_start':20.0,'time_stop':21.0},
+        {'instance_name':'s0','report_type':'signal','time_start':10.0,'time_stop':13.5,'energy_set':['e0','e1']},
+        {'instance_name':'s1','report_type':'signal','time_start':20.0,'time_stop':21.0,'energy_set':['e2']},
+        {'instance_name':'src','report_type':'source','device_origin':'radio0','signal_set':['s0','s1']},
+    ]
+    store_file = wg.truth_store.from_report({'reports':reports},os.path.join(tmp_path,'script.sqlite'))
+    runtime,energies,signals,sources,flags,_ = wg.run_modes.scripted.load_script(store_file)
+    assert flags == 4 and runtime == 11.0
+    ### only s0's energies were needed for its dwell/period
+    assert [x['instance_name'] for x in energies] == ['e0','e1']
+    assert signals[0]['avg_dwell'] == 1.25 and signals[0]['avg_period'] == 2.0
+    assert [x['instance_name'] for x in sources] == ['src']
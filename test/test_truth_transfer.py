@@ -0,0 +1,70 @@
+import os
+import wfgen as wg
+
+TruthTransfer = wg.truth_transfer.TruthTransfer
+receive = wg.truth_transfer.receive
+
+def test_chunked_transfer_resumes(tmp_path):
+    src = os.path.join(tmp_path,'report_of_truth.json')
+    with open(src,'wb') as fp:
+        fp.write(os.urandom(1000) + b'{"reports": []}'*5000)
+    dst = os.path.join(tmp_path,'copy.json')
+    for codec in ['none','zlib','lzma']:
+        transfer = TruthTransfer(src,codec)
+        calls = []
+        def request_chunk(offset,length):
+            calls.append(offset)
+            if len(calls) == 3 and not os.path.isfile(dst+'.resumed'):
+                open(dst+'.resumed','w').close()
+                raise RuntimeError("connection dropped")
+            return (offset,) + transfer.read_chunk(offset,length)
+        try:
+            receive(request_chunk,transfer.size,codec,dst,chunk_size=20000)
+        except RuntimeError:
+            ### picks up from what already made it to disk
+            assert os.path.getsize(dst) == 40000
+            receive(request_chunk,transfer.size,codec,dst,chunk_size=20000)
+        with open(src,'rb') as a, open(dst,'rb') as b:
+            assert a.read() == b.read()
+        os.remove(dst)
+
+class _ChunkNet(object):
+    ### stands in for ClientNet, answers truth_chunk from a TruthTransfer after any queued noise
+    def __init__(self,transfer,noise=[]):
+        self.transfer = transfer
+        self.noise    = list(noise)
+        self.replies  = []
+    def _reply(self,sid,message):
+        self.replies.append(wg.client.ClientRequests(sid,[(wg.encoder(message),)]))
+    def send(self,request):
+        _,tid,offset,length = request.get_message()
+        for sid,message in self.noise:
+            self._reply(sid,message)
+        self.noise = []
+        if tid != self.transfer.tid:
+            self._reply('srv0',['Request','failed:','bad','transfer'])
+            return 1
+        nbytes,data = self.transfer.read_chunk(int(offset),int(length))
+        self._reply('srv0',['chunk',tid,offset,"{0:d}".format(nbytes),data])
+        return 1
+    def get(self,n,force=False):
+        return [self.replies.pop(0)] if self.replies else None
+
+def test_truth_chunk_replies(tmp_path):
+    src = os.path.join(tmp_path,'report_of_truth.json')
+    with open(src,'wb') as fp:
+        fp.write(b'{"reports": []}'*100)
+    transfer = TruthTransfer(src,'zlib')
+    noise = [('srv1',['chunk',transfer.tid,'0','10','']),
+             ('srv0',['chunk','other','0','10','']),
+             ('srv0',['chunk',transfer.tid,'999','10',''])]
+    client = wg.client.Client(_ChunkNet(transfer,noise))
+    client.running = True
+    ### other servers, other transfers and late offsets are skipped
+    offset,nbytes,_ = client._truth_chunk('srv0',transfer.tid,100,50)
+    assert (offset,nbytes) == (100,50)
+    try:
+        client._truth_chunk('srv0','not-a-transfer',0,50)
+        assert False
+    except RuntimeError as e:
+        assert 'bad transfer' in str(e)